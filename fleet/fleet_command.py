@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# LPI Fleet Command
+# Version: 1.2.0
+# Last updated: 2026-10-17
+#
+# Set the mode on many devices at once (device_commands/{device_id}: mode, updated_at,
+# updated_by), e.g. force_off across a region for a power-saving event, then watch
+# each device's reported override_mode (devices/{device_id}) come back. Runs on a
+# workstation, not on the Pis.
+#
+#   python3 fleet/fleet_command.py force_off --devices lot-01,lot-02
+#   python3 fleet/fleet_command.py force_off --devices-file west.txt
+#   python3 fleet/fleet_command.py force_off --prefix west-
+#   python3 fleet/fleet_command.py force_off --where "region == west" --where "online == true"
+#   python3 fleet/fleet_command.py auto --filter override        # fleet_status.py's filters
+#   python3 fleet/fleet_command.py force_off --prefix west- --dry-run
+#
+# Selection: an explicit list, a device-id prefix (devices collection listed with an
+# empty field mask), or a runQuery on the devices collection (--where, ANDed; values
+# are JSON where they parse: true, 3, "x"; bare words are strings).
+#
+# Writes: documents:commit batches of BATCH_SIZE masked updates (Firestore allows 500
+# writes per commit), CONCURRENCY commits in flight on firestore_client's pooled
+# session. 429/5xx are retried with backoff (Retry-After honoured), like
+# firestore_client._post. A commit is atomic, so one bad write fails its whole batch:
+# a batch rejected outright (400/403/404/409) is retried one write at a time, like
+# outbox.py does, and only the rejected devices fail.
+#
+# Watch: devices docs are re-read (documents:batchGet, masked) every POLL_SECONDS
+# until every written device reports the new mode or WATCH_SECONDS pass. A device
+# counts as applied when its doc shows override_mode == mode with an updateTime after
+# the commit; apply latency = that updateTime - the commit's commitTime (both server
+# clocks). The doc may have been written again before the poll saw it, so a latency
+# is an upper bound within one poll interval.
+#
+# Credentials: --key / GOOGLE_APPLICATION_CREDENTIALS, or FIRESTORE_EMULATOR_HOST
+# for a local stand-in (tools/firestore_standin.py).
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import fleet_status
+
+import firestore_client  # pi/pi_monitor_test, on sys.path via fleet_status
+
+COMMANDS_COLLECTION = "device_commands"
+DEVICES_COLLECTION = fleet_status.COLLECTION
+VALID_MODES = ("auto", "force_on", "force_off")
+
+BATCH_SIZE = 100
+MAX_BATCH_SIZE = 500
+CONCURRENCY = 8
+POLL_SECONDS = 5.0
+WATCH_SECONDS = 300.0
+PERMANENT_STATUSES = (400, 403, 404, 409)   # as outbox.py: retrying the same batch can't help
+
+WHERE_OPS = {"==": "EQUAL", "!=": "NOT_EQUAL", "<": "LESS_THAN", "<=": "LESS_THAN_OR_EQUAL",
+             ">": "GREATER_THAN", ">=": "GREATER_THAN_OR_EQUAL"}
+WHERE_RE = re.compile(r"^\s*([\w.]+)\s*(==|!=|<=|>=|<|>)\s*(.+?)\s*$")
+
+
+# ---------------- Selection ----------------
+def parse_where(expr: str):
+    m = WHERE_RE.match(expr)
+    if not m:
+        raise ValueError(f"bad --where {expr!r}: expected 'field op value' with op one of {' '.join(WHERE_OPS)}")
+    path, op, raw = m.groups()
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        value = raw
+    return path, WHERE_OPS[op], value
+
+
+def select(args) -> list:
+    """Sorted, de-duplicated device ids for the selector in args."""
+    if args.devices:
+        ids = [d.strip() for d in args.devices.split(",")]
+    elif args.devices_file:
+        with open(args.devices_file, "r") as f:
+            ids = [line.split("#", 1)[0].strip() for line in f]
+    elif args.prefix is not None:
+        ids = [firestore_client.doc_id_of(d["name"])
+               for d in firestore_client.list_documents(DEVICES_COLLECTION, mask=[])]
+        ids = [d for d in ids if d.startswith(args.prefix)]
+    else:
+        triples = [parse_where(w) for w in args.where] if args.where else fleet_status.FILTERS[args.filter]
+        filters = [firestore_client.field_filter(*t) for t in triples]
+        ids = [firestore_client.doc_id_of(d["name"])
+               for d in firestore_client.run_query(DEVICES_COLLECTION, filters)]
+    return sorted({d for d in ids if d})
+
+
+# ---------------- Writes ----------------
+def command_write(device_id: str, mode: str, updated_at: str, updated_by: str) -> dict:
+    return {
+        "update": {
+            "name": firestore_client.document_name(COMMANDS_COLLECTION, device_id),
+            "fields": {
+                "mode": {"stringValue": mode},
+                "updated_at": {"stringValue": updated_at},
+                "updated_by": {"stringValue": updated_by},
+            },
+        },
+        "updateMask": {"fieldPaths": ["mode", "updated_at", "updated_by"]},
+    }
+
+
+def commit_batch(device_ids, mode: str, updated_by: str) -> dict:
+    """
+    One documents:commit for device_ids. Returns {"ok", "commit_time", "error", "status",
+    "attempts", "ms"}; status is the last HTTP status (None if no response).
+    """
+    updated_at = datetime.now(timezone.utc).isoformat()
+    writes = [command_write(d, mode, updated_at, updated_by) for d in device_ids]
+    t0 = time.perf_counter()
+    error = status = None
+    for attempt in range(firestore_client.MAX_RETRIES + 1):
+        try:
+            r = firestore_client.commit(writes, timeout=30)
+        except Exception as e:
+            error, status = f"{type(e).__name__}: {e}", None
+            time.sleep(firestore_client.BACKOFF_FACTOR * (2 ** attempt))
+            continue
+        status = r.status_code
+        if 200 <= r.status_code < 300:
+            body = r.json()
+            return {"ok": True, "commit_time": body.get("commitTime"), "error": None, "status": status,
+                    "attempts": attempt + 1, "ms": (time.perf_counter() - t0) * 1000}
+        try:
+            error = f"HTTP {r.status_code}: {r.json().get('error', {}).get('message', '')}".strip()
+        except Exception:
+            error = f"HTTP {r.status_code}"
+        if r.status_code not in firestore_client.RETRY_STATUSES:
+            break
+        retry_after = r.headers.get("Retry-After", "")
+        time.sleep(float(retry_after) if retry_after.isdigit() else firestore_client.BACKOFF_FACTOR * (2 ** attempt))
+    return {"ok": False, "commit_time": None, "error": error, "status": status, "attempts": attempt + 1,
+            "ms": (time.perf_counter() - t0) * 1000}
+
+
+def fan_out(device_ids, mode: str, updated_by: str, batch_size: int, pool) -> dict:
+    """Write mode to every device in batches; returns {device_id: result of its commit}."""
+    batches = [device_ids[i:i + batch_size] for i in range(0, len(device_ids), batch_size)]
+    results = {}
+    split = []
+    for batch, r in zip(batches, pool.map(lambda b: commit_batch(b, mode, updated_by), batches)):
+        if not r["ok"] and r["status"] in PERMANENT_STATUSES and len(batch) > 1:
+            split += batch      # find the bad write(s) instead of failing the whole batch
+            continue
+        for d in batch:
+            results[d] = r
+    for d, r in zip(split, pool.map(lambda d: commit_batch([d], mode, updated_by), split)):
+        results[d] = r
+    return results
+
+
+# ---------------- Watch ----------------
+def watch(written: dict, mode: str, pool, poll_seconds: float, watch_seconds: float, out=print) -> dict:
+    """
+    written: {device_id: commit epoch}. Poll devices docs until each reports mode.
+    Returns {device_id: apply latency in seconds}.
+    """
+    applied = {}
+    deadline = time.monotonic() + watch_seconds
+    while True:
+        pending = [d for d in written if d not in applied]
+        names = [firestore_client.document_name(DEVICES_COLLECTION, d) for d in pending]
+        chunks = [names[i:i + 100] for i in range(0, len(names), 100)]
+        fetch = lambda chunk: list(firestore_client.batch_get(chunk, mask=["override_mode"]))  # noqa: E731
+        for docs in pool.map(fetch, chunks):
+            for doc in docs:
+                device = firestore_client.doc_id_of(doc["name"])
+                reported = firestore_client.from_firestore_fields(doc).get("override_mode")
+                updated = firestore_client.timestamp_epoch(doc["updateTime"]) if doc.get("updateTime") else 0.0
+                if reported == mode and updated > written[device]:
+                    applied[device] = updated - written[device]
+        left = len(written) - len(applied)
+        out(f"   watch: {len(applied)}/{len(written)} applied" + (f", {left} pending" if left else ""))
+        if not left or time.monotonic() + poll_seconds > deadline:
+            return applied
+        time.sleep(poll_seconds)
+
+
+def percentiles(values) -> dict:
+    s = sorted(values)
+    n = len(s)
+    if not n:
+        return {"n": 0}
+    pick = lambda q: round(s[min(n - 1, int(n * q))], 2)  # noqa: E731
+    return {"n": n, "p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99), "max": round(s[-1], 2)}
+
+
+def print_report(report: dict) -> None:
+    print()
+    print(f"{'device_id':<24} {'write':<8} {'applied':<8} {'latency_s':>9}  error")
+    for d in report["devices"]:
+        latency = f"{d['apply_s']:.1f}" if d["apply_s"] is not None else "-"
+        print(f"{d['device_id']:<24} {'ok' if d['written'] else 'FAILED':<8} "
+              f"{'yes' if d['applied'] else ('-' if not d['written'] else 'no'):<8} {latency:>9}  {d['error'] or ''}")
+    s = report["summary"]
+    print()
+    print(f"Selected {s['selected']}, written {s['written']} in {s['commits']} commits "
+          f"({s['write_ms']:.0f} ms), failed {s['write_failed']}")
+    if s["watched"]:
+        p = s["apply_s"]
+        print(f"Applied {s['applied']}/{s['written']}"
+              + (f": p50 {p['p50']:.1f} s, p90 {p['p90']:.1f} s, p99 {p['p99']:.1f} s, max {p['max']:.1f} s"
+                 if p["n"] else ""))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="LPI fleet command fan-out")
+    ap.add_argument("mode", choices=VALID_MODES)
+    sel = ap.add_mutually_exclusive_group(required=True)
+    sel.add_argument("--devices", help="comma-separated device ids")
+    sel.add_argument("--devices-file", help="file with one device id per line (# comments)")
+    sel.add_argument("--prefix", help="every device whose id starts with this")
+    sel.add_argument("--where", action="append", help="devices field filter, e.g. 'region == west' (repeat to AND)")
+    sel.add_argument("--filter", choices=sorted(fleet_status.FILTERS), help="a fleet_status.py filter")
+    ap.add_argument("--by", default="fleet_command", help="updated_by value (default fleet_command)")
+    ap.add_argument("--batch", type=int, default=BATCH_SIZE, help=f"writes per commit (max {MAX_BATCH_SIZE})")
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY, help="commits / reads in flight")
+    ap.add_argument("--poll", type=float, default=POLL_SECONDS, help="watch poll interval, seconds")
+    ap.add_argument("--watch-timeout", type=float, default=WATCH_SECONDS, help="give up watching after this")
+    ap.add_argument("--no-watch", action="store_true", help="write only, don't wait for devices to report")
+    ap.add_argument("--dry-run", action="store_true", help="print the selection, write nothing")
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    ap.add_argument("--key", default=os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", ""),
+                    help="service account key file")
+    args = ap.parse_args()
+    if not 1 <= args.batch <= MAX_BATCH_SIZE:
+        ap.error(f"--batch must be 1..{MAX_BATCH_SIZE}")
+
+    fleet_status.configure(args.key)
+    if not firestore_client.has_credentials():
+        print("❌ Missing service account file:", firestore_client.SERVICE_ACCOUNT_FILE)
+        return 1
+    # Before the session exists: one pooled connection per worker
+    firestore_client.POOL_SIZE = max(firestore_client.POOL_SIZE, args.concurrency)
+    log = (lambda *a: print(*a, file=sys.stderr)) if args.json else print
+
+    try:
+        device_ids = select(args)
+    except ValueError as e:
+        print("❌", e)
+        return 2
+    if not device_ids:
+        print("❌ No devices matched")
+        return 1
+    if args.dry_run:
+        print("\n".join(device_ids))
+        print(f"{len(device_ids)} devices would be set to {args.mode}")
+        return 0
+
+    log(f"Setting {args.mode} on {len(device_ids)} devices "
+        f"({args.batch} per commit, {args.concurrency} in flight)")
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        t0 = time.perf_counter()
+        results = fan_out(device_ids, args.mode, args.by, args.batch, pool)
+        write_ms = (time.perf_counter() - t0) * 1000
+        written = {d: firestore_client.timestamp_epoch(r["commit_time"]) if r["commit_time"] else time.time()
+                   for d, r in results.items() if r["ok"]}
+        failed = len(device_ids) - len(written)
+        log(("✅" if not failed else "❌") + f" Written {len(written)}/{len(device_ids)} in {write_ms:.0f} ms")
+        applied = {}
+        if written and not args.no_watch:
+            applied = watch(written, args.mode, pool, args.poll, args.watch_timeout, out=log)
+
+    report = {
+        "mode": args.mode,
+        "devices": [{
+            "device_id": d,
+            "written": results[d]["ok"],
+            "applied": d in applied,
+            "apply_s": round(applied[d], 3) if d in applied else None,
+            "error": results[d]["error"],
+        } for d in device_ids],
+        "summary": {
+            "selected": len(device_ids),
+            "written": len(written),
+            "write_failed": failed,
+            "commits": len({id(r) for r in results.values()}),
+            "write_ms": round(write_ms, 1),
+            "watched": bool(written) and not args.no_watch,
+            "applied": len(applied),
+            "apply_s": percentiles(applied.values()),
+        },
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    if failed:
+        return 1
+    if report["summary"]["watched"] and len(applied) < len(written):
+        log(f"WARN: {len(written) - len(applied)} devices didn't report {args.mode} "
+            f"within {args.watch_timeout:.0f} s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
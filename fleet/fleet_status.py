@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# LPI Fleet Status
+# Version: 1.0.0
+# Last updated: 2026-10-17
+#
+# Fleet-side reader for the devices/{device_id} documents written by
+# firestore_upload_status.py. Runs on a workstation, not on the Pis.
+#
+#   python3 fleet/fleet_status.py                       # whole fleet, incremental refresh
+#   python3 fleet/fleet_status.py --filter offline      # online == false        (runQuery)
+#   python3 fleet/fleet_status.py --filter timer_failed # timer_ok == false      (runQuery)
+#   python3 fleet/fleet_status.py --filter override     # override_mode != auto  (runQuery)
+#   python3 fleet/fleet_status.py --full --json
+#
+# Whole-fleet refresh is incremental: list the collection with an empty field mask
+# (names + updateTime only), then documents:batchGet just the devices whose
+# updateTime moved since the local cache (FLEET_CACHE_PATH). Filtered views use
+# runQuery server-side and are merged into the same cache.
+#
+# Credentials: --key / GOOGLE_APPLICATION_CREDENTIALS, or FIRESTORE_EMULATOR_HOST
+# for a local stand-in.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "pi", "pi_monitor_test"))
+
+import firestore_client  # noqa: E402
+import token_cache  # noqa: E402
+
+COLLECTION = "devices"
+FLEET_CACHE_PATH = os.path.expanduser("~/.cache/lpi/fleet_devices.json")
+TOKEN_CACHE_PATH = os.path.expanduser("~/.cache/lpi/token_cache.json")
+
+FILTERS = {
+    "offline": [("online", "EQUAL", False)],
+    "timer_failed": [("timer_ok", "EQUAL", False)],
+    "override": [("override_mode", "NOT_EQUAL", "auto")],
+}
+
+COLUMNS = ("device_id", "online", "timer_ok", "override_mode", "last_updated")
+
+
+def configure(key_file: str) -> None:
+    """Point the device-side client at workstation credentials and cache paths."""
+    os.makedirs(os.path.dirname(TOKEN_CACHE_PATH), exist_ok=True)
+    if key_file:
+        firestore_client.SERVICE_ACCOUNT_FILE = key_file
+    token_cache.TOKEN_CACHE_FILE = TOKEN_CACHE_PATH
+    token_cache.LOCK_FILE = TOKEN_CACHE_PATH + ".lock"
+
+
+def load_cache() -> dict:
+    try:
+        with open(FLEET_CACHE_PATH, "r") as f:
+            return json.load(f) or {"devices": {}}
+    except Exception:
+        return {"devices": {}}
+
+
+def save_cache(cache: dict) -> None:
+    os.makedirs(os.path.dirname(FLEET_CACHE_PATH), exist_ok=True)
+    tmp = FLEET_CACHE_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp, FLEET_CACHE_PATH)
+
+
+def _store(cache: dict, doc: dict) -> str:
+    device = firestore_client.doc_id_of(doc["name"])
+    cache["devices"][device] = {
+        "name": doc["name"],
+        "updateTime": doc.get("updateTime"),
+        "fields": firestore_client.from_firestore_fields(doc),
+    }
+    return device
+
+
+def refresh_all(cache: dict, full: bool = False) -> dict:
+    """Bring the cache up to date with the whole collection. Returns timing/count stats."""
+    stats = {}
+    t0 = time.perf_counter()
+    listing = {d["name"]: d.get("updateTime") for d in firestore_client.list_documents(COLLECTION, mask=[])}
+    stats["list_ms"] = (time.perf_counter() - t0) * 1000
+    stats["listed"] = len(listing)
+
+    known = {v["name"]: v.get("updateTime") for v in cache["devices"].values()}
+    stale = [n for n, ut in listing.items() if full or known.get(n) != ut]
+
+    t0 = time.perf_counter()
+    for doc in firestore_client.batch_get(stale):
+        _store(cache, doc)
+    stats["batch_get_ms"] = (time.perf_counter() - t0) * 1000
+    stats["fetched"] = len(stale)
+
+    # Devices deleted upstream
+    gone = [k for k, v in cache["devices"].items() if v["name"] not in listing]
+    for k in gone:
+        del cache["devices"][k]
+    stats["removed"] = len(gone)
+    return stats
+
+
+def query(cache: dict, filter_name: str):
+    """Run a named server-side filter; returns (device ids, stats). Results are merged into the cache."""
+    filters = [firestore_client.field_filter(*f) for f in FILTERS[filter_name]]
+    t0 = time.perf_counter()
+    ids = [_store(cache, doc) for doc in firestore_client.run_query(COLLECTION, filters)]
+    return ids, {"query_ms": (time.perf_counter() - t0) * 1000, "matched": len(ids)}
+
+
+def print_table(rows) -> None:
+    widths = [max([len(c)] + [len(str(r.get(c))) for r in rows]) for c in COLUMNS]
+    print("  ".join(c.ljust(w) for c, w in zip(COLUMNS, widths)))
+    for r in rows:
+        print("  ".join(str(r.get(c)).ljust(w) for c, w in zip(COLUMNS, widths)))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="LPI fleet status reader")
+    ap.add_argument("--filter", choices=sorted(FILTERS), help="server-side filter (runQuery)")
+    ap.add_argument("--full", action="store_true", help="re-fetch every document, ignoring the cache")
+    ap.add_argument("--cached", action="store_true", help="print the local cache without fetching")
+    ap.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    ap.add_argument("--key", default=os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", ""),
+                    help="service account key file")
+    args = ap.parse_args()
+
+    configure(args.key)
+    if not firestore_client.has_credentials():
+        print("❌ Missing service account file:", firestore_client.SERVICE_ACCOUNT_FILE)
+        return 1
+
+    cache = load_cache()
+    t0 = time.perf_counter()
+    stats = {}
+
+    if args.filter:
+        ids, stats = query(cache, args.filter)
+        rows = [cache["devices"][i]["fields"] for i in ids]
+    else:
+        if not args.cached:
+            stats = refresh_all(cache, full=args.full)
+        rows = [v["fields"] for _, v in sorted(cache["devices"].items())]
+
+    stats["total_ms"] = (time.perf_counter() - t0) * 1000
+    if not args.cached:
+        cache["refreshed_at"] = time.time()
+        save_cache(cache)
+
+    if args.json:
+        print(json.dumps({"devices": rows, "stats": stats}, indent=2))
+    else:
+        print_table(rows)
+        print()
+        print("fetch:", ", ".join(f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}" for k, v in stats.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+# LPI Solar Batch
+# Version: 1.1.0
+# Last updated: 2026-10-17
+#
+# Fleet planning: sunset / light-on / light-off for many sites x many dates in one
+# vectorized NumPy pass, instead of one astral.sun.sun() call per (site, date).
+# Runs on a workstation, not on the Pis.
+#
+#   python3 fleet/solar_batch.py --sites sites.csv --start 2026-11-01 --days 180 --csv plan.csv
+#   python3 fleet/solar_batch.py --sites sites.csv --days 731 --tables out/      # per-device tables
+#   python3 fleet/solar_batch.py --sites sites.csv --npz plan.npz --validate 2000
+#
+# sites.csv columns: device_id,name,timezone,latitude,longitude
+#
+# The math is astral 3's (NOAA) sunset: same constants, same refraction at the
+# horizon, same two-pass transit iteration and the same "sunset fell on the wrong
+# local date -> retry the neighbouring date" rule, so results agree with astral to
+# well under a second (--validate checks a random sample). Local times follow
+# timer.py exactly:
+#   lighton  = sunset + on_offset (default -1 h)
+#   lightoff = safe_localize(LIGHT_OFF_HOUR on the next day): an ambiguous wall
+#              time takes the later occurrence, a nonexistent one is pushed +1 h
+# UTC offsets come from each zone's pytz transition table (searchsorted), so the
+# whole plan stays vectorized. Sites without a sunset on a date (polar day/night)
+# get schedule_table.MISSING, like the on-device table.
+#
+# Output:
+#   --csv     one row per (device, date), local ISO times
+#   --npz     columnar arrays (device_id, date ordinal, *_us since the UTC epoch)
+#   --parquet same columns as --npz (needs pyarrow)
+#   --tables  lpi_schedule_<device_id>.bin per site, in schedule_table.py's format
+#             (install as /home/pi/lpi_schedule.bin on that device; its fingerprint
+#             covers timezone/latitude/longitude/off-hour only, so name is free-form)
+
+import argparse
+import csv
+import datetime
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pytz
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "pi"))
+
+import schedule_table  # noqa: E402
+import timer  # noqa: E402
+
+MISSING = schedule_table.MISSING
+US_PER_MIN = 60_000_000
+US_PER_DAY = 86_400_000_000
+UNIX_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+JD_AT_ORDINAL_0 = 1721424.5          # julianday(date) == date.toordinal() + this
+VALIDATE_TOLERANCE_S = 1.0
+
+# astral.sun.sunset(): zenith 90 + apparent radius, plus refraction at that zenith
+SUN_APPARENT_RADIUS = 32.0 / (60.0 * 2.0)
+
+
+def _refraction_at_zenith(zenith: float) -> float:
+    """astral.refraction_at_zenith (scalar; the sunset zenith is a constant)."""
+    elevation = 90 - zenith
+    if elevation >= 85.0:
+        return 0.0
+    te = math.tan(math.radians(elevation))
+    if elevation > 5.0:
+        r = 58.1 / te - 0.07 / te ** 3 + 0.000086 / te ** 5
+    elif elevation > -0.575:
+        r = 1735.0 + elevation * (-518.2 + elevation * (103.4 + elevation * (-12.79 + elevation * 0.711)))
+    else:
+        r = -20.774 / te
+    return r / 3600.0
+
+
+SUNSET_ZENITH = 90.0 + SUN_APPARENT_RADIUS + _refraction_at_zenith(90.0 + SUN_APPARENT_RADIUS)
+
+
+# ---------------- Solar position (vectorized astral.sun) ----------------
+def _sun_terms(jc):
+    """(declination deg, equation of time min) for Julian centuries jc."""
+    l0 = (280.46646 + jc * (36000.76983 + 0.0003032 * jc)) % 360.0
+    m = 357.52911 + jc * (35999.05029 - 0.0001537 * jc)
+    e = 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+    mrad = np.radians(m)
+    c = (np.sin(mrad) * (1.914602 - jc * (0.004817 + 0.000014 * jc))
+         + np.sin(2 * mrad) * (0.019993 - 0.000101 * jc)
+         + np.sin(3 * mrad) * 0.000289)
+    omega = np.radians(125.04 - 1934.136 * jc)
+    apparent_long = l0 + c - 0.00569 - 0.00478 * np.sin(omega)
+    seconds = 21.448 - jc * (46.815 + jc * (0.00059 - jc * 0.001813))
+    obliquity = 23.0 + (26.0 + seconds / 60.0) / 60.0 + 0.00256 * np.cos(omega)
+
+    declination = np.degrees(np.arcsin(np.sin(np.radians(obliquity)) * np.sin(np.radians(apparent_long))))
+
+    y = np.tan(np.radians(obliquity) / 2.0) ** 2
+    l0r = np.radians(l0)
+    eqtime = 4.0 * np.degrees(
+        y * np.sin(2 * l0r)
+        - 2.0 * e * np.sin(mrad)
+        + 4.0 * e * y * np.sin(mrad) * np.cos(2 * l0r)
+        - 0.5 * y * y * np.sin(4 * l0r)
+        - 1.25 * e * e * np.sin(2 * mrad)
+    )
+    return declination, eqtime
+
+
+def _sunset_minutes(lat, lon, ordinals):
+    """astral.sun.time_of_transit(SETTING): minutes after 00:00 UTC of each date (NaN = no sunset)."""
+    lat_r = np.radians(np.clip(lat, -89.8, 89.8))
+    jd = ordinals + JD_AT_ORDINAL_0
+    adjustment = 0.0
+    time_utc = None
+    for _ in range(2):
+        declination, eqtime = _sun_terms((jd + adjustment - 2451545.0) / 36525.0)
+        dec_r = np.radians(declination)
+        h = (math.cos(math.radians(SUNSET_ZENITH)) - np.sin(lat_r) * np.sin(dec_r)) / (np.cos(lat_r) * np.cos(dec_r))
+        with np.errstate(invalid="ignore"):
+            hour_angle = -np.arccos(h)
+        offset = (-lon - np.degrees(hour_angle)) * 4.0 - eqtime
+        offset = np.where(offset < -720.0, offset + 1440.0, offset)
+        time_utc = 720.0 + offset
+        adjustment = time_utc / 1440.0
+    return time_utc
+
+
+def _to_us(ordinals, minutes):
+    """UTC epoch microseconds for minutes after midnight UTC of each date; MISSING where NaN."""
+    ok = ~np.isnan(minutes)
+    day_us = (ordinals - UNIX_EPOCH_ORDINAL).astype(np.int64) * US_PER_DAY
+    us = day_us + np.floor(np.where(ok, minutes, 0.0) * US_PER_MIN).astype(np.int64)
+    return np.where(ok, us, MISSING)
+
+
+# ---------------- Time zones (vectorized pytz) ----------------
+def _offset_table(tz):
+    """(transition instants us, utcoffset us) for a pytz zone."""
+    trans = getattr(tz, "_utc_transition_times", None)
+    if not trans:
+        off = tz.utcoffset(datetime.datetime(2000, 1, 1))
+        return np.array([np.iinfo(np.int64).min], dtype=np.int64), np.array([off // datetime.timedelta(microseconds=1)], dtype=np.int64)
+    epoch = datetime.datetime(1970, 1, 1)
+    starts = np.array([(t - epoch) // datetime.timedelta(microseconds=1) for t in trans], dtype=np.int64)
+    starts[0] = np.iinfo(np.int64).min
+    offs = np.array([info[0] // datetime.timedelta(microseconds=1) for info in tz._transition_info], dtype=np.int64)
+    return starts, offs
+
+
+def _offset_at(table, utc_us):
+    starts, offs = table
+    return offs[np.searchsorted(starts, utc_us, side="right") - 1]
+
+
+def _localize_wall(table, wall_us):
+    """
+    safe_localize() for local wall times (us since the epoch, as if UTC) -> UTC us.
+    Ambiguous: the later occurrence. Nonexistent: wall + 1 h.
+    """
+    def candidates(wall):
+        before = wall - _offset_at(table, wall - US_PER_DAY)
+        after = wall - _offset_at(table, wall + US_PER_DAY)
+        ok_before = wall - _offset_at(table, before) == before
+        ok_after = wall - _offset_at(table, after) == after
+        return before, after, ok_before, ok_after
+
+    before, after, ok_before, ok_after = candidates(wall_us)
+    utc = np.where(ok_after, after, before)
+    utc = np.where(ok_before & ok_after, np.maximum(before, after), utc)
+
+    gap = ~(ok_before | ok_after)
+    if gap.any():
+        b2, a2, okb2, oka2 = candidates(wall_us + 3_600_000_000)
+        utc = np.where(gap, np.where(oka2, a2, b2), utc)
+    return utc
+
+
+def _local_ordinal(table, utc_us):
+    return np.floor_divide(utc_us + _offset_at(table, utc_us), US_PER_DAY) + UNIX_EPOCH_ORDINAL
+
+
+# ---------------- Plans ----------------
+def plan(cities, start: datetime.date, days: int,
+         light_off_hour: int = timer.LIGHT_OFF_HOUR, on_offset_minutes: int = -60) -> dict:
+    """
+    Schedule for every city x date (sunset-reference dates start .. start+days-1).
+    Returns int64 arrays shaped (len(cities), days), UTC epoch microseconds:
+      sunset_us, lighton_us, lightoff_us   (MISSING where there is no sunset)
+    plus "ordinals" (days,).
+    """
+    ordinals = np.arange(start.toordinal(), start.toordinal() + days, dtype=np.int64)
+    n = len(cities)
+    sunset = np.full((n, days), MISSING, dtype=np.int64)
+    lightoff = np.empty((n, days), dtype=np.int64)
+
+    by_tz = {}
+    for i, c in enumerate(cities):
+        by_tz.setdefault(c.timezone, []).append(i)
+
+    off_wall = (ordinals + 1 - UNIX_EPOCH_ORDINAL) * US_PER_DAY + light_off_hour * 3_600_000_000
+    for tz_name, rows in by_tz.items():
+        table = _offset_table(pytz.timezone(tz_name))
+        lat = np.array([cities[i].latitude for i in rows], dtype=np.float64)[:, None]
+        lon = np.array([cities[i].longitude for i in rows], dtype=np.float64)[:, None]
+        ords = np.broadcast_to(ordinals, (len(rows), days))
+
+        us = _to_us(ords, _sunset_minutes(lat, lon, ords))
+        # astral: a sunset that lands on another local date is retried on the neighbour date
+        have = us != MISSING
+        local = np.where(have, _local_ordinal(table, np.where(have, us, 0)), ords)
+        wrong = have & (local != ords)
+        if wrong.any():
+            retry = np.where(local < ords, ords + 1, ords - 1)
+            us2 = _to_us(retry, _sunset_minutes(lat, lon, retry))
+            have2 = us2 != MISSING
+            ok2 = have2 & (_local_ordinal(table, np.where(have2, us2, 0)) == ords)
+            us = np.where(wrong, np.where(ok2, us2, MISSING), us)
+
+        sunset[rows] = us
+        lightoff[rows] = _localize_wall(table, off_wall)[None, :]
+
+    have = sunset != MISSING
+    return {
+        "ordinals": ordinals,
+        "sunset_us": sunset,
+        "lighton_us": np.where(have, sunset + on_offset_minutes * US_PER_MIN, MISSING),
+        "lightoff_us": np.where(have, lightoff, MISSING),
+    }
+
+
+def validate(cities, result: dict, light_off_hour: int, samples: int, seed: int = 0) -> dict:
+    """Compare random (city, date) cells against astral via schedule_table.compute_day."""
+    rng = random.Random(seed)
+    ordinals = result["ordinals"]
+    worst = {"sunset_s": 0.0, "lightoff_s": 0.0}
+    mismatched_missing = 0
+    examples = []
+    for _ in range(samples):
+        i = rng.randrange(len(cities))
+        j = rng.randrange(len(ordinals))
+        c = cities[i]
+        tz = pytz.timezone(c.timezone)
+        d = datetime.date.fromordinal(int(ordinals[j]))
+        try:
+            ss, off = schedule_table.compute_day(c, light_off_hour, d, tz, timer.safe_localize)
+        except ValueError:
+            ss = off = None
+        got_ss = int(result["sunset_us"][i, j])
+        if ss is None or got_ss == MISSING:
+            if (ss is None) != (got_ss == MISSING):
+                mismatched_missing += 1
+                examples.append({"city": c.name, "date": d.isoformat(), "astral": ss and ss.isoformat(), "batch": got_ss})
+            continue
+        ds = abs(got_ss - schedule_table._to_us(ss)) / 1e6
+        do = abs(int(result["lightoff_us"][i, j]) - schedule_table._to_us(off)) / 1e6
+        if max(ds, do) > VALIDATE_TOLERANCE_S and len(examples) < 5:
+            examples.append({"city": c.name, "date": d.isoformat(), "sunset_err_s": ds, "lightoff_err_s": do})
+        worst["sunset_s"] = max(worst["sunset_s"], ds)
+        worst["lightoff_s"] = max(worst["lightoff_s"], do)
+    return {
+        "samples": samples,
+        "max_sunset_error_s": worst["sunset_s"],
+        "max_lightoff_error_s": worst["lightoff_s"],
+        "missing_mismatches": mismatched_missing,
+        "examples": examples,
+        "ok": max(worst.values()) <= VALIDATE_TOLERANCE_S and mismatched_missing == 0,
+    }
+
+
+# ---------------- Sites + output ----------------
+def load_sites(path: str):
+    """[(device_id, timer.City)] from a CSV with device_id,name,timezone,latitude,longitude."""
+    sites = []
+    with open(path, "r", newline="") as f:
+        for row in csv.DictReader(f):
+            pytz.timezone(row["timezone"])
+            sites.append((row["device_id"], timer.City(
+                row.get("name") or row["device_id"], row.get("region", ""), row["timezone"],
+                float(row["latitude"]), float(row["longitude"]),
+            )))
+    if not sites:
+        raise ValueError(f"{path}: no sites")
+    return sites
+
+
+def _iso_local(us_row, tz_name: str):
+    """Local ISO strings for a row of UTC epoch us (empty for MISSING)."""
+    table = _offset_table(pytz.timezone(tz_name))
+    have = us_row != MISSING
+    safe = np.where(have, us_row, 0)
+    off = _offset_at(table, safe)
+    wall = (safe + off).astype("datetime64[us]").astype("datetime64[s]")
+    text = np.datetime_as_string(wall, unit="s")
+    out = []
+    for ok, t, o in zip(have, text, off):
+        if not ok:
+            out.append("")
+            continue
+        mins = int(o) // US_PER_MIN
+        sign = "+" if mins >= 0 else "-"
+        out.append(f"{t}{sign}{abs(mins) // 60:02d}:{abs(mins) % 60:02d}")
+    return out
+
+
+def write_csv(path: str, sites, result: dict) -> int:
+    dates = [datetime.date.fromordinal(int(o)).isoformat() for o in result["ordinals"]]
+    n = 0
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["device_id", "date", "sunset", "lighton", "lightoff"])
+        for i, (device_id, c) in enumerate(sites):
+            cols = [_iso_local(result[k][i], c.timezone) for k in ("sunset_us", "lighton_us", "lightoff_us")]
+            for row in zip(dates, *cols):
+                w.writerow((device_id,) + row)
+                n += 1
+    return n
+
+
+def _columns(sites, result: dict) -> dict:
+    n, days = result["sunset_us"].shape
+    return {
+        "device_id": np.repeat(np.array([s[0] for s in sites]), days),
+        "date_ordinal": np.tile(result["ordinals"], n),
+        "sunset_us": result["sunset_us"].ravel(),
+        "lighton_us": result["lighton_us"].ravel(),
+        "lightoff_us": result["lightoff_us"].ravel(),
+    }
+
+
+def write_npz(path: str, sites, result: dict) -> None:
+    np.savez_compressed(path, **_columns(sites, result))
+
+
+def write_parquet(path: str, sites, result: dict) -> None:
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("--parquet needs pyarrow (pip install pyarrow); --npz has the same columns")
+    cols = _columns(sites, result)
+    pyarrow.parquet.write_table(pyarrow.table({k: pyarrow.array(v) for k, v in cols.items()}), path)
+
+
+def write_tables(out_dir: str, sites, result: dict, light_off_hour: int) -> list:
+    os.makedirs(out_dir, exist_ok=True)
+    start = datetime.date.fromordinal(int(result["ordinals"][0]))
+    days = len(result["ordinals"])
+    paths = []
+    for i, (device_id, c) in enumerate(sites):
+        have = result["sunset_us"][i] != MISSING
+        rows = np.stack([result["sunset_us"][i], np.where(have, result["lightoff_us"][i], MISSING)], axis=1)
+        path = os.path.join(out_dir, f"lpi_schedule_{device_id}.bin")
+        schedule_table.write(path, c, light_off_hour, start, days, rows.astype("<i8").tobytes())
+        paths.append(path)
+    return paths
+
+
+def main():
+    ap = argparse.ArgumentParser(description="LPI vectorized fleet solar schedule")
+    ap.add_argument("--sites", required=True, help="CSV: device_id,name,timezone,latitude,longitude")
+    ap.add_argument("--start", default=datetime.date.today().isoformat(), help="first date (YYYY-MM-DD)")
+    ap.add_argument("--days", type=int, default=365)
+    ap.add_argument("--light-off-hour", type=int, default=timer.LIGHT_OFF_HOUR)
+    ap.add_argument("--on-offset-minutes", type=int, default=-60)
+    ap.add_argument("--csv", help="write one row per (device, date)")
+    ap.add_argument("--npz", help="write columnar arrays (numpy .npz)")
+    ap.add_argument("--parquet", help="write columnar arrays (needs pyarrow)")
+    ap.add_argument("--tables", help="directory for per-device schedule tables")
+    ap.add_argument("--validate", type=int, default=0, metavar="N", help="check N random cells against astral")
+    args = ap.parse_args()
+
+    sites = load_sites(args.sites)
+    cities = [c for _, c in sites]
+    start = datetime.date.fromisoformat(args.start)
+
+    t0 = time.perf_counter()
+    result = plan(cities, start, args.days, args.light_off_hour, args.on_offset_minutes)
+    elapsed = time.perf_counter() - t0
+    cells = len(cities) * args.days
+    missing = int((result["sunset_us"] == MISSING).sum())
+    print(f"✅ {len(cities)} sites x {args.days} days = {cells} schedules in {elapsed * 1000:.1f} ms"
+          f" ({cells / elapsed:,.0f}/s){f', {missing} without sunset' if missing else ''}")
+
+    rc = 0
+    if args.validate:
+        t0 = time.perf_counter()
+        v = validate(cities, result, args.light_off_hour, args.validate)
+        astral_s = time.perf_counter() - t0
+        mark = "✅" if v["ok"] else "❌"
+        print(f"{mark} vs astral ({v['samples']} samples, {astral_s / v['samples'] * 1e6:.0f} us each):"
+              f" max sunset error {v['max_sunset_error_s']:.3f} s,"
+              f" max lightoff error {v['max_lightoff_error_s']:.3f} s,"
+              f" polar mismatches {v['missing_mismatches']}")
+        for ex in v["examples"]:
+            print("     ", ex)
+        if not v["ok"]:
+            rc = 1
+
+    if args.csv:
+        print("CSV:", args.csv, f"({write_csv(args.csv, sites, result)} rows)")
+    if args.npz:
+        write_npz(args.npz, sites, result)
+        print("NPZ:", args.npz)
+    if args.parquet:
+        write_parquet(args.parquet, sites, result)
+        print("Parquet:", args.parquet)
+    if args.tables:
+        paths = write_tables(args.tables, sites, result, args.light_off_hour)
+        print("Tables:", args.tables, f"({len(paths)} files)")
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main())
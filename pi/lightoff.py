@@ -1,14 +1,21 @@
 #!/usr/bin/env python3
 # LPI Relay Control
-# Version: 1.0.1
-# Last updated: 2026-01-27
+# Version: 1.3.0
+# Last updated: 2026-10-17
+#
+# Relay OFF through relay.py; exits 1 when the relay would drop on exit or the
+# daemon holds the line.
 
-from gpiozero import LED
+import sys
 
-light = LED(18, active_high=True, initial_value=True)
+import relay
 
-# Keep GPIO latched after exit
-light._pin.close = lambda: None
+GPIO_PIN = 18
 
-light.off()
-print("Override OFF")
\ No newline at end of file
+try:
+    relay.require_persistent_outputs()
+    wrote = relay.get_relay(GPIO_PIN).set(False)
+except (RuntimeError, relay.RelayBusy) as e:
+    print("❌", e)
+    sys.exit(1)
+print("Override OFF" + ("" if wrote else " (unchanged - no write)"))
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+# LPI Log
+# Version: 1.4.0
+# Last updated: 2026-10-17
+#
+# Bounded logging: one fixed-size, memory-mapped ring per component
+# (/home/pi/lpi_log_<component>.ring) instead of the growing *_cron.log files.
+#
+#   python3 /home/pi/lpi_log.py status --since 2h --level warning
+#   python3 /home/pi/lpi_log.py --follow
+
+# Writer-side imports only; argparse / datetime / glob / json load with the reader
+import atexit
+import contextlib
+import fcntl
+import io
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+
+LOG_DIR = "/home/pi"
+RING_BYTES = max(16, int(os.environ.get("LPI_LOG_RING_KB", "512"))) * 1024
+FLUSH_RECORDS = 64
+FLUSH_SECONDS = 10.0
+MAX_MESSAGE_BYTES = 4000
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARN", ERROR: "ERROR"}
+PAD = 0xFF
+
+# header: magic, version, reserved, capacity, reserved, head, tail
+#   head/tail are logical byte positions (monotonic); physical offset = pos % capacity
+MAGIC = b"LPIL"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIQQ")
+# record: total length, level, reserved, unix time, pid; then UTF-8 payload
+RECORD = struct.Struct("<HBBdI")
+
+
+def level_from_name(name: str) -> int:
+    name = (name or "").strip().lower()
+    for level, n in LEVEL_NAMES.items():
+        if n.lower() == name or (name == "warning" and level == WARNING):
+            return level
+    raise ValueError(f"unknown log level {name!r}")
+
+
+def threshold() -> int:
+    try:
+        return level_from_name(os.environ.get("LPI_LOG_LEVEL", "info"))
+    except ValueError:
+        return INFO
+
+
+def enabled(level: int) -> bool:
+    return level >= threshold()
+
+
+def ring_path(component: str) -> str:
+    return os.path.join(LOG_DIR, f"lpi_log_{component}.ring")
+
+
+# ---------------- Ring file ----------------
+class Ring:
+    def __init__(self, path: str, capacity: int = None, readonly: bool = False):
+        self.path = path
+        self.capacity = capacity or RING_BYTES
+        if readonly:
+            self._open_readonly()
+            return
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o664)
+        try:
+            size = HEADER.size + self.capacity
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                st = os.fstat(fd)
+                if st.st_size >= HEADER.size:
+                    magic, version, _, cap, _, _, _ = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+                    if magic == MAGIC and version == VERSION and st.st_size == HEADER.size + cap:
+                        self.capacity = cap       # existing ring keeps its size
+                        size = st.st_size
+                    else:
+                        st = None
+                else:
+                    st = None
+                if st is None:
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, HEADER.pack(MAGIC, VERSION, 0, self.capacity, 0, 0, 0), 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self.mm = mmap.mmap(fd, size)
+        except Exception:
+            os.close(fd)
+            raise
+        self.fd = fd
+
+    def _open_readonly(self) -> None:
+        """Map an existing ring for reading; ValueError if it isn't a valid ring."""
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            st = os.fstat(fd)
+            if st.st_size < HEADER.size:
+                raise ValueError(f"{self.path}: not an LPI log ring")
+            magic, version, _, cap, _, _, _ = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+            if magic != MAGIC or version != VERSION or st.st_size != HEADER.size + cap:
+                raise ValueError(f"{self.path}: not an LPI log ring (or another version)")
+            self.capacity = cap
+            self.mm = mmap.mmap(fd, st.st_size, access=mmap.ACCESS_READ)
+        except Exception:
+            os.close(fd)
+            raise
+        self.fd = fd
+
+    def close(self) -> None:
+        self.mm.close()
+        os.close(self.fd)
+
+    def _pointers(self):
+        _, _, _, _, _, head, tail = HEADER.unpack_from(self.mm, 0)
+        return head, tail
+
+    def _skip(self, pos: int, head: int) -> int:
+        """Logical position of the record after the one at pos."""
+        off = pos % self.capacity
+        room = self.capacity - off
+        if room < RECORD.size:
+            return pos + room                   # implicit padding up to the wrap
+        length = RECORD.unpack_from(self.mm, HEADER.size + off)[0]
+        if length < RECORD.size or length > room:
+            return head                         # damaged: drop everything older
+        return pos + length
+
+    def append(self, records) -> None:
+        """records: packed record bytes. Oldest records are evicted to make room."""
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            head, tail = self._pointers()
+            cap = self.capacity
+
+            def make_room(n):
+                nonlocal tail
+                while head + n - tail > cap and tail < head:
+                    tail = self._skip(tail, head)
+
+            for rec in records:
+                room = cap - head % cap
+                if room < len(rec):
+                    make_room(room)
+                    if room >= RECORD.size:
+                        RECORD.pack_into(self.mm, HEADER.size + head % cap, room, PAD, 0, 0.0, 0)
+                    head += room
+                make_room(len(rec))
+                off = HEADER.size + head % cap
+                self.mm[off:off + len(rec)] = rec
+                head += len(rec)
+            struct.pack_into("<QQ", self.mm, HEADER.size - 16, head, tail)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def read(self):
+        """[(ts, level, pid, payload str)] oldest first."""
+        fcntl.flock(self.fd, fcntl.LOCK_SH)
+        try:
+            head, tail = self._pointers()
+            data = bytes(self.mm[HEADER.size:])
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        out = []
+        cap = self.capacity
+        pos = tail
+        while pos < head:
+            off = pos % cap
+            room = cap - off
+            if room < RECORD.size:
+                pos += room
+                continue
+            length, level, _, ts, pid = RECORD.unpack_from(data, off)
+            if length < RECORD.size or length > room:
+                break
+            if level != PAD:
+                out.append((ts, level, pid, data[off + RECORD.size:off + length].decode("utf-8", "replace")))
+            pos += length
+        return out
+
+    def stats(self) -> dict:
+        head, tail = self._pointers()
+        return {"capacity": self.capacity, "used": head - tail, "written_total": head}
+
+
+def pack(ts: float, level: int, message: str, fields: dict = None) -> bytes:
+    if fields:
+        import json
+    payload = message if not fields else message + " " + json.dumps(fields, separators=(",", ":"), default=str)
+    body = payload.encode("utf-8")[:MAX_MESSAGE_BYTES]
+    return RECORD.pack(RECORD.size + len(body), level, 0, ts, os.getpid()) + body
+
+
+# ---------------- Writers ----------------
+_rings = {}
+_pending = {}
+_last_flush = {}
+_lock = threading.RLock()
+
+
+def _ring(component: str) -> Ring:
+    if component not in _rings:
+        _rings[component] = Ring(ring_path(component))
+    return _rings[component]
+
+
+def log(component: str, level: int, message: str, **fields) -> None:
+    if not enabled(level):
+        return
+    record = pack(time.time(), level, message, fields)
+    with _lock:
+        batch = _pending.setdefault(component, [])
+        batch.append(record)
+        if len(batch) >= FLUSH_RECORDS or time.time() - _last_flush.get(component, 0) >= FLUSH_SECONDS:
+            flush(component)
+
+
+def flush(component: str = None) -> None:
+    with _lock:
+        for comp in ([component] if component else list(_pending)):
+            batch = _pending.pop(comp, None)
+            _last_flush[comp] = time.time()
+            if not batch:
+                continue
+            try:
+                _ring(comp).append(batch)
+            except OSError as e:
+                sys.__stderr__.write(f"WARN: log ring {comp} write failed: {e}\n")
+
+
+atexit.register(flush)
+
+
+class Logger:
+    def __init__(self, component: str):
+        self.component = component
+
+    def enabled(self, level: int) -> bool:
+        return enabled(level)
+
+    def debug(self, message: str, **fields) -> None:
+        log(self.component, DEBUG, message, **fields)
+
+    def info(self, message: str, **fields) -> None:
+        log(self.component, INFO, message, **fields)
+
+    def warning(self, message: str, **fields) -> None:
+        log(self.component, WARNING, message, **fields)
+
+    def error(self, message: str, **fields) -> None:
+        log(self.component, ERROR, message, **fields)
+
+
+def get(component: str) -> Logger:
+    return Logger(component)
+
+
+def classify(line: str, default: int) -> int:
+    """Level for a captured print() line, following the repo's output conventions."""
+    if default >= ERROR or "❌" in line or line.startswith("Traceback"):
+        return ERROR
+    if line.startswith("WARN"):
+        return WARNING
+    return default
+
+
+class RingWriter(io.TextIOBase):
+    """File-like stdout/stderr replacement: each complete line becomes a record."""
+
+    def __init__(self, component: str, level: int = INFO, tee=None):
+        self.component = component
+        self.level = level
+        self.tee = tee
+        self._partial = ""
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        if self.tee is not None:
+            self.tee.write(s)
+        lines = (self._partial + s).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            if line.strip():
+                self.record(classify(line, self.level), line)
+        return len(s)
+
+    def record(self, level: int, line: str) -> None:
+        log(self.component, level, line)
+
+    def flush(self) -> None:
+        if self.tee is not None:
+            self.tee.flush()
+
+    def close_line(self) -> None:
+        if self._partial.strip():
+            self.record(classify(self._partial, self.level), self._partial)
+        self._partial = ""
+
+
+@contextlib.contextmanager
+def capture(component: str):
+    """Send print() output to the component's ring (still shown on a terminal)."""
+    out_tee = sys.stdout if sys.stdout is not None and sys.stdout.isatty() else None
+    err_tee = sys.stderr if sys.stderr is not None and sys.stderr.isatty() else None
+    out = RingWriter(component, INFO, out_tee)
+    err = RingWriter(component, ERROR, err_tee)
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            yield
+    finally:
+        out.close_line()
+        err.close_line()
+        flush(component)
+
+
+def printer(component: str):
+    """A print-like out= that records each line in the component's ring, levelled as capture() does."""
+    def out(*args) -> None:
+        for line in " ".join(str(a) for a in args).split("\n"):
+            if line.strip():
+                log(component, classify(line, INFO), line)
+    return out
+
+
+def emit(level: int, text: str, out=print) -> None:
+    """print() at a level: recorded at that level under capture(), printed if enabled otherwise."""
+    if not enabled(level):
+        return
+    if out is not print:
+        out(text)
+    elif isinstance(sys.stdout, RingWriter):
+        if sys.stdout.tee is not None:
+            sys.stdout.tee.write(text + "\n")
+        for line in text.split("\n"):
+            sys.stdout.record(level, line)
+    else:
+        print(text)
+
+
+# ---------------- Reader ----------------
+def components() -> list:
+    pat = re.compile(r"^lpi_log_(.+)\.ring$")
+    import glob
+    return sorted(m.group(1) for m in (pat.match(os.path.basename(p)) for p in glob.glob(ring_path("*"))) if m)
+
+
+def parse_when(value: str, now: float) -> float:
+    """'15m' / '2h' / '3d' ago, or an ISO date/time (local)."""
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", value.strip())
+    if m:
+        return now - float(m.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[m.group(2)]
+    import datetime
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def read(comps, since: float = None, until: float = None, min_level: int = DEBUG, grep: str = None):
+    rows = []
+    for comp in comps:
+        if not os.path.exists(ring_path(comp)):
+            continue
+        try:
+            r = Ring(ring_path(comp), readonly=True)
+        except (OSError, ValueError) as e:
+            print("WARN: skipping", comp + ":", e, file=sys.stderr)
+            continue
+        try:
+            recs = r.read()
+        finally:
+            r.close()
+        for ts, level, pid, text in recs:
+            if level < min_level or (since and ts < since) or (until and ts >= until):
+                continue
+            if grep and grep not in text:
+                continue
+            rows.append((ts, comp, level, pid, text))
+    rows.sort(key=lambda x: x[0])
+    return rows
+
+
+def format_row(row, as_json: bool = False) -> str:
+    ts, comp, level, pid, text = row
+    if as_json:
+        import json
+        return json.dumps({"ts": ts, "component": comp, "level": LEVEL_NAMES.get(level, level), "pid": pid, "message": text})
+    import datetime
+    stamp = datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    return f"{stamp} {comp:<8} {LEVEL_NAMES.get(level, level):<5} {text}"
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="LPI log ring reader")
+    ap.add_argument("component", nargs="*", help="components to read (default: all)")
+    ap.add_argument("--since", help="e.g. 15m, 2h, 1d or 2026-10-17T08:00")
+    ap.add_argument("--until", help="same formats as --since")
+    ap.add_argument("--level", default="debug", help="minimum level: debug, info, warning, error")
+    ap.add_argument("--grep", help="only records containing this text")
+    ap.add_argument("--json", action="store_true", help="one JSON object per line")
+    ap.add_argument("--follow", "-f", action="store_true", help="keep printing new records")
+    ap.add_argument("--stats", action="store_true", help="ring sizes and usage")
+    args = ap.parse_args()
+
+    comps = args.component or components()
+    if args.stats:
+        for comp in comps:
+            try:
+                r = Ring(ring_path(comp), readonly=True)
+            except (OSError, ValueError) as e:
+                print("WARN: skipping", comp + ":", e, file=sys.stderr)
+                continue
+            s = r.stats()
+            n = len(r.read())
+            r.close()
+            print(f"{comp:<10} {s['used']:>9} / {s['capacity']} bytes  {n} records  {s['written_total']} bytes written total")
+        return 0
+
+    now = time.time()
+    since = parse_when(args.since, now) if args.since else None
+    until = parse_when(args.until, now) if args.until else None
+    min_level = level_from_name(args.level)
+
+    last = since
+    while True:
+        rows = read(comps, last, until, min_level, args.grep)
+        for row in rows:
+            if last is not None and row[0] <= last and args.follow:
+                continue
+            print(format_row(row, args.json))
+        if not args.follow:
+            return 0
+        if rows:
+            last = rows[-1][0]
+        sys.stdout.flush()
+        time.sleep(1.0)
+        comps = args.component or components()
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# LPI Stage Timing
+# Version: 1.2.0
+# Last updated: 2026-10-17
+#
+# Per-stage latency (startup, token refresh, Firestore HTTP, astral, GPIO, ...):
+# rolling p50/p95/max per stage, kept in state_store.py ("timings").
+# LPI_PROFILE=1 / --profile dumps a cProfile of one run.
+#
+#   python3 /home/pi/lpi_timing.py            # the rolling summary table
+
+import atexit
+import collections
+import contextlib
+import functools
+import os
+import sys
+import time
+
+LPI_HOME = os.path.dirname(os.path.abspath(__file__))
+
+STATE_KEY = "timings"
+WINDOW = 128               # samples kept per stage
+PROFILE_DIR = "/home/pi"
+PROFILE_TOP = 25
+SAVE_SECONDS = 300         # min interval between saves of one process
+
+_pending = collections.defaultdict(lambda: collections.deque(maxlen=WINDOW))
+_counts = collections.Counter()
+_profiled = set()
+_next_save = 0.0           # time.monotonic() of the next due save
+
+
+def record(name: str, ms: float) -> None:
+    _pending[name].append(round(ms, 2))
+    _counts[name] += 1
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Time the with-block as one sample of stage `name` (recorded even if it raises)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - t0) * 1000)
+
+
+def timed(name: str):
+    """Decorator form of stage()."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def process_age_ms():
+    """ms since this process started (Linux /proc, 1/CLK_TCK resolution); None elsewhere."""
+    try:
+        with open("/proc/self/stat", "r") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, (uptime - start_ticks / os.sysconf("SC_CLK_TCK")) * 1000)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# ---- Local state ----
+def _state_store():
+    try:
+        import state_store
+    except ImportError:
+        # timer.py run on its own: state_store.py lives in pi_monitor_test/
+        sys.path.insert(0, os.path.join(LPI_HOME, "pi_monitor_test"))
+        import state_store
+    return state_store
+
+
+def merge(stored: dict, pending=None, counts=None) -> dict:
+    """stored ("timings" state value) + pending samples -> new state value."""
+    pending = _pending if pending is None else pending
+    counts = _counts if counts is None else counts
+    out = {k: dict(v) for k, v in (stored or {}).items()}
+    for name, samples in pending.items():
+        if not samples:
+            continue
+        prev = out.get(name, {})
+        out[name] = {
+            "ms": (list(prev.get("ms", [])) + list(samples))[-WINDOW:],
+            "n": int(prev.get("n", 0)) + counts[name],
+        }
+    return out
+
+
+def save(force: bool = False) -> None:
+    """
+    Merge this process's pending samples into the local state (one transaction),
+    unless the last save was less than SAVE_SECONDS ago (force: save anyway).
+    """
+    global _next_save
+    if not any(_pending.values()):
+        return
+    if not force and time.monotonic() < _next_save:
+        return
+    try:
+        _state_store().update(STATE_KEY, lambda stored: merge(stored))
+    except Exception as e:
+        print("WARN: timing state write failed:", e)
+        return
+    _pending.clear()
+    _counts.clear()
+    _next_save = time.monotonic() + SAVE_SECONDS
+
+
+atexit.register(save, force=True)
+
+
+def _pct(sorted_ms, q: float) -> float:
+    return sorted_ms[min(len(sorted_ms) - 1, int(len(sorted_ms) * q))]
+
+
+def summary(stored: dict = None) -> dict:
+    """Compact rolling summary (ms, 1 decimal) incl. this process's unsaved samples."""
+    if stored is None:
+        try:
+            stored = _state_store().get(STATE_KEY) or {}
+        except Exception:
+            stored = {}
+    out = {}
+    for name, v in sorted(merge(stored).items()):
+        s = sorted(v.get("ms") or [])
+        if not s:
+            continue
+        out[name] = {
+            "n": int(v.get("n", len(s))),
+            "p50": round(_pct(s, 0.50), 1),
+            "p95": round(_pct(s, 0.95), 1),
+            "max": round(s[-1], 1),
+        }
+    return out
+
+
+# ---- cProfile of a single run ----
+def profile_requested(component: str) -> bool:
+    if component in _profiled:
+        return False
+    if "--profile" in sys.argv[1:]:
+        return True
+    want = os.environ.get("LPI_PROFILE", "").strip().lower()
+    if want in ("", "0", "false", "no"):
+        return False
+    return want in ("1", "true", "yes", "all") or component in [w.strip() for w in want.split(",")]
+
+
+@contextlib.contextmanager
+def _profile(component: str):
+    import cProfile
+    import pstats
+
+    _profiled.add(component)
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        path = os.path.join(PROFILE_DIR, f"lpi_profile_{component}.prof")
+        try:
+            prof.dump_stats(path)
+            print("cProfile written:", path)
+        except OSError as e:
+            print("WARN: cProfile dump failed:", e)
+        pstats.Stats(prof, stream=sys.stdout).sort_stats("cumulative").print_stats(PROFILE_TOP)
+
+
+@contextlib.contextmanager
+def run(component: str, startup: bool = True):
+    """
+    Wrap one run of an entry point: optional cProfile, a `component` stage for the
+    whole run, "startup" for a freshly spawned process, then save() (if due).
+    """
+    if startup:
+        age = process_age_ms()
+        if age is not None:
+            record("startup", age)
+    prof = _profile(component) if profile_requested(component) else contextlib.nullcontext()
+    try:
+        with prof, stage(component):
+            yield
+    finally:
+        save()
+
+
+def main():
+    s = summary()
+    if not s:
+        print("No timings recorded yet")
+        return
+    print(f"{'stage':<18} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for name, v in s.items():
+        print(f"{name:<18} {v['n']:>7} {v['p50']:>9.1f} {v['p95']:>9.1f} {v['max']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
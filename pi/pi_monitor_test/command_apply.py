@@ -1,36 +1,57 @@
 #!/usr/bin/env python3
 # LPI Command Apply
-# Version: 1.2.1
-# Last updated: 2026-01-27
+# Version: 1.18.0
+# Last updated: 2026-10-17
 #
-# Reads Firestore: device_commands/{device_id}.mode
-# Writes local:
+# Reads Firestore: device_commands/{device_id}.mode (+ channel_modes.<channel>)
+# Writes local (state_store.py, key "override"; exported to the old paths):
 #   /home/pi/override_mode.txt
 #   /home/pi/override_state.json (mode + set_at_local)
 #
 # IMPORTANT:
 #   - set_at_local is only updated when the mode CHANGES.
 #   - This enables auto-revert to work.
+#
+# Reads are adaptive (POLL_MIN_SECONDS .. POLL_MAX_SECONDS, see next_interval());
+# --now reads right away, --listen keeps a documents:listen stream open instead.
 
 import os
+import random
 import socket
-import json
+import sys
+import threading
+import time
 from datetime import datetime
 
-import requests
-from google.oauth2 import service_account
-import google.auth.transport.requests
+import firestore_client
+import outbox
+import state_store
+
+import lpi_paths  # noqa: F401
+import lpi_log
+import lpi_timing
 
-SERVICE_ACCOUNT_FILE = "/home/pi/lpi_monitor.json"
-PROJECT_ID = "lpi-monitor"
+SERVICE_ACCOUNT_FILE = firestore_client.SERVICE_ACCOUNT_FILE
 COMMANDS_COLLECTION = "device_commands"
 ID_FILE = "/home/pi/device_id.txt"
 
-OVERRIDE_FILE = "/home/pi/override_mode.txt"
-STATE_FILE = "/home/pi/override_state.json"
-
 VALID_MODES = {"auto", "force_on", "force_off"}
 
+POLL_SECONDS = 15              # tick; also the listen-mode fallback loop
+POLL_MIN_SECONDS = int(os.environ.get("LPI_POLL_MIN_SECONDS", "15"))
+POLL_MAX_SECONDS = int(os.environ.get("LPI_POLL_MAX_SECONDS", "300"))
+POLL_BACKOFF_FACTOR = 2
+ACTIVE_SECONDS = 600           # keep polling tightly this long after a change
+NEAR_TRANSITION_SECONDS = 900  # ... and this close to a scheduled on/off time
+TICK_SLACK_SECONDS = 2         # a due time a hair after the next tick still counts
+COMMAND_FIELDS = ["mode", "channel_modes"]
+POLL_KEY = "command_poll"
+RECONNECT_MIN_SECONDS = 1
+RECONNECT_MAX_SECONDS = 300
+
+_apply_lock = threading.Lock()
+_listening = threading.Event()
+
 def get_device_id() -> str:
     if os.path.exists(ID_FILE):
         with open(ID_FILE, "r") as f:
@@ -39,25 +60,9 @@ def get_device_id() -> str:
                 return v
     return socket.gethostname()
 
-def get_token() -> str:
-    creds = service_account.Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE,
-        scopes=["https://www.googleapis.com/auth/datastore"],
-    )
-    req = google.auth.transport.requests.Request()
-    creds.refresh(req)
-    return creds.token
-
-def read_command_doc(device_id: str, token: str) -> dict:
-    url = (
-        f"https://firestore.googleapis.com/v1/projects/{PROJECT_ID}/databases/(default)"
-        f"/documents/{COMMANDS_COLLECTION}/{device_id}"
-    )
-    r = requests.get(url, headers={"Authorization": f"Bearer {token}"}, timeout=10)
-    if r.status_code == 404:
-        return {}
-    r.raise_for_status()
-    return r.json()
+def read_command_doc(device_id: str) -> dict:
+    # Only the fields we apply; updateTime comes back regardless of the mask
+    return firestore_client.get_document(COMMANDS_COLLECTION, device_id, mask=COMMAND_FIELDS)
 
 def get_field_string(fields: dict, name: str, default: str = "") -> str:
     v = fields.get(name, {})
@@ -66,59 +71,269 @@ def get_field_string(fields: dict, name: str, default: str = "") -> str:
     return default
 
 def read_current_state() -> dict:
-    if not os.path.exists(STATE_FILE):
-        return {}
     try:
-        with open(STATE_FILE, "r") as f:
-            return json.load(f) or {}
+        return state_store.get_override()
     except Exception:
         return {}
 
-def write_override_mode(mode: str) -> None:
-    with open(OVERRIDE_FILE, "w") as f:
-        f.write(mode + "\n")
-
-def write_state(mode: str, set_at_local: str) -> None:
-    with open(STATE_FILE, "w") as f:
-        json.dump({"mode": mode, "set_at_local": set_at_local}, f)
-
 def normalize_mode(mode: str) -> str:
     mode = (mode or "auto").strip().lower()
     if mode not in VALID_MODES:
         return "auto"
     return mode
 
-def main():
-    if not os.path.exists(SERVICE_ACCOUNT_FILE):
+def mode_from_doc(doc: dict) -> str:
+    fields = doc.get("fields", {}) if doc else {}
+    return normalize_mode(get_field_string(fields, "mode", "auto") if fields else "auto")
+
+def channel_modes_from_doc(doc: dict) -> dict:
+    fields = doc.get("fields", {}) if doc else {}
+    m = fields.get("channel_modes", {}).get("mapValue", {}).get("fields", {})
+    return {name: normalize_mode(get_field_string(m, name, "auto")) for name in m}
+
+def apply_channel_modes(device_id: str, channel_modes: dict, out=print) -> None:
+    """Per-channel overrides; like apply_mode, set_at_local only moves on a change."""
+    with _apply_lock:
+        current = state_store.get("channel_overrides") or {}
+        now = datetime.now().isoformat()
+        new = {}
+        for name, mode in channel_modes.items():
+            prev = current.get(name)
+            if prev and prev.get("mode") == mode and prev.get("set_at_local"):
+                new[name] = prev
+            else:
+                new[name] = {"mode": mode, "set_at_local": now}
+                out("Device:", device_id, f"Channel {name} override changed to:", mode, "set_at:", now)
+        for name in current:
+            if name not in new:
+                out("Device:", device_id, f"Channel {name} override cleared")
+        state_store.put("channel_overrides", new)
+
+def apply_doc(device_id: str, doc: dict, out=print) -> None:
+    apply_mode(device_id, mode_from_doc(doc), out)
+    apply_channel_modes(device_id, channel_modes_from_doc(doc), out)
+
+def apply_mode(device_id: str, new_mode: str, out=print) -> None:
+    with _apply_lock:
+        current = read_current_state()
+        current_mode = normalize_mode(current.get("mode", "auto"))
+        current_set_at = current.get("set_at_local")
+
+        # Only update set_at_local when mode CHANGES (critical for auto-revert)
+        if new_mode != current_mode or not current_set_at:
+            set_at_local = datetime.now().isoformat()
+            state_store.set_override(new_mode, set_at_local)
+            out("Device:", device_id, "Override changed to:", new_mode, "set_at:", set_at_local)
+        else:
+            # Keep existing set_at_local; a no-op unless migrating from the legacy files
+            state_store.set_override(current_mode, current_set_at)
+            out("Device:", device_id, "Override unchanged:", new_mode)
+
+def scheduled_transitions() -> list:
+    """Epoch times of the on/off instants status_test.py last reported (all channels)."""
+    try:
+        channels = (state_store.get("status") or {}).get("channels") or []
+    except Exception:
+        return []
+    out = []
+    for ch in channels:
+        for key in ("lighton", "lightoff"):
+            try:
+                out.append(datetime.fromisoformat(ch[key]).timestamp())
+            except (KeyError, TypeError, ValueError):
+                pass
+    return out
+
+
+def next_interval(prev: float, changed: bool, changed_at: float, now: float, transitions) -> float:
+    """Seconds until the next read: tight after a change or near a transition, else back off."""
+    if changed or now - changed_at < ACTIVE_SECONDS or any(
+        abs(now - t) <= NEAR_TRANSITION_SECONDS for t in transitions
+    ):
+        return POLL_MIN_SECONDS
+    interval = min(POLL_MAX_SECONDS, max(POLL_MIN_SECONDS, prev * POLL_BACKOFF_FACTOR))
+    # Don't sleep through the start of the next transition window
+    upcoming = [t - NEAR_TRANSITION_SECONDS - now for t in transitions if t - NEAR_TRANSITION_SECONDS > now]
+    if upcoming:
+        interval = max(POLL_MIN_SECONDS, min(interval, min(upcoming)))
+    return interval
+
+
+def remember_update_time(update_time) -> None:
+    """Record a document version applied outside poll() (listen stream)."""
+    state_store.update(POLL_KEY, lambda p: {**(p or {}), "update_time": update_time,
+                                            "changed_at": time.time()}, default={})
+
+
+def fetch(device_id: str, force: bool = False):
+    """The network half of a poll: (poll state, doc, read time), or None when no poll is due."""
+    now = time.time()
+    state = state_store.get(POLL_KEY) or {}
+    if not force and now < float(state.get("next_poll_at", 0)):
+        return None
+    return state, read_command_doc(device_id), now
+
+
+def queued_ahead_of(device_id: str, update_time) -> bool:
+    """
+    True if our own queued write to the command doc (auto-revert, lan_control.py) is newer
+    than the document version update_time: applying that version would undo it locally.
+    """
+    pending = outbox.pending_write(COMMANDS_COLLECTION, device_id)
+    if pending is None or pending[0].get("version_key") != POLL_KEY:
+        return False
+    write, enqueued_at = pending
+    if not update_time:
+        return True
+    guard = (write.get("precondition") or {}).get("updateTime")
+    if guard:
+        # Written against that version; any other one makes Firestore reject it
+        return guard == update_time
+    return enqueued_at >= firestore_client.timestamp_epoch(update_time)
+
+def settle(device_id: str, state: dict, doc: dict, now: float, out=print) -> bool:
+    """The local half: apply the doc if its updateTime moved, schedule the next read. True if applied."""
+    update_time = doc.get("updateTime") if doc else None
+    changed = not state or update_time != state.get("update_time")
+    if changed and queued_ahead_of(device_id, update_time):
+        out("Device:", device_id, f"command doc ({update_time}) predates the queued local change;",
+              "deferred until that write lands")
+        state_store.put(POLL_KEY, {**state, "interval": POLL_MIN_SECONDS,
+                                   "next_poll_at": now + POLL_MIN_SECONDS - TICK_SLACK_SECONDS})
+        return False
+    if changed:
+        apply_doc(device_id, doc, out)
+        changed_at = now
+    else:
+        changed_at = float(state.get("changed_at", 0))
+
+    interval = next_interval(float(state.get("interval", POLL_MIN_SECONDS)), changed, changed_at, now,
+                             scheduled_transitions())
+    state_store.put(POLL_KEY, {
+        "update_time": update_time,
+        "changed_at": changed_at,
+        "interval": interval,
+        "next_poll_at": now + interval - TICK_SLACK_SECONDS,
+    })
+    if not changed:
+        out("Device:", device_id, f"command doc unchanged (next read in {interval:.0f}s)")
+    return changed
+
+
+def poll(device_id: str, force: bool = False) -> bool:
+    """One adaptive poll tick. Returns True if Firestore was read."""
+    fetched = fetch(device_id, force)
+    if fetched is None:
+        return False
+    settle(device_id, *fetched)
+    return True
+
+def listening() -> bool:
+    """True while a listen stream is connected (polling is redundant then)."""
+    return _listening.is_set()
+
+def listen_configured(out=print) -> bool:
+    """True when a listen endpoint is set; otherwise says why listen mode stays off."""
+    if firestore_client.listen_url():
+        return True
+    out("WARN: listen mode needs LPI_LISTEN_URL (Firestore has no JSON documents:listen); polling instead")
+    return False
+
+def listen_forever(device_id: str, stop: threading.Event = None, on_change=None) -> None:
+    """
+    Apply device_commands/{device_id} changes as they are pushed; reconnect with backoff.
+    on_change() is called after each applied change (lpi_pipeline.py wakes its loop with it).
+    Logs to the "command" ring, never to stdout (see the header).
+    """
+    stop = stop or threading.Event()
+    backoff = RECONNECT_MIN_SECONDS
+    log = lpi_log.get("command")
+    out = lpi_log.printer("command")
+
+    while not stop.is_set():
+        seen_doc = False
+        try:
+            for msg in firestore_client.listen_document(COMMANDS_COLLECTION, device_id):
+                if stop.is_set():
+                    return
+                if not listening():
+                    log.info(f"Device: {device_id} listen stream connected")
+                    _listening.set()
+                backoff = RECONNECT_MIN_SECONDS
+
+                doc = None
+                if "documentChange" in msg:
+                    doc = msg["documentChange"].get("document", {})
+                elif "documentDelete" in msg or "documentRemove" in msg:
+                    doc = {}
+                elif msg.get("targetChange", {}).get("targetChangeType") == "CURRENT" and not seen_doc:
+                    # Initial snapshot is complete and the document doesn't exist
+                    doc = {}
+
+                applied = False
+                if doc is not None:
+                    seen_doc = True
+                    if queued_ahead_of(device_id, doc.get("updateTime")):
+                        # Our own queued write hasn't landed; its change notification follows
+                        log.info(f"Device: {device_id} pushed command doc predates the queued local change; deferred")
+                    else:
+                        apply_doc(device_id, doc, out)
+                        remember_update_time(doc.get("updateTime"))
+                        applied = True
+                if applied and on_change is not None:
+                    on_change()
+                if applied:
+                    lpi_log.flush("command")
+                lpi_timing.save()
+            raise ConnectionError("listen stream closed by server")
+        except Exception as e:
+            _listening.clear()
+            delay = backoff * random.uniform(0.5, 1.0)
+            log.warning(f"listen stream down ({e}); reconnecting in {delay:.1f}s")
+            lpi_log.flush("command")
+            stop.wait(delay)
+            backoff = min(backoff * 2, RECONNECT_MAX_SECONDS)
+
+def main(force: bool = False):
+    if not firestore_client.has_credentials():
         print("❌ Missing service account file:", SERVICE_ACCOUNT_FILE)
         return
 
     device_id = get_device_id()
-    current = read_current_state()
-    current_mode = normalize_mode(current.get("mode", "auto"))
-    current_set_at = current.get("set_at_local")
 
     try:
-        token = get_token()
-        doc = read_command_doc(device_id, token)
-        fields = doc.get("fields", {}) if doc else {}
-        new_mode = normalize_mode(get_field_string(fields, "mode", "auto") if fields else "auto")
+        poll(device_id, force=force)
     except Exception as e:
         print("❌ Failed reading Firestore mode:", e)
+
+def main_listen():
+    if not firestore_client.has_credentials():
+        print("❌ Missing service account file:", SERVICE_ACCOUNT_FILE)
+        return
+    if not firestore_client.listen_url():
+        print("❌ --listen needs LPI_LISTEN_URL (Firestore has no JSON documents:listen)")
         return
 
-    # Always write the simple mode file (cheap + keeps status_test robust)
-    write_override_mode(new_mode)
+    device_id = get_device_id()
+    threading.Thread(target=listen_forever, args=(device_id,), daemon=True).start()
 
-    # Only update set_at_local when mode CHANGES (critical for auto-revert)
-    if new_mode != current_mode or not current_set_at:
-        set_at_local = datetime.now().isoformat()
-        write_state(new_mode, set_at_local)
-        print("Device:", device_id, "Override changed to:", new_mode, "set_at:", set_at_local)
-    else:
-        # Keep existing set_at_local
-        write_state(current_mode, current_set_at)
-        print("Device:", device_id, "Override unchanged:", new_mode)
+    # Fallback: keep the old poll going only while the stream is down
+    while True:
+        if not listening():
+            with lpi_timing.run("command", startup=False):
+                main()
+        time.sleep(POLL_SECONDS)
 
 if __name__ == "__main__":
-    main()
+    if "--startup-profile" in sys.argv[1:]:
+        import startup_profile
+        sys.exit(startup_profile.main(__file__))
+    with lpi_log.capture("command"):
+        if "--listen" in sys.argv[1:]:
+            try:
+                main_listen()
+            except KeyboardInterrupt:
+                pass
+        else:
+            with lpi_timing.run("command"):
+                main(force="--now" in sys.argv[1:])
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# LPI Firestore Client
+# Version: 1.9.0
+# Last updated: 2026-10-17
+#
+# Small Firestore REST layer shared by the device scripts and fleet/: one pooled
+# keep-alive session per process, masked get / patch / commit, bounded retries on
+# 429/5xx, streamed list / batchGet / runQuery, and the status schema both ways.
+#
+# FIRESTORE_EMULATOR_HOST=127.0.0.1:8080  -> local emulator / stand-in, no OAuth
+# LPI_FIRESTORE_URL=http://host:port/v1   -> another REST base URL, OAuth still on
+# LPI_LISTEN_URL=http://...               -> listen relay; required for listen mode
+
+import codecs
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+import token_cache
+
+import lpi_paths  # noqa: F401
+import lpi_timing
+
+PROJECT_ID = "lpi-monitor"
+SERVICE_ACCOUNT_FILE = token_cache.SERVICE_ACCOUNT_FILE
+
+DEFAULT_TIMEOUT = 10
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5          # 0.5s, 1s, 2s between attempts
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+POOL_SIZE = 4
+LISTEN_READ_TIMEOUT = 90      # server heartbeats well inside this; silence = dead stream
+
+_session = None
+
+
+def emulator_host() -> str:
+    return os.environ.get("FIRESTORE_EMULATOR_HOST", "").strip()
+
+
+def base_url() -> str:
+    url = os.environ.get("LPI_FIRESTORE_URL", "").strip()
+    if url:
+        return url.rstrip("/")
+    host = emulator_host()
+    if host:
+        return f"http://{host}/v1"
+    return "https://firestore.googleapis.com/v1"
+
+
+def has_credentials() -> bool:
+    return bool(emulator_host()) or os.path.exists(SERVICE_ACCOUNT_FILE)
+
+
+def database_path() -> str:
+    return f"projects/{PROJECT_ID}/databases/(default)"
+
+
+def document_name(collection: str, doc_id: str) -> str:
+    return f"{database_path()}/documents/{collection}/{doc_id}"
+
+
+def document_url(collection: str, doc_id: str) -> str:
+    return f"{base_url()}/{document_name(collection, doc_id)}"
+
+
+def session():
+    """The process-wide pooled session (created on first use)."""
+    global _session
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=MAX_RETRIES,
+            backoff_factor=BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET", "PATCH"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+        s = requests.Session()
+        s.mount("https://", adapter)
+        s.mount("http://", adapter)
+        _session = s
+    return _session
+
+
+def auth_headers() -> dict:
+    if emulator_host():
+        return {"Authorization": "Bearer owner"}
+    return {"Authorization": f"Bearer {token_cache.get_token(SERVICE_ACCOUNT_FILE)}"}
+
+
+def to_firestore_fields(d):
+    def wrap(value):
+        if isinstance(value, bool):
+            return {"booleanValue": value}
+        if isinstance(value, int):
+            return {"integerValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        if isinstance(value, list):
+            return {"arrayValue": {"values": [wrap(v) for v in value]}}
+        if isinstance(value, dict):
+            return {"mapValue": {"fields": {k: wrap(v) for k, v in value.items()}}}
+        if value is None:
+            return {"nullValue": None}
+        return {"stringValue": str(value)}
+    return {"fields": {k: wrap(v) for k, v in d.items()}}
+
+
+def from_firestore_fields(doc):
+    """Inverse of to_firestore_fields: a Firestore document (or {"fields": ...}) -> plain dict."""
+    def unwrap(v):
+        if "booleanValue" in v:
+            return v["booleanValue"]
+        if "integerValue" in v:
+            return int(v["integerValue"])
+        if "doubleValue" in v:
+            return float(v["doubleValue"])
+        if "arrayValue" in v:
+            return [unwrap(x) for x in v["arrayValue"].get("values", [])]
+        if "mapValue" in v:
+            return {k: unwrap(x) for k, x in v["mapValue"].get("fields", {}).items()}
+        if "nullValue" in v:
+            return None
+        if "timestampValue" in v:
+            return v["timestampValue"]
+        return v.get("stringValue")
+    return {k: unwrap(v) for k, v in (doc or {}).get("fields", {}).items()}
+
+
+def doc_id_of(name: str) -> str:
+    return name.rsplit("/", 1)[-1]
+
+
+@lpi_timing.timed("firestore_get")
+def timestamp_epoch(ts: str) -> float:
+    """Firestore timestamp (RFC 3339, up to nanoseconds) -> epoch seconds."""
+    ts = ts.strip().replace("Z", "+00:00")
+    m = re.match(r"^(.*?T\d\d:\d\d:\d\d)(?:\.(\d+))?(.*)$", ts)
+    frac = ((m.group(2) or "") + "000000")[:6]
+    return datetime.fromisoformat(f"{m.group(1)}.{frac}{m.group(3) or '+00:00'}").timestamp()
+
+
+def get_document(collection: str, doc_id: str, mask=None, timeout: float = DEFAULT_TIMEOUT) -> dict:
+    """
+    GET a document as raw Firestore JSON ({} if it doesn't exist).
+    mask: optional list of field paths to return (mask.fieldPaths).
+    """
+    params = {"mask.fieldPaths": list(mask)} if mask else None
+    r = session().get(document_url(collection, doc_id), headers=auth_headers(), params=params, timeout=timeout)
+    if r.status_code == 404:
+        return {}
+    r.raise_for_status()
+    return r.json()
+
+
+@lpi_timing.timed("firestore_patch")
+def patch_document(collection: str, doc_id: str, fields: dict, update_mask=None,
+                   timeout: float = DEFAULT_TIMEOUT):
+    """
+    PATCH a document with already-encoded Firestore fields and return the response.
+    update_mask: list of field paths to write (updateMask.fieldPaths); None replaces the document.
+    """
+    params = {"updateMask.fieldPaths": list(update_mask)} if update_mask else None
+    return session().patch(
+        document_url(collection, doc_id),
+        headers=auth_headers(),
+        params=params,
+        json={"fields": fields},
+        timeout=timeout,
+    )
+
+
+@lpi_timing.timed("firestore_commit")
+def commit(writes, timeout: float = DEFAULT_TIMEOUT):
+    """POST documents:commit (all writes applied atomically, or none). Returns the response."""
+    return session().post(
+        f"{base_url()}/{database_path()}/documents:commit",
+        headers=auth_headers(),
+        json={"writes": list(writes)},
+        timeout=timeout,
+    )
+
+
+def listen_url() -> str:
+    """LPI_LISTEN_URL, or "" -- Firestore itself serves Listen over gRPC only."""
+    return os.environ.get("LPI_LISTEN_URL", "").strip()
+
+
+def _json_stream(chunks):
+    """Yield objects from a streamed JSON array ("[{...},{...}") as they arrive."""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    for chunk in chunks:
+        buf += utf8.decode(chunk)
+        while True:
+            buf = buf.lstrip(" \t\r\n[,")
+            if not buf or buf.startswith("]"):
+                break
+            try:
+                obj, end = decoder.raw_decode(buf)
+            except json.JSONDecodeError:
+                break  # incomplete object; wait for more data
+            buf = buf[end:]
+            yield obj
+
+
+def listen_document(collection: str, doc_id: str, read_timeout: float = LISTEN_READ_TIMEOUT):
+    """
+    Open a documents:listen stream for one document and yield each ListenResponse
+    dict (targetChange / documentChange / documentDelete / ...). Returns when the
+    server closes the stream; raises on HTTP or network errors. Never retried here.
+    """
+    url = listen_url()
+    if not url:
+        raise RuntimeError("LPI_LISTEN_URL is not set")
+    body = {
+        "addTarget": {
+            "targetId": 1,
+            "documents": {"documents": [document_name(collection, doc_id)]},
+        }
+    }
+    r = session().post(
+        url,
+        headers=auth_headers(),
+        json=body,
+        stream=True,
+        timeout=(DEFAULT_TIMEOUT, read_timeout),
+    )
+    with r:
+        r.raise_for_status()
+        yield from _json_stream(r.iter_content(chunk_size=None))
+
+
+def _post(url: str, body: dict, timeout: float, stream: bool = False):
+    """
+    POST for read-only RPCs (batchGet / runQuery). The adapter only retries GET/PATCH,
+    so 429/5xx are retried here with the same bounded backoff.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        r = session().post(url, headers=auth_headers(), json=body, timeout=timeout, stream=stream)
+        if r.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+            r.raise_for_status()
+            return r
+        r.close()
+        retry_after = r.headers.get("Retry-After", "")
+        time.sleep(float(retry_after) if retry_after.isdigit() else BACKOFF_FACTOR * (2 ** attempt))
+
+
+def list_documents(collection: str, mask=None, page_size: int = 300, timeout: float = DEFAULT_TIMEOUT):
+    """
+    Yield every document in a collection, one page at a time (pageToken).
+    mask=[] returns names + updateTime only (cheap change detection).
+    """
+    params = {"pageSize": page_size}
+    if mask is not None:
+        params["mask.fieldPaths"] = list(mask) or ["__name__"]
+    url = f"{base_url()}/{database_path()}/documents/{collection}"
+    while True:
+        r = session().get(url, headers=auth_headers(), params=params, timeout=timeout)
+        r.raise_for_status()
+        data = r.json()
+        yield from data.get("documents", [])
+        token = data.get("nextPageToken")
+        if not token:
+            return
+        params["pageToken"] = token
+
+
+def batch_get(names, mask=None, chunk: int = 100, timeout: float = DEFAULT_TIMEOUT):
+    """Yield documents for full resource names via documents:batchGet (missing ones skipped)."""
+    names = list(names)
+    url = f"{base_url()}/{database_path()}/documents:batchGet"
+    for i in range(0, len(names), chunk):
+        body = {"documents": names[i:i + chunk]}
+        if mask:
+            body["mask"] = {"fieldPaths": list(mask)}
+        r = _post(url, body, timeout, stream=True)
+        with r:
+            for item in _json_stream(r.iter_content(chunk_size=None)):
+                if "found" in item:
+                    yield item["found"]
+
+
+def field_filter(path: str, op: str, value) -> dict:
+    """One runQuery fieldFilter, e.g. field_filter("online", "EQUAL", False)."""
+    return {
+        "fieldFilter": {
+            "field": {"fieldPath": path},
+            "op": op,
+            "value": to_firestore_fields({"v": value})["fields"]["v"],
+        }
+    }
+
+
+def run_query(collection: str, filters=(), page_size: int = 300, timeout: float = DEFAULT_TIMEOUT):
+    """
+    Yield documents matching all filters (AND), streamed page by page via runQuery.
+    Paging orders by any inequality fields then __name__ and resumes after the last document.
+    """
+    filters = list(filters)
+    inequality = [
+        f["fieldFilter"]["field"]["fieldPath"] for f in filters
+        if f["fieldFilter"]["op"] not in ("EQUAL", "ARRAY_CONTAINS", "IN", "ARRAY_CONTAINS_ANY")
+    ]
+    order = [p for i, p in enumerate(inequality) if p not in inequality[:i]] + ["__name__"]
+
+    query = {
+        "from": [{"collectionId": collection}],
+        "orderBy": [{"field": {"fieldPath": p}} for p in order],
+        "limit": page_size,
+    }
+    if len(filters) == 1:
+        query["where"] = filters[0]
+    elif filters:
+        query["where"] = {"compositeFilter": {"op": "AND", "filters": filters}}
+
+    url = f"{base_url()}/{database_path()}/documents:runQuery"
+    while True:
+        r = _post(url, {"structuredQuery": query}, timeout, stream=True)
+        last = None
+        count = 0
+        with r:
+            for item in _json_stream(r.iter_content(chunk_size=None)):
+                doc = item.get("document")
+                if doc:
+                    count += 1
+                    last = doc
+                    yield doc
+        if count < page_size or last is None:
+            return
+        cursor = [
+            {"referenceValue": last["name"]} if p == "__name__" else last.get("fields", {}).get(p, {"nullValue": None})
+            for p in order
+        ]
+        query["startAt"] = {"values": cursor, "before": False}
@@ -1,78 +1,99 @@
 #!/usr/bin/env python3
 # LPI Firestore Upload Status
-# Version: 1.1.0
-# Last updated: 2026-01-27
-
+# Version: 1.19.0
+# Last updated: 2026-10-17
+#
+# Uploads the status snapshot (state_store.py) to devices/{device_id} through the
+# outbox. Only changed fields are sent (updateMask); timings / outbox / relay_daily
+# are passive and never make a delta on their own. A full PATCH goes up every
+# FULL_SYNC_SECONDS (env LPI_FULL_SYNC_SECONDS).
+
+import hashlib
 import json
+import threading
 import socket
-import requests
 import os
+import sys
+import time
 from datetime import datetime, timezone
 
-from google.oauth2 import service_account
-import google.auth.transport.requests
+import firestore_client
+import outbox
+import state_store
+import token_cache
+from firestore_client import to_firestore_fields
+
+import lpi_paths  # noqa: F401
+import lpi_log
+import lpi_timing
 
-SERVICE_ACCOUNT_FILE = "/home/pi/lpi_monitor.json"
-PROJECT_ID = "lpi-monitor"
+SERVICE_ACCOUNT_FILE = firestore_client.SERVICE_ACCOUNT_FILE
 COLLECTION = "devices"
-LOCAL_STATUS_PATH = "/home/pi/pi_status.json"
+LOCAL_STATUS_PATH = state_store.STATUS_FILE
 ID_FILE = "/home/pi/device_id.txt"
 
-def to_firestore_fields(d):
-    def wrap(value):
-        if isinstance(value, bool):
-            return {"booleanValue": value}
-        if isinstance(value, int):
-            return {"integerValue": str(value)}
-        if isinstance(value, float):
-            return {"doubleValue": value}
-        if isinstance(value, list):
-            return {"arrayValue": {"values": [wrap(v) for v in value]}}
-        if value is None:
-            return {"nullValue": None}
-        return {"stringValue": str(value)}
-    return {"fields": {k: wrap(v) for k, v in d.items()}}
-
-def main():
-    if not os.path.exists(SERVICE_ACCOUNT_FILE):
-        print("❌ Missing service account file:", SERVICE_ACCOUNT_FILE)
-        return
-
-    if os.path.exists(ID_FILE):
-        with open(ID_FILE) as f:
-            device_id = f.read().strip() or socket.gethostname()
-    else:
-        device_id = socket.gethostname()
-
-    if not os.path.exists(LOCAL_STATUS_PATH):
-        print("❌ No local status file at", LOCAL_STATUS_PATH)
-        return
-
-    with open(LOCAL_STATUS_PATH, "r") as f:
-        status = json.load(f)
-
-    creds = service_account.Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE,
-        scopes=["https://www.googleapis.com/auth/datastore"],
-    )
-    auth_req = google.auth.transport.requests.Request()
-    creds.refresh(auth_req)
-    token = creds.token
-
-    url = (
-        f"https://firestore.googleapis.com/v1/projects/{PROJECT_ID}/databases/(default)"
-        f"/documents/{COLLECTION}/{device_id}"
-    )
-
+FULL_SYNC_SECONDS = int(os.environ.get("LPI_FULL_SYNC_SECONDS", "3600"))
+
+# Always written, so the dashboard's "last seen" stays accurate
+HEARTBEAT_FIELDS = ("last_updated", "local_last_updated", "firestore_uploaded_at")
+HEARTBEAT_SECONDS = 60     # same cadence as the :20 cron/daemon upload
+
+# Sent with every upload but never the reason for one (they change on every run)
+PASSIVE_FIELDS = ("timings", "outbox", "relay_daily")
+
+_upload_lock = threading.Lock()
+_last_delivered_at = 0.0
+
+# timer.py output lines that change every run; ignored when deciding whether
+# script_output_lines changed (they still go up whenever the array is sent)
+VOLATILE_LINE_PREFIXES = ("Current local time:",)
+
+def field_digest(name, value) -> str:
+    if name in ("script_output_lines", "stdout_lines") and isinstance(value, list):
+        value = [v for v in value if not str(v).startswith(VOLATILE_LINE_PREFIXES)]
+    blob = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+def load_fingerprint() -> dict:
+    try:
+        return state_store.get("upload_fingerprint") or {}
+    except Exception:
+        return {}
+
+def save_fingerprint(fp: dict) -> None:
+    # Unchanged fingerprint (heartbeat-only upload) -> no local write at all
+    state_store.put("upload_fingerprint", fp)
+
+def plan_upload(doc: dict, fp: dict, now: float):
+    """
+    Decide what to send. Returns (kind, update_mask, digests) where kind is
+    "full" / "delta" / "heartbeat" and update_mask is None for a full PATCH.
+    """
+    digests = {
+        k: field_digest(k, v) for k, v in doc.items() if k not in HEARTBEAT_FIELDS and k not in PASSIVE_FIELDS
+    }
+    always = list(HEARTBEAT_FIELDS) + [k for k in PASSIVE_FIELDS if k in doc]
+
+    if (
+        not fp
+        or fp.get("device_id") != doc.get("device_id")
+        or now - float(fp.get("last_full_sync", 0)) >= FULL_SYNC_SECONDS
+    ):
+        return "full", None, digests
+
+    last = fp.get("fields", {})
+    changed = [k for k, d in digests.items() if last.get(k) != d]
+    # Fields that vanished from the status must be cleared too
+    changed += [k for k in last if k not in digests]
+    if changed:
+        return "delta", always + changed, digests
+    return "heartbeat", always, digests
+
+def build_doc(status: dict, device_id: str) -> dict:
     output_lines = status.get("stdout_lines") or status.get("script_output_lines", [])
-
-    firestore_uploaded_at = datetime.now(timezone.utc).isoformat()
     local_last_updated = status.get("last_updated")
 
-    # NEW: override mode from status JSON (set by status_test.py)
-    override_mode = status.get("override_mode", "auto")
-
-    payload = to_firestore_fields({
+    return {
         "device_id": device_id,
         "reported_hostname": socket.gethostname(),
 
@@ -81,7 +102,7 @@ def main():
         "return_code": status.get("return_code"),
 
         "last_updated": local_last_updated,
-        "firestore_uploaded_at": firestore_uploaded_at,
+        "firestore_uploaded_at": datetime.now(timezone.utc).isoformat(),
         "local_last_updated": local_last_updated,
 
         "script_output_lines": output_lines,
@@ -90,25 +111,96 @@ def main():
         "error": status.get("error"),
 
         # NEW: so dashboard can show/highlight active override without extra reads
-        "override_mode": override_mode,
-    })
-
-    resp = requests.patch(
-        url,
-        headers={"Authorization": f"Bearer {token}"},
-        json=payload,
-        timeout=15,
-    )
-
-    print("HTTP", resp.status_code)
-    if 200 <= resp.status_code < 300:
-        print("✅ Uploaded status for", device_id)
-        print("   override_mode:", override_mode)
-        print("   local_last_updated:   ", local_last_updated)
-        print("   firestore_uploaded_at:", firestore_uploaded_at)
+        # (override mode from status JSON, set by status_test.py)
+        "override_mode": status.get("override_mode", "auto"),
+        "relay_write": status.get("relay_write"),
+        "channels": status.get("channels", []),
+        "timings": lpi_timing.summary(),
+        "outbox": outbox.stats(),
+        "relay_daily": status.get("relay_daily", []),
+    }
+
+def upload(only_if_changed: bool = False, out=print, status: dict = None) -> dict:
+    """
+    Send the local status through the outbox. Returns {"kind", "delivered", "sent",
+    "dropped"} with kind full / delta / heartbeat, or "skipped" / "error"; sent lists
+    every document the commit delivered (the status and whatever else was queued),
+    dropped the writes Firestore rejected ({doc name: error status}, see outbox.flush).
+    only_if_changed: skip a heartbeat-only upload within HEARTBEAT_SECONDS of the last
+    delivered one (lpi_pipeline.py calls this every tick).
+    out: where report lines go (print, or e.g. a list's append to print them later).
+    """
+    global _last_delivered_at
+
+    if not firestore_client.has_credentials():
+        out("❌ Missing service account file:", SERVICE_ACCOUNT_FILE)
+        return {"kind": "error", "delivered": False, "sent": [], "dropped": {}}
+
+    if os.path.exists(ID_FILE):
+        with open(ID_FILE) as f:
+            device_id = f.read().strip() or socket.gethostname()
+    else:
+        device_id = socket.gethostname()
+
+    if status is None:
+        status = state_store.get("status")
+    if status is None:
+        if not os.path.exists(LOCAL_STATUS_PATH):
+            out("❌ No local status file at", LOCAL_STATUS_PATH)
+            return {"kind": "error", "delivered": False, "sent": [], "dropped": {}}
+        with open(LOCAL_STATUS_PATH, "r") as f:
+            status = json.load(f)
+
+    doc = build_doc(status, device_id)
+
+    with _upload_lock:
+        now = time.time()
+        fp = load_fingerprint()
+        kind, update_mask, digests = plan_upload(doc, fp, now)
+        if only_if_changed and kind == "heartbeat" and now - _last_delivered_at < HEARTBEAT_SECONDS:
+            return {"kind": "skipped", "delivered": False, "sent": [], "dropped": {}}
+
+        if update_mask is None:
+            payload = to_firestore_fields(doc)
+        else:
+            # Masked fields missing from the body are deleted by Firestore (that's what we want
+            # for vanished fields)
+            payload = to_firestore_fields({k: doc[k] for k in update_mask if k in doc})
+
+        outbox.enqueue(COLLECTION, device_id, payload["fields"], update_mask=update_mask)
+        result = outbox.flush(out=out)
+
+        if firestore_client.document_name(COLLECTION, device_id) not in result["delivered"]:
+            out("❌ Upload failed:", result["error"] or "not sent")
+            out("   queued in outbox (depth", f"{result['depth']}), retried with backoff")
+            return {"kind": kind, "delivered": False, "sent": result["delivered"], "dropped": result["dropped"]}
+
+        _last_delivered_at = now
+        save_fingerprint({
+            "device_id": device_id,
+            "fields": digests,
+            "last_full_sync": now if kind == "full" else fp.get("last_full_sync", 0),
+        })
+
+    out("✅ Uploaded status for", device_id)
+    if kind == "delta":
+        out("   upload: delta", [k for k in update_mask if k not in HEARTBEAT_FIELDS and k not in PASSIVE_FIELDS])
     else:
-        print("❌ Upload failed")
-        print(resp.text)
+        out("   upload:", kind)
+    out("   override_mode:", doc["override_mode"])
+    out("   local_last_updated:   ", doc["local_last_updated"])
+    out("   firestore_uploaded_at:", doc["firestore_uploaded_at"])
+    out("   token_cache:", token_cache.stats())
+    if len(result["delivered"]) > 1:
+        out("   outbox: sent", len(result["delivered"]), "queued writes in one commit")
+    return {"kind": kind, "delivered": True, "sent": result["delivered"], "dropped": result["dropped"]}
+
+def main():
+    upload()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--startup-profile" in sys.argv[1:]:
+        import startup_profile
+        sys.exit(startup_profile.main(__file__))
+    with lpi_log.capture("upload"), lpi_timing.run("upload"):
+        main()
\ No newline at end of file
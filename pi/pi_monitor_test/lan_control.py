@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# LPI LAN Control
+# Version: 1.6.0
+# Last updated: 2026-10-17
+#
+# Optional HTTP endpoint for overrides from the local network (shared secret,
+# private addresses only). An override updates the local state, queues the same
+# change for device_commands and waits for the owning loop's relay run.
+#
+#   curl -H "Authorization: Bearer $(sudo cat /home/pi/lpi_lan_secret)" \
+#        -d '{"mode": "force_on"}' http://<pi>:8421/mode
+#
+# Run standalone:  sudo python3 /home/pi/pi_monitor_test/lan_control.py
+#   or in the daemon: LPI_LAN_CONTROL=1 in lpi-daemon.service
+
+import contextlib
+import fcntl
+import hmac
+import ipaddress
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import command_apply
+import firestore_client
+import outbox
+import state_store
+import status_test
+
+import lpi_paths  # noqa: F401
+import lpi_log
+import schedule_engine
+
+SECRET_FILE = "/home/pi/lpi_lan_secret"
+BIND = os.environ.get("LPI_LAN_BIND", "0.0.0.0")
+PORT = int(os.environ.get("LPI_LAN_PORT", "8421"))
+TIMER_LOCK = "/tmp/timer.lock"
+LOCK_WAIT_SECONDS = 2.0
+RUN_WAIT_SECONDS = 5.0
+MAX_BODY_BYTES = 1024
+REQUEST_TIMEOUT_SECONDS = 10   # a client that sends less than its Content-Length
+
+log = lpi_log.get("lan")
+
+
+def load_secret() -> str:
+    secret = os.environ.get("LPI_LAN_SECRET", "").strip()
+    if secret:
+        return secret
+    try:
+        with open(SECRET_FILE, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def client_allowed(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_loopback or ip.is_private or ip.is_link_local
+
+
+@contextlib.contextmanager
+def timer_lock(wait: float = LOCK_WAIT_SECONDS):
+    """The cron/daemon /tmp/timer.lock, waiting up to `wait` seconds; yields whether it was taken."""
+    with open(TIMER_LOCK, "a") as f:
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    yield False
+                    return
+                time.sleep(0.02)
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Ticks:
+    """
+    Handshake between the HTTP threads and the loop that runs status_test.run_status():
+    the loop calls started() / finished(status) around each run, request() wakes it and
+    waits for the result of a run that started after the request. publishes: the loop
+    also sends the outbox after its run (lpi_pipeline.py, lpi_daemon.py's status job).
+    """
+
+    def __init__(self, wake, publishes: bool = True):
+        self._wake = wake
+        self.publishes = publishes
+        self._cond = threading.Condition()
+        self._started = 0
+        self._finished = 0
+        self._status = None
+
+    def started(self) -> None:
+        with self._cond:
+            self._started += 1
+
+    def finished(self, status) -> None:
+        with self._cond:
+            self._finished += 1
+            self._status = status
+            self._cond.notify_all()
+
+    def request(self, timeout: float = RUN_WAIT_SECONDS):
+        """Status of the next run, or None if none finished within timeout."""
+        with self._cond:
+            want = self._started + 1
+        self._wake()
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._finished >= want, timeout):
+                return None
+            return self._status
+
+
+def local_runner() -> Ticks:
+    """Standalone: one worker thread runs the status (under /tmp/timer.lock) for the HTTP threads."""
+    woken = threading.Event()
+    ticks = Ticks(woken.set, publishes=False)
+
+    def run():
+        while True:
+            woken.wait()
+            woken.clear()
+            with timer_lock() as got:
+                if not got:
+                    continue
+                ticks.started()
+                status = None
+                try:
+                    status = status_test.run_status(None, flush_outbox=False, out=lpi_log.printer("status"))
+                except Exception as e:
+                    log.error("status run failed", error=f"{type(e).__name__}: {e}")
+                finally:
+                    ticks.finished(status)
+
+    threading.Thread(target=run, daemon=True).start()
+    return ticks
+
+
+# ---------------- Override ----------------
+def channel_names() -> list:
+    if not schedule_engine.configured():
+        return []
+    return [ch.name for ch in schedule_engine.load_channels()]
+
+
+def apply_local(device_id: str, mode: str, channel: str = None) -> None:
+    """Same local state command_apply.py would write for this Firestore change."""
+    if channel is None:
+        command_apply.apply_mode(device_id, mode, lpi_log.printer("lan"))
+        return
+    modes = {name: ov.get("mode", "auto") for name, ov in (state_store.get("channel_overrides") or {}).items()}
+    if mode == "auto":
+        modes.pop(channel, None)
+    else:
+        modes[channel] = mode
+    command_apply.apply_channel_modes(device_id, modes, lpi_log.printer("lan"))
+
+
+def queue_write_back(device_id: str, mode: str, channel: str = None) -> None:
+    if not firestore_client.has_credentials():
+        return
+    fields = {
+        "updated_at": {"stringValue": datetime.now(timezone.utc).isoformat()},
+        "updated_by": {"stringValue": "lan_control"},
+    }
+    if channel is None:
+        fields["mode"] = {"stringValue": mode}
+        mask = ["mode", "updated_at", "updated_by"]
+    else:
+        # auto drops channel_modes.<channel> (masked but absent = deleted), like patch_channel_revert
+        if mode != "auto":
+            fields["channel_modes"] = {"mapValue": {"fields": {channel: {"stringValue": mode}}}}
+        mask = [f"channel_modes.{channel}", "updated_at", "updated_by"]
+    outbox.enqueue(command_apply.COMMANDS_COLLECTION, device_id, fields, update_mask=mask,
+                   priority=outbox.PRIORITY_HIGH, version_key=command_apply.POLL_KEY)
+
+
+def flush_in_background() -> None:
+    def run():
+        try:
+            r = outbox.flush(out=lpi_log.printer("lan"))
+            if r["attempted"] and r["error"]:
+                log.warning("write-back queued, flush failed", error=r["error"], depth=r["depth"])
+        except Exception as e:
+            log.warning("write-back flush exception", error=str(e))
+        lpi_log.flush("lan")
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def relay_states(status: dict) -> dict:
+    return {ch.get("name"): ch.get("on") for ch in (status or {}).get("channels", [])}
+
+
+def set_mode(device_id: str, mode: str, channel: str = None, ticks: Ticks = None):
+    """Apply an override now (through ticks' loop). Returns (HTTP status, response body)."""
+    t0 = time.perf_counter()
+    apply_local(device_id, mode, channel)
+    try:
+        # Queued before the run, so lpi_pipeline.py's publish sends it with the new status
+        queue_write_back(device_id, mode, channel)
+    except Exception as e:
+        log.warning("write-back not queued", error=str(e))
+    status = ticks.request() if ticks is not None else None
+    if ticks is None or not ticks.publishes:
+        flush_in_background()
+    if status is None:
+        return 202, {"ok": True, "mode": mode, "channel": channel, "applied": False}
+    return 200, {
+        "ok": True,
+        "mode": mode,
+        "channel": channel,
+        "applied": True,
+        "relay": relay_states(status),
+        "applied_ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
+
+
+# ---------------- HTTP ----------------
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = REQUEST_TIMEOUT_SECONDS
+    device_id = None
+    secret = ""
+    ticks = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: dict) -> None:
+        blob = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(blob)))
+        self.end_headers()
+        self.wfile.write(blob)
+
+    def _authorized(self) -> bool:
+        if not client_allowed(self.client_address[0]):
+            self._send(403, {"ok": False, "error": "not a LAN address"})
+            return False
+        given = (self.headers.get("Authorization") or "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(given.encode("utf-8"), self.secret.encode("utf-8")):
+            log.warning("rejected request: bad secret", client=self.client_address[0], path=self.path)
+            lpi_log.flush("lan")
+            self._send(401, {"ok": False, "error": "bad secret"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path != "/status":
+            return self._send(404, {"ok": False, "error": "not found"})
+        snap = state_store.snapshot(["override", "channel_overrides", "status"])
+        self._send(200, {
+            "ok": True,
+            "device_id": self.device_id,
+            "override": snap.get("override") or {},
+            "channel_overrides": snap.get("channel_overrides") or {},
+            "relay": relay_states(snap.get("status")),
+            "last_updated": (snap.get("status") or {}).get("last_updated"),
+        })
+
+    def do_POST(self):
+        raw = (self.headers.get("Content-Length") or "0").strip()
+        if not (raw.isascii() and raw.isdigit()):
+            # Unreadable length: the rest of the stream can't be framed, so drop the connection
+            self.close_connection = True
+            return self._send(400, {"ok": False, "error": "bad Content-Length"})
+        length = int(raw)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            return self._send(413, {"ok": False, "error": "body too large"})
+        body = self.rfile.read(length) if length else b""
+        if not self._authorized():
+            return
+        if self.path != "/mode":
+            return self._send(404, {"ok": False, "error": "not found"})
+        try:
+            req = json.loads(body or b"{}")
+            mode = str(req.get("mode", "")).strip().lower()
+            channel = req.get("channel")
+        except (ValueError, AttributeError):
+            return self._send(400, {"ok": False, "error": "expected a JSON object"})
+        if mode not in command_apply.VALID_MODES:
+            return self._send(400, {"ok": False, "error": f"mode must be one of {sorted(command_apply.VALID_MODES)}"})
+        if channel is not None and not schedule_engine.configured() and channel == schedule_engine.DEFAULT_CHANNEL.name:
+            channel = None   # single-channel setup: "main" is the global mode
+        if channel is not None and channel not in channel_names():
+            return self._send(400, {"ok": False, "error": f"unknown channel {channel!r}"})
+
+        try:
+            status, out = set_mode(self.device_id, mode, channel, self.ticks)
+        except Exception as e:
+            log.error("override failed", mode=mode, channel=channel, error=f"{type(e).__name__}: {e}")
+            lpi_log.flush("lan")
+            return self._send(500, {"ok": False, "error": f"{type(e).__name__}: {e}"})
+        log.info(f"override {mode}" + (f" [{channel}]" if channel else ""), client=self.client_address[0],
+                 applied=out["applied"], relay=out.get("relay"), ms=out.get("applied_ms"))
+        lpi_log.flush("lan")
+        self._send(status, out)
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def make_server(device_id: str, secret: str, ticks: Ticks = None, bind: str = BIND, port: int = PORT) -> Server:
+    handler = type("LanHandler", (Handler,), {"device_id": device_id, "secret": secret,
+                                              "ticks": ticks or local_runner()})
+    return Server((bind, port), handler)
+
+
+def start(device_id: str, ticks: Ticks = None):
+    """
+    Serve in a daemon thread (lpi_daemon.py / lpi_pipeline.py, passing the Ticks their
+    loop reports to); None without a secret.
+    """
+    secret = load_secret()
+    if not secret:
+        print("❌ LAN control not started: no secret in", SECRET_FILE, "or LPI_LAN_SECRET")
+        return None
+    server = make_server(device_id, secret, ticks)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"LAN control listening on {BIND}:{PORT}")
+    return server
+
+
+def main():
+    secret = load_secret()
+    if not secret:
+        print("❌ No secret: put one in", SECRET_FILE, "(chmod 600) or set LPI_LAN_SECRET")
+        return 1
+    server = make_server(command_apply.get_device_id(), secret)
+    print(f"LAN control listening on {BIND}:{PORT}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    if "--startup-profile" in sys.argv[1:]:
+        import startup_profile
+        sys.exit(startup_profile.main(__file__))
+    sys.exit(main())
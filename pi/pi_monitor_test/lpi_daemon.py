@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# LPI Daemon
+# Version: 1.11.0
+# Last updated: 2026-10-17
+#
+# One resident process that replaces the cron lines from install.sh: command_apply,
+# status_test and firestore_upload_status on their slots, output to lpi_log.py rings.
+# LPI_COMMAND_LISTEN=1 adds the listen stream, LPI_LAN_CONTROL=1 the LAN endpoint,
+# LPI_PIPELINE=1 hands over to lpi_pipeline.py.
+#
+# Run under systemd (scripts/lpi-daemon.service) or by hand:
+#   sudo python3 /home/pi/pi_monitor_test/lpi_daemon.py
+
+import contextlib
+import fcntl
+import os
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+
+import command_apply
+import status_test
+import firestore_upload_status
+
+import lpi_paths  # noqa: F401
+import lpi_log
+import lpi_timing
+
+COMMAND_LISTEN = os.environ.get("LPI_COMMAND_LISTEN", "0") == "1"
+PIPELINE = os.environ.get("LPI_PIPELINE", "0") == "1"
+LAN_CONTROL = os.environ.get("LPI_LAN_CONTROL", "0") == "1"
+
+
+def poll_commands():
+    if COMMAND_LISTEN and command_apply.listening():
+        return
+    command_apply.main()
+
+
+# (name = log component, entry point, seconds past the minute, lock file)
+JOBS = [
+    ("command", poll_commands, (0, 15, 30, 45), "/tmp/cmd.lock"),
+    ("status", status_test.main, (10, 25, 40, 55), "/tmp/timer.lock"),
+    ("upload", firestore_upload_status.main, (20,), "/tmp/upload.lock"),
+]
+
+
+def next_run(now: float, seconds) -> float:
+    """Next wall-clock time (epoch) strictly after now that lands on one of the given seconds."""
+    minute = now - (now % 60)
+    for base in (minute, minute + 60):
+        for s in sorted(seconds):
+            t = base + s
+            if t > now:
+                return t
+    return minute + 120  # unreachable with a non-empty seconds tuple
+
+
+@contextlib.contextmanager
+def job_lock(path: str):
+    """Non-blocking flock, same semantics as `flock -n` in the old cron lines."""
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def run_job(name, fn, lock_path, ticks=None) -> None:
+    """ticks: lan_control.Ticks to report this run (and its result) to."""
+    with job_lock(lock_path) as got:
+        if not got:
+            print(f"[{name}] skipped: {lock_path} held by another run")
+            return
+        if ticks is not None:
+            ticks.started()
+        result = None
+        try:
+            with lpi_log.capture(name), lpi_timing.run(name, startup=False):
+                try:
+                    result = fn()
+                except Exception:
+                    traceback.print_exc()
+        finally:
+            if ticks is not None:
+                ticks.finished(result)
+
+
+def main():
+    if PIPELINE:
+        import lpi_pipeline
+        return lpi_pipeline.main()
+    print("LPI daemon started:", datetime.now().isoformat())
+    if COMMAND_LISTEN and command_apply.firestore_client.has_credentials() and command_apply.listen_configured():
+        device_id = command_apply.get_device_id()
+        threading.Thread(target=command_apply.listen_forever, args=(device_id,), daemon=True).start()
+        print("Command listen stream enabled for", device_id)
+    woken = threading.Event()
+    ticks = None
+    if LAN_CONTROL:
+        import lan_control
+        ticks = lan_control.Ticks(woken.set)
+        lan_control.start(command_apply.get_device_id(), ticks)
+    schedule = {name: next_run(time.time(), secs) for name, _, secs, _ in JOBS}
+
+    while True:
+        name = min(schedule, key=schedule.get)
+        delay = schedule[name] - time.time()
+        if woken.wait(max(0.0, delay)):
+            woken.clear()
+            name = "status"     # LAN override waiting for its relay run
+
+        for job_name, fn, secs, lock_path in JOBS:
+            if job_name == name:
+                run_job(job_name, fn, lock_path, ticks if job_name == "status" else None)
+                # A slow run skips the slots it overlapped, like flock -n did under cron
+                schedule[job_name] = next_run(time.time(), secs)
+                break
+
+
+if __name__ == "__main__":
+    if "--startup-profile" in sys.argv[1:]:
+        import startup_profile
+        sys.exit(startup_profile.main(__file__))
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
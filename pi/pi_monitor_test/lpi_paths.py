@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+# LPI Paths
+# Version: 1.0.0
+# Last updated: 2026-10-17
+#
+# Puts LPI_HOME (/home/pi on the device, pi/ in the repo) on sys.path so the
+# monitor scripts can import timer.py, relay.py, lpi_log.py, ...
+#   import lpi_paths  # noqa: F401
+
+import os
+import sys
+
+LPI_HOME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if LPI_HOME not in sys.path:
+    sys.path.insert(0, LPI_HOME)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# LPI Pipeline
+# Version: 1.10.0
+# Last updated: 2026-10-17
+#
+# asyncio take on lpi_daemon.py's three jobs: every tick evaluates the timer and sets
+# the relay (status_test.run_status); the command read and the uploads run in a
+# background task the tick never waits on, so a slow or hung Firestore call can't
+# delay the relay. A changed command doc (read, pushed or from lan_control.py) wakes
+# the loop for another relay pass. Output goes to the "pipeline" log ring.
+#
+# Sleep mode (LPI_PIPELINE_SLEEP=1 or --sleep): tick only when the relay, a command
+# read, an outbox retry or a heartbeat is due (status_test.next_transition).
+#
+# Run:  sudo python3 /home/pi/pi_monitor_test/lpi_pipeline.py [--sleep]
+#   or: LPI_PIPELINE=1 in lpi-daemon.service (lpi_daemon.py hands over to this)
+
+import asyncio
+import contextlib
+import os
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+
+import command_apply
+import firestore_client
+import firestore_upload_status
+import outbox
+import relay_history
+import state_store
+import status_test
+from lpi_daemon import COMMAND_LISTEN, LAN_CONTROL, job_lock, next_run
+
+import lpi_paths  # noqa: F401
+import lpi_log
+import lpi_timing
+
+TICK_SECONDS = (0, 15, 30, 45)
+SLEEP_MODE = os.environ.get("LPI_PIPELINE_SLEEP", "0") == "1" or "--sleep" in sys.argv[1:]
+SLEEP_HEARTBEAT_SECONDS = int(os.environ.get("LPI_SLEEP_HEARTBEAT_SECONDS", "900"))
+TIMER_LOCK_FILE = "/tmp/timer.lock"
+NETWORK_LOCK_FILES = ("/tmp/cmd.lock", "/tmp/upload.lock")
+
+lan_ticks = None        # lan_control.Ticks with LPI_LAN_CONTROL=1
+revert_pending = False  # a tick queued an auto-revert the network task hasn't reported yet
+out = lpi_log.printer("pipeline")   # the tick and the network task log here, never via sys.stdout
+
+
+async def _fetch(device_id: str):
+    if COMMAND_LISTEN and command_apply.listening():
+        return None
+    return await asyncio.to_thread(command_apply.fetch, device_id)
+
+
+async def _upload():
+    return await asyncio.to_thread(firestore_upload_status.upload, True, out)
+
+
+async def tick(device_id: str, publish: asyncio.Event) -> dict:
+    """One relay pass: evaluate and set the relay, then ask the network task to publish."""
+    global revert_pending
+    # Whatever mode is in effect locally (a waiting LAN override gets this run)
+    if lan_ticks is not None:
+        lan_ticks.started()
+    status = None
+    try:
+        status = await asyncio.to_thread(status_test.run_status, None, False, out)
+    finally:
+        if lan_ticks is not None:
+            lan_ticks.finished(status)
+    revert_pending = revert_pending or status_test.revert_queued
+    publish.set()
+    return status
+
+
+async def publish_once(device_id: str, wake: asyncio.Event) -> None:
+    """Command read || upload of the latest status, then apply a changed doc and wake the tick."""
+    global revert_pending
+    with contextlib.ExitStack() as locks:
+        if not all(locks.enter_context(job_lock(p)) for p in NETWORK_LOCK_FILES):
+            out("[pipeline] publish skipped: a cron/daemon job holds one of", ", ".join(NETWORK_LOCK_FILES))
+            return
+        revert, revert_pending = revert_pending, False
+        fetch_task = asyncio.create_task(_fetch(device_id))
+        try:
+            published = await _upload()
+        except Exception as e:
+            published = {"delivered": False}
+            out("❌ Upload exception:", e)
+        if revert:
+            status_test.report_revert(device_id, published, out)
+        if not published["delivered"]:
+            r = await asyncio.to_thread(outbox.flush, out=out)
+            if r["attempted"] and r["error"]:
+                out("WARN: outbox flush failed, writes stay queued (depth", f"{r['depth']}):", r["error"])
+        try:
+            fetched = await fetch_task
+        except Exception as e:
+            fetched = None
+            out("❌ Failed reading Firestore mode:", e)
+        if fetched is not None and await asyncio.to_thread(command_apply.settle, device_id, *fetched, out=out):
+            # Re-evaluate the relay now; that tick asks for the next publish
+            wake.set()
+
+
+async def network(device_id: str, publish: asyncio.Event, wake: asyncio.Event) -> None:
+    """Background task: one publish per request, never awaited by the tick (a hung call only delays this)."""
+    while True:
+        await publish.wait()
+        publish.clear()
+        if not firestore_client.has_credentials():
+            continue
+        try:
+            with lpi_timing.stage("publish"):
+                await publish_once(device_id, wake)
+        except Exception:
+            out(traceback.format_exc())
+        lpi_log.flush("pipeline")
+
+
+def next_wake(now: float, online: bool):
+    """Sleep mode: (epoch, reason) of the next tick."""
+    wakes = [(now + SLEEP_HEARTBEAT_SECONDS, "heartbeat")]
+    try:
+        t, reason = status_test.next_transition()
+        if t is not None:
+            wakes.append((t.timestamp(), reason))
+            relay_history.hold_until(t.timestamp())
+    except Exception as e:
+        print("WARN: next_transition failed, falling back to the 15 s tick:", e)
+        wakes.append((next_run(now, TICK_SECONDS), "tick"))
+    if online:
+        if not (COMMAND_LISTEN and command_apply.listening()):
+            poll = state_store.get(command_apply.POLL_KEY) or {}
+            wakes.append((float(poll.get("next_poll_at", now)), "command read"))
+        if outbox.depth():
+            wakes.append((float(state_store.get(outbox.META_KEY, {}).get("next_attempt_at", now)), "outbox retry"))
+    return min(wakes)
+
+
+async def run_forever() -> None:
+    device_id = command_apply.get_device_id()
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+
+    if COMMAND_LISTEN and firestore_client.has_credentials() and command_apply.listen_configured():
+        threading.Thread(
+            target=command_apply.listen_forever,
+            args=(device_id,),
+            kwargs={"on_change": lambda: loop.call_soon_threadsafe(wake.set)},
+            daemon=True,
+        ).start()
+        print("Command listen stream enabled for", device_id)
+    if LAN_CONTROL:
+        import lan_control
+        global lan_ticks
+        lan_ticks = lan_control.Ticks(lambda: loop.call_soon_threadsafe(wake.set))
+        lan_control.start(device_id, lan_ticks)
+
+    publish = asyncio.Event()
+    network_task = asyncio.create_task(network(device_id, publish, wake))
+    last_tick = 0.0
+    while True:
+        now = time.time()
+        if SLEEP_MODE:
+            target, reason = next_wake(now, firestore_client.has_credentials())
+            # Something still due right after a tick (e.g. a revert that failed) mustn't spin
+            target = max(target, last_tick + 1.0)
+            print(f"[pipeline] sleeping {max(0.0, target - now):.1f}s until {reason}")
+        else:
+            target = next_run(now, TICK_SECONDS)
+        # asyncio's monotonic timer can fire a hair early; never tick before the target
+        while not wake.is_set() and time.time() < target:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(wake.wait(), target - time.time())
+        wake.clear()
+        last_tick = time.time()
+        if network_task.done():
+            network_task = asyncio.create_task(network(device_id, publish, wake))
+
+        with job_lock(TIMER_LOCK_FILE) as got:
+            if not got:
+                print("[pipeline] skipped: a cron/daemon job holds", TIMER_LOCK_FILE)
+                continue
+            with lpi_timing.run("pipeline", startup=False):
+                try:
+                    await tick(device_id, publish)
+                except Exception:
+                    out(traceback.format_exc())
+            lpi_log.flush("pipeline")
+
+
+def main():
+    print("LPI pipeline started:", datetime.now().isoformat())
+    try:
+        asyncio.run(run_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    if "--startup-profile" in sys.argv[1:]:
+        import startup_profile
+        sys.exit(startup_profile.main(__file__))
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# LPI Firestore Outbox
+# Version: 1.8.0
+# Last updated: 2026-10-17
+#
+# Durable queue for every Firestore write the device makes (table "outbox" in
+# lpi_state.db), so a Wi-Fi drop delays a write instead of losing it. Writes to the
+# same document are coalesced; flush() sends them all in one documents:commit, with
+# backoff after a failure.
+#
+#   sudo python3 outbox.py            # queue + stats
+#   sudo python3 outbox.py --flush    # flush now
+
+import contextlib
+import copy
+import fcntl
+import json
+import random
+import sys
+import time
+
+import firestore_client
+import state_store
+
+META_KEY = "outbox"
+LOCK_FILE = "/tmp/lpi_outbox.lock"
+
+MAX_ENTRIES = 100
+MAX_BYTES = 512 * 1024
+COMMIT_MAX_WRITES = 500         # Firestore limit per commit
+BACKOFF_MIN_SECONDS = 15
+BACKOFF_MAX_SECONDS = 900
+PERMANENT_STATUSES = (400, 403, 404, 409)
+ERROR_MAX_CHARS = 200           # last_error goes into the status document
+
+PRIORITY_NORMAL = 0
+PRIORITY_HIGH = 1               # auto-revert: evicted last
+
+
+def _db():
+    c = state_store.connection()
+    c.execute(
+        "CREATE TABLE IF NOT EXISTS outbox ("
+        " seq INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, write TEXT NOT NULL,"
+        " bytes INTEGER NOT NULL, priority INTEGER NOT NULL, enqueued_at REAL NOT NULL)"
+    )
+    return c
+
+
+# ---- Coalescing (Firestore-encoded fields, dotted field paths) ----
+def _get_path(fields: dict, path: str):
+    parts = path.split(".")
+    cur = fields
+    for part in parts[:-1]:
+        v = cur.get(part)
+        if not v or "mapValue" not in v:
+            return None
+        cur = v["mapValue"].get("fields", {})
+    return cur.get(parts[-1])
+
+
+def _set_path(fields: dict, path: str, value) -> None:
+    """Set (or, with value None, delete) the value at a field path."""
+    parts = path.split(".")
+    cur = fields
+    for part in parts[:-1]:
+        v = cur.get(part)
+        if not v or "mapValue" not in v:
+            if value is None:
+                return
+            v = cur[part] = {"mapValue": {"fields": {}}}
+        cur = v["mapValue"].setdefault("fields", {})
+    if value is None:
+        cur.pop(parts[-1], None)
+    else:
+        cur[parts[-1]] = value
+
+
+def _normalize_mask(paths) -> list:
+    """Drop duplicates and paths already covered by a parent path in the mask."""
+    paths = list(dict.fromkeys(paths))
+    return [p for p in paths if not any(p.startswith(q + ".") for q in paths if q != p)]
+
+
+def coalesce(old: dict, new: dict) -> dict:
+    """One write equivalent to applying old, then new ({"fields", "mask"}; mask None = full)."""
+    if new.get("mask") is None:
+        return _carry({"fields": copy.deepcopy(new.get("fields") or {}), "mask": None}, old, new)
+    fields = copy.deepcopy(old.get("fields") or {})
+    for path in new["mask"]:
+        _set_path(fields, path, copy.deepcopy(_get_path(new.get("fields") or {}, path)))
+    mask = None if old.get("mask") is None else _normalize_mask(list(old["mask"]) + list(new["mask"]))
+    return _carry({"fields": fields, "mask": mask}, old, new)
+
+
+def _carry(merged: dict, old: dict, new: dict) -> dict:
+    """
+    Precondition of the first guarded write (old guards the document as it was before
+    it; an unguarded old must not drop new's guard), newest version_key.
+    """
+    precondition = old.get("precondition") or new.get("precondition")
+    if precondition:
+        merged["precondition"] = precondition
+    if new.get("version_key") or old.get("version_key"):
+        merged["version_key"] = new.get("version_key") or old.get("version_key")
+    return merged
+
+
+# ---- Queue ----
+def _meta() -> dict:
+    return state_store.get(META_KEY) or {}
+
+
+def _count_dropped(n: int) -> None:
+    state_store.update(META_KEY, lambda m: {**(m or {}), "dropped": int((m or {}).get("dropped", 0)) + n}, default={})
+
+
+def enqueue(collection: str, doc_id: str, fields: dict, update_mask=None, priority: int = PRIORITY_NORMAL,
+            precondition: dict = None, version_key: str = None) -> None:
+    """
+    Queue a write (patch_document semantics), coalesced with any queued write to the same doc.
+    precondition: Firestore currentDocument, e.g. {"updateTime": t}.
+    version_key: state key whose "update_time" gets the updateTime this write produces.
+    """
+    name = firestore_client.document_name(collection, doc_id)
+    write = {"fields": fields, "mask": list(update_mask) if update_mask is not None else None}
+    if precondition:
+        write["precondition"] = dict(precondition)
+    if version_key:
+        write["version_key"] = version_key
+    now = time.time()
+    c = _db()
+    evicted = 0
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        # Coalesced on every enqueue, so there is at most one queued row per document
+        row = c.execute(
+            "SELECT seq, write, priority, enqueued_at FROM outbox WHERE name = ?", (name,)
+        ).fetchone()
+        enqueued_at = now
+        if row:
+            write = coalesce(json.loads(row[1]), write)
+            priority = max(priority, row[2])
+            enqueued_at = row[3]
+            c.execute("DELETE FROM outbox WHERE seq = ?", (row[0],))
+        blob = json.dumps(write, separators=(",", ":"))
+        c.execute(
+            "INSERT INTO outbox (name, write, bytes, priority, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+            (name, blob, len(blob), priority, enqueued_at),
+        )
+        while True:
+            count, total = c.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM outbox").fetchone()
+            if count <= MAX_ENTRIES and total <= MAX_BYTES:
+                break
+            victim = c.execute("SELECT seq, name FROM outbox ORDER BY priority, seq LIMIT 1").fetchone()
+            c.execute("DELETE FROM outbox WHERE seq = ?", (victim[0],))
+            print("WARN: outbox full, dropped queued write for", victim[1].rsplit("/documents/", 1)[-1])
+            evicted += 1
+        c.execute("COMMIT")
+    except Exception:
+        c.execute("ROLLBACK")
+        raise
+    if evicted:
+        _count_dropped(evicted)
+
+
+def pending() -> list:
+    """[(seq, name, write, priority, enqueued_at)] oldest first."""
+    rows = _db().execute("SELECT seq, name, write, priority, enqueued_at FROM outbox ORDER BY seq").fetchall()
+    return [(seq, name, json.loads(w), prio, at) for seq, name, w, prio, at in rows]
+
+
+def _delete(seqs) -> None:
+    seqs = list(seqs)
+    if seqs:
+        c = _db()
+        c.execute(f"DELETE FROM outbox WHERE seq IN ({','.join('?' * len(seqs))})", seqs)
+
+
+def _as_write(name: str, write: dict) -> dict:
+    w = {"update": {"name": name, "fields": write["fields"]}}
+    if write.get("mask") is not None:
+        w["updateMask"] = {"fieldPaths": write["mask"]}
+    if write.get("precondition"):
+        w["currentDocument"] = write["precondition"]
+    return w
+
+
+def _record_versions(rows, response) -> None:
+    """Hand each delivered write's new updateTime to its version_key."""
+    try:
+        results = response.json().get("writeResults") or []
+    except Exception:
+        return
+    for (_, _, w, _, _), res in zip(rows, results):
+        key, update_time = w.get("version_key"), (res or {}).get("updateTime")
+        if key and update_time:
+            state_store.update(key, lambda v: {**(v or {}), "update_time": update_time}, default={})
+
+
+def _error_status(r) -> str:
+    """Firestore's error status (e.g. FAILED_PRECONDITION), else "HTTP <code>"."""
+    try:
+        return r.json().get("error", {}).get("status") or f"HTTP {r.status_code}"
+    except Exception:
+        return f"HTTP {r.status_code}"
+
+
+def _error_text(r) -> str:
+    try:
+        return f"HTTP {r.status_code}: {r.json().get('error', {}).get('message', '')}".strip()
+    except Exception:
+        return f"HTTP {r.status_code}"
+
+
+@contextlib.contextmanager
+def _flush_lock():
+    with open(LOCK_FILE, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _commit_rows(rows, timeout: float, out=print):
+    """Commit rows; returns (delivered names, {dropped name: error status}, error or None)."""
+    r = firestore_client.commit([_as_write(name, w) for _, name, w, _, _ in rows], timeout=timeout)
+    if 200 <= r.status_code < 300:
+        _delete(seq for seq, *_ in rows)
+        _record_versions(rows, r)
+        return [name for _, name, *_ in rows], {}, None
+    if r.status_code in PERMANENT_STATUSES and len(rows) > 1:
+        # One bad write fails the whole batch; find it instead of blocking the queue
+        delivered, dropped, error = [], {}, None
+        for row in rows:
+            d, x, e = _commit_rows([row], timeout, out)
+            delivered += d
+            dropped.update(x)
+            error = error or e
+        return delivered, dropped, error
+    if r.status_code in PERMANENT_STATUSES:
+        _delete([rows[0][0]])
+        out("❌ Firestore rejected queued write for", rows[0][1].rsplit("/documents/", 1)[-1], "-", _error_text(r))
+        return [], {rows[0][1]: _error_status(r)}, None
+    return [], {}, _error_text(r)
+
+
+def flush(force: bool = False, timeout: float = 15, out=print) -> dict:
+    """
+    Send the queue in one documents:commit if it's due (or force). Returns
+    {"attempted", "delivered": [doc names], "dropped": {doc name: error status},
+    "error", "depth"}.
+    """
+    result = {"attempted": False, "delivered": [], "dropped": {}, "error": None, "depth": None}
+    meta = _meta()
+    now = time.time()
+    if not force and now < float(meta.get("next_attempt_at", 0)):
+        result["depth"] = depth()
+        return result
+
+    with _flush_lock() as got:
+        rows = pending()[:COMMIT_MAX_WRITES] if got else []
+        if not rows:
+            result["depth"] = depth()
+            return result
+        result["attempted"] = True
+        try:
+            delivered, dropped, error = _commit_rows(rows, timeout, out)
+        except Exception as e:
+            delivered, dropped, error = [], {}, f"{type(e).__name__}: {e}"
+        error = error[:ERROR_MAX_CHARS] if error else None
+
+        def bookkeeping(m):
+            m = dict(m or {})
+            m["dropped"] = int(m.get("dropped", 0)) + len(dropped)
+            if error:
+                m["failures"] = int(m.get("failures", 0)) + 1
+                delay = min(BACKOFF_MAX_SECONDS, BACKOFF_MIN_SECONDS * 2 ** (m["failures"] - 1))
+                m.update(next_attempt_at=now + delay * random.uniform(0.5, 1.0), last_error=error)
+            else:
+                m.update(failures=0, next_attempt_at=0, last_error=None, last_flush_at=now)
+            return m
+
+        state_store.update(META_KEY, bookkeeping, default={})
+
+    result.update(delivered=delivered, dropped=dropped, error=error, depth=depth())
+    return result
+
+
+def has_pending(collection: str, doc_id: str) -> bool:
+    """True while a write to this document is still queued (local state is ahead of Firestore)."""
+    name = firestore_client.document_name(collection, doc_id)
+    return _db().execute("SELECT 1 FROM outbox WHERE name = ? LIMIT 1", (name,)).fetchone() is not None
+
+
+def pending_write(collection: str, doc_id: str):
+    """(write, enqueued_at) of the write queued for this document, or None."""
+    name = firestore_client.document_name(collection, doc_id)
+    row = _db().execute("SELECT write, enqueued_at FROM outbox WHERE name = ?", (name,)).fetchone()
+    return (json.loads(row[0]), row[1]) if row else None
+
+
+def depth() -> int:
+    return _db().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+
+def stats() -> dict:
+    count, total, oldest = _db().execute(
+        "SELECT COUNT(*), COALESCE(SUM(bytes), 0), MIN(enqueued_at) FROM outbox"
+    ).fetchone()
+    meta = _meta()
+    return {
+        "depth": count,
+        "bytes": total,
+        # a timestamp, not an age: the stats go into every status and mustn't change each run
+        "oldest_enqueued_at": int(oldest) if oldest else None,
+        "failures": int(meta.get("failures", 0)),
+        "dropped": int(meta.get("dropped", 0)),
+        "last_error": meta.get("last_error"),
+    }
+
+
+def main():
+    if "--flush" in sys.argv[1:]:
+        r = flush(force=True)
+        if r["error"]:
+            print("❌ Flush failed:", r["error"])
+        else:
+            print("✅ Flushed", len(r["delivered"]), "write(s)")
+    print("Outbox:", json.dumps(stats()))
+    for seq, name, w, prio, at in pending():
+        mask = "full" if w.get("mask") is None else ",".join(w["mask"])
+        print(f"  #{seq} {name.rsplit('/documents/', 1)[-1]} prio {prio} "
+              f"queued {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(at))} [{mask}]")
+
+
+if __name__ == "__main__":
+    main()
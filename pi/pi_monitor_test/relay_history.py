@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# LPI Relay History
+# Version: 1.2.0
+# Last updated: 2026-10-17
+#
+# Relay transitions per channel with their cause, plus daily on-time / flip counts
+# (tables in lpi_state.db). Only daily() goes to Firestore as "relay_daily".
+#
+#   python3 relay_history.py              # daily table
+#   python3 relay_history.py --events     # + recent transitions
+
+import datetime as dt
+import json
+import os
+import sqlite3
+import sys
+import time
+from array import array
+from bisect import bisect_left
+
+import state_store
+
+CAUSES = ("timer", "force_on", "force_off", "auto-revert")
+
+RETENTION_DAYS = int(os.environ.get("LPI_HISTORY_DAYS", "35"))
+MAX_EVENTS = 4096              # per channel (~20 KB)
+MAX_GAP_SECONDS = 300          # status runs every 15-60 s
+UPLOAD_DAYS = 7
+
+_migrated = set()       # databases whose relay_history has the steady_until column
+
+
+def _db():
+    c = state_store.connection()
+    c.execute(
+        "CREATE TABLE IF NOT EXISTS relay_history ("
+        " channel TEXT PRIMARY KEY, times BLOB NOT NULL, codes BLOB NOT NULL,"
+        " last_state INTEGER, last_ts REAL, steady_until REAL)"
+    )
+    if state_store.STATE_DB not in _migrated:
+        try:
+            c.execute("ALTER TABLE relay_history ADD COLUMN steady_until REAL")
+        except sqlite3.OperationalError:
+            pass            # already there
+        _migrated.add(state_store.STATE_DB)
+    c.execute(
+        "CREATE TABLE IF NOT EXISTS relay_daily ("
+        " channel TEXT NOT NULL, day TEXT NOT NULL, on_seconds REAL NOT NULL,"
+        " flips INTEGER NOT NULL, causes TEXT NOT NULL, PRIMARY KEY (channel, day))"
+    )
+    return c
+
+
+# ---- Local days ----
+def _local(ts: float, tz) -> dt.datetime:
+    return dt.datetime.fromtimestamp(ts, tz) if tz is not None else dt.datetime.fromtimestamp(ts)
+
+
+def _midnight_after(ts: float, tz) -> float:
+    naive = dt.datetime.combine(_local(ts, tz).date() + dt.timedelta(days=1), dt.time())
+    if tz is None:
+        return naive.timestamp()
+    localize = getattr(tz, "localize", None)   # pytz zones
+    return (localize(naive) if localize else naive.replace(tzinfo=tz)).timestamp()
+
+
+def _split_days(start: float, end: float, tz):
+    """[(local day iso, seconds)] covering start..end."""
+    out = []
+    while start < end:
+        cut = min(end, _midnight_after(start, tz))
+        out.append((_local(start, tz).date().isoformat(), cut - start))
+        start = cut
+    return out
+
+
+# ---- Packed events ----
+def _unpack(row):
+    times, codes = array("I"), array("B")
+    if row:
+        times.frombytes(row[0])
+        codes.frombytes(row[1])
+    return times, codes
+
+
+def _encode(on: bool, cause: str) -> int:
+    return int(bool(on)) | CAUSES.index(cause) << 1
+
+
+def _decode(code: int):
+    return bool(code & 1), CAUSES[code >> 1]
+
+
+def _add_daily(c, channel: str, day: str, seconds: float = 0.0, cause: str = None) -> None:
+    row = c.execute(
+        "SELECT on_seconds, flips, causes FROM relay_daily WHERE channel = ? AND day = ?", (channel, day)
+    ).fetchone()
+    on_seconds, flips, causes = (row[0], row[1], json.loads(row[2])) if row else (0.0, 0, {})
+    on_seconds += seconds
+    if cause:
+        flips += 1
+        causes[cause] = causes.get(cause, 0) + 1
+    c.execute(
+        "INSERT INTO relay_daily (channel, day, on_seconds, flips, causes) VALUES (?, ?, ?, ?, ?)"
+        " ON CONFLICT(channel, day) DO UPDATE SET on_seconds = excluded.on_seconds,"
+        " flips = excluded.flips, causes = excluded.causes",
+        (channel, day, on_seconds, flips, json.dumps(causes, sort_keys=True)),
+    )
+
+
+def record(states, now: float = None, tz=None) -> list:
+    """
+    Record one run's relay states: [(channel, on, cause)]. on None (line not driven)
+    is skipped. Returns the transitions recorded: [(channel, on, cause)].
+    """
+    now = time.time() if now is None else now
+    horizon = now - RETENTION_DAYS * 86400
+    transitions = []
+    c = _db()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        for channel, on, cause in states:
+            if on is None:
+                continue
+            cause = cause if cause in CAUSES else "timer"
+            row = c.execute(
+                "SELECT times, codes, last_state, last_ts, steady_until FROM relay_history WHERE channel = ?",
+                (channel,),
+            ).fetchone()
+            times, codes = _unpack(row)
+            last_state, last_ts, steady_until = (row[2], row[3], row[4]) if row else (None, None, None)
+
+            if last_state and last_ts is not None and now > last_ts:
+                known = max(last_ts + MAX_GAP_SECONDS, steady_until or 0)
+                for day, seconds in _split_days(last_ts, min(now, known), tz):
+                    _add_daily(c, channel, day, seconds)
+
+            if last_state is None or bool(last_state) != bool(on):
+                times.append(int(now))
+                codes.append(_encode(on, cause))
+                transitions.append((channel, bool(on), cause))
+                if last_state is not None:
+                    _add_daily(c, channel, _local(now, tz).date().isoformat(), cause=cause)
+
+            keep = max(bisect_left(times, int(horizon)), len(times) - MAX_EVENTS)
+            if keep > 0:
+                del times[:keep]
+                del codes[:keep]
+            c.execute(
+                "INSERT INTO relay_history (channel, times, codes, last_state, last_ts, steady_until)"
+                " VALUES (?, ?, ?, ?, ?, NULL)"
+                " ON CONFLICT(channel) DO UPDATE SET times = excluded.times, codes = excluded.codes,"
+                " last_state = excluded.last_state, last_ts = excluded.last_ts, steady_until = NULL",
+                (channel, times.tobytes(), codes.tobytes(), int(bool(on)), now),
+            )
+        c.execute("DELETE FROM relay_daily WHERE day < ?", (_local(horizon, tz).date().isoformat(),))
+        c.execute("COMMIT")
+    except Exception:
+        c.execute("ROLLBACK")
+        raise
+    return transitions
+
+
+def hold_until(until: float) -> None:
+    """
+    No relay change is due before `until` (epoch seconds): the gap from each channel's
+    last recorded run up to then counts in full at the next record().
+    """
+    _db().execute("UPDATE relay_history SET steady_until = ?", (until,))
+
+
+def events(channel: str = None, since: float = 0) -> list:
+    """[(epoch seconds, channel, on, cause)] oldest first."""
+    rows = _db().execute("SELECT channel, times, codes FROM relay_history ORDER BY channel").fetchall()
+    out = []
+    for name, t, k in rows:
+        if channel is not None and name != channel:
+            continue
+        times, codes = _unpack((t, k))
+        for i in range(bisect_left(times, int(since)), len(times)):
+            out.append((times[i], name, *_decode(codes[i])))
+    out.sort()
+    return out
+
+
+def daily(days: int = UPLOAD_DAYS, now: float = None, tz=None) -> list:
+    """
+    The last `days` local days (today included), oldest first:
+    [{"date", "channel", "on_hours", "flips", "causes": {cause: flips}}].
+    """
+    now = time.time() if now is None else now
+    first = (_local(now, tz).date() - dt.timedelta(days=days - 1)).isoformat()
+    rows = _db().execute(
+        "SELECT day, channel, on_seconds, flips, causes FROM relay_daily WHERE day >= ? ORDER BY day, channel",
+        (first,),
+    ).fetchall()
+    return [
+        {"date": day, "channel": channel, "on_hours": round(on_seconds / 3600, 2), "flips": flips,
+         "causes": json.loads(causes)}
+        for day, channel, on_seconds, flips, causes in rows
+    ]
+
+
+def main():
+    print(f"{'date':<11} {'channel':<10} {'on h':>6} {'flips':>5}  causes")
+    for d in daily(RETENTION_DAYS):
+        causes = ", ".join(f"{k} {v}" for k, v in sorted(d["causes"].items()))
+        print(f"{d['date']:<11} {d['channel']:<10} {d['on_hours']:>6.2f} {d['flips']:>5}  {causes}")
+    if "--events" in sys.argv[1:]:
+        print()
+        for ts, channel, on, cause in events(since=time.time() - 7 * 86400):
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))} {channel:<10} "
+                  f"{'ON ' if on else 'OFF'} {cause}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# LPI State Store
+# Version: 1.4.0
+# Last updated: 2026-10-17
+#
+# One local store (/home/pi/lpi_state.db, SQLite WAL) for the override state, the
+# status snapshot, timings and outbox bookkeeping. The old files (override_mode.txt,
+# override_state.json, pi_status.json) are still exported, atomically and only when
+# their content changes.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+STATE_DB = "/home/pi/lpi_state.db"
+
+OVERRIDE_FILE = "/home/pi/override_mode.txt"
+STATE_FILE = "/home/pi/override_state.json"
+STATUS_FILE = "/home/pi/pi_status.json"
+
+VOLATILE_FIELDS = {"status": ("timings", "relay_daily")}
+REFRESH_SECONDS = 900
+
+_local = threading.local()
+
+
+def _conn() -> sqlite3.Connection:
+    c = getattr(_local, "conn", None)
+    if c is None or getattr(_local, "path", None) != STATE_DB:
+        c = sqlite3.connect(STATE_DB, timeout=10, isolation_level=None)
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("PRAGMA synchronous=NORMAL")
+        c.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        _local.conn = c
+        _local.path = STATE_DB
+    return c
+
+
+def connection() -> sqlite3.Connection:
+    """This thread's connection, for modules keeping their own tables in the same DB (outbox.py)."""
+    return _conn()
+
+
+def _encode(value) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+
+def _settled(key: str, value, row, now: float) -> bool:
+    """True if the stored row differs from value only in the key's volatile fields and is recent."""
+    volatile = VOLATILE_FIELDS.get(key)
+    if not volatile or not isinstance(value, dict) or now - row[1] >= REFRESH_SECONDS:
+        return False
+    try:
+        old = json.loads(row[0])
+    except ValueError:
+        return False
+    if not isinstance(old, dict):
+        return False
+    strip = lambda d: {k: v for k, v in d.items() if k not in volatile}
+    return strip(old) == strip(value)
+
+
+def put_many(values: dict) -> list:
+    """Write several keys in one transaction. Returns the keys that actually changed."""
+    c = _conn()
+    changed = []
+    now = time.time()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        for key, value in values.items():
+            blob = _encode(value)
+            row = c.execute("SELECT value, updated_at FROM kv WHERE key = ?", (key,)).fetchone()
+            if row and (row[0] == blob or _settled(key, value, row, now)):
+                continue
+            c.execute(
+                "INSERT INTO kv (key, value, updated_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                (key, blob, now),
+            )
+            changed.append(key)
+        c.execute("COMMIT")
+    except Exception:
+        c.execute("ROLLBACK")
+        raise
+    if changed:
+        export_legacy(changed)
+    return changed
+
+
+def update(key: str, fn, default=None):
+    """
+    Read-modify-write one key in a single transaction: fn(current value or default)
+    returns the new value. Concurrent writers serialize instead of losing updates.
+    """
+    c = _conn()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        row = c.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        value = fn(json.loads(row[0]) if row else default)
+        blob = _encode(value)
+        changed = not (row and row[0] == blob)
+        if changed:
+            c.execute(
+                "INSERT INTO kv (key, value, updated_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                (key, blob, time.time()),
+            )
+        c.execute("COMMIT")
+    except Exception:
+        c.execute("ROLLBACK")
+        raise
+    if changed:
+        export_legacy([key])
+    return value
+
+
+def put(key: str, value) -> bool:
+    """Write one key; False (and no disk write) if the value is unchanged."""
+    return bool(put_many({key: value}))
+
+
+def snapshot(keys=None) -> dict:
+    """Consistent read of several keys (all keys if None)."""
+    c = _conn()
+    c.execute("BEGIN")
+    try:
+        if keys is None:
+            rows = c.execute("SELECT key, value FROM kv").fetchall()
+        else:
+            keys = list(keys)
+            marks = ",".join("?" * len(keys))
+            rows = c.execute(f"SELECT key, value FROM kv WHERE key IN ({marks})", keys).fetchall()
+    finally:
+        c.execute("COMMIT")
+    return {k: json.loads(v) for k, v in rows}
+
+
+def get(key: str, default=None):
+    return snapshot([key]).get(key, default)
+
+
+# ---- Override state (with migration from the legacy files) ----
+def get_override() -> dict:
+    v = get("override")
+    if v is not None:
+        return v
+    # First run after upgrade: adopt what command_apply.py / install.sh left on disk
+    legacy = {}
+    try:
+        with open(STATE_FILE, "r") as f:
+            legacy = json.load(f) or {}
+    except Exception:
+        pass
+    if not legacy.get("mode"):
+        try:
+            with open(OVERRIDE_FILE, "r") as f:
+                legacy["mode"] = f.read().strip().lower()
+        except Exception:
+            return {}
+    return {"mode": legacy.get("mode", "auto"), "set_at_local": legacy.get("set_at_local")}
+
+
+def set_override(mode: str, set_at_local: str) -> bool:
+    return put("override", {"mode": mode, "set_at_local": set_at_local})
+
+
+# ---- Compatibility export ----
+def write_if_changed(path: str, data: str) -> bool:
+    """Atomically replace path with data unless it already holds exactly that."""
+    try:
+        with open(path, "r") as f:
+            if f.read() == data:
+                return False
+    except Exception:
+        pass
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "w") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return True
+
+
+def export_legacy(keys=("override", "status")) -> None:
+    snap = snapshot([k for k in keys if k in ("override", "status")])
+    try:
+        if "override" in snap:
+            o = snap["override"]
+            write_if_changed(OVERRIDE_FILE, o.get("mode", "auto") + "\n")
+            write_if_changed(STATE_FILE, json.dumps({"mode": o.get("mode", "auto"), "set_at_local": o.get("set_at_local")}))
+        if "status" in snap:
+            write_if_changed(STATUS_FILE, json.dumps(snap["status"]))
+    except OSError as e:
+        print("WARN: legacy state export failed:", e)
+
+
+if __name__ == "__main__":
+    print(json.dumps(snapshot(), indent=2, sort_keys=True))
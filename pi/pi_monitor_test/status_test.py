@@ -1,43 +1,50 @@
 #!/usr/bin/env python3
 # LPI Status Test (Override-aware + Auto-Revert)
-# Version: 1.2.0
-# Last updated: 2026-01-27
+# Version: 1.25.0
+# Last updated: 2026-10-17
+#
+# Evaluates the timer for every channel, sets the relay, ends an expired override
+# (auto-revert: device_commands reset + status in one documents:commit through the
+# outbox) and saves the status snapshot (state_store.py, exported to pi_status.json).
+# run_status() is what cron, lpi_daemon.py and lpi_pipeline.py all call.
+#
+#   sudo python3 status_test.py            # one run
+#   python3 status_test.py --next          # next relay change (next_transition)
 
-import subprocess
 import socket
-import json
 import os
+import sys
+import traceback
 import datetime as dt
 from datetime import datetime, timezone
 
-import requests
 import pytz
-from astral.sun import sun
-from astral import LocationInfo
-from google.oauth2 import service_account
-import google.auth.transport.requests
 
-hostname = socket.gethostname()
+import command_apply
+import firestore_client
+import outbox
+import relay_history
+import state_store
 
-TIMER_CMD = ["/usr/bin/python3", "/home/pi/timer.py"]
-LIGHTON_CMD = ["/usr/bin/python3", "/home/pi/lighton.py"]
-LIGHTOFF_CMD = ["/usr/bin/python3", "/home/pi/lightoff.py"]
+import lpi_paths  # noqa: F401
+import lpi_log
+import lpi_timing
+import relay
+import timer
+import schedule_engine
+import schedule_table
 
-OUTPUT_PATH = "/home/pi/pi_status.json"
+hostname = socket.gethostname()
 
-# Override state files written by command_apply.py
-OVERRIDE_FILE = "/home/pi/override_mode.txt"
-STATE_FILE = "/home/pi/override_state.json"
+OUTPUT_PATH = state_store.STATUS_FILE
 
 # Firestore command doc (to clear mode back to auto)
-SERVICE_ACCOUNT_FILE = "/home/pi/lpi_monitor.json"
-PROJECT_ID = "lpi-monitor"
 COMMANDS_COLLECTION = "device_commands"
 ID_FILE = "/home/pi/device_id.txt"
 
-# Must match timer intent
-LIGHT_OFF_HOUR = 1  # 1:00 AM local
-city = LocationInfo("Rochester", "USA", "America/New_York", 43.2086, -77.4623)
+# Shared with timer.py now that it runs in-process (no more copy to keep in sync)
+LIGHT_OFF_HOUR = timer.LIGHT_OFF_HOUR
+city = timer.city
 
 
 def get_device_id() -> str:
@@ -52,45 +59,41 @@ def get_device_id() -> str:
     return socket.gethostname()
 
 
-def run_and_capture(cmd):
-    return subprocess.run(cmd, capture_output=True, text=True, timeout=55)
+def run_in_process(fn, *args):
+    """
+    Run fn(*args, out=...) collecting its output, returning (returncode, stdout, stderr)
+    like the old subprocess call did. A raised exception becomes returncode 1
+    with its traceback on stderr.
+    """
+    lines = []
+    try:
+        fn(*args, out=lambda *a: lines.append(" ".join(str(x) for x in a)))
+    except Exception:
+        return 1, "\n".join(lines), traceback.format_exc()
+    return 0, "\n".join(lines), ""
+
 
+safe_localize = timer.safe_localize
 
-def safe_localize(tz, naive_dt):
-    try:
-        return tz.localize(naive_dt, is_dst=None)
-    except pytz.AmbiguousTimeError:
-        return tz.localize(naive_dt, is_dst=False)
-    except pytz.NonExistentTimeError:
-        bumped = naive_dt + dt.timedelta(hours=1)
-        return tz.localize(bumped, is_dst=None)
+revert_queued = False   # an auto-revert write was queued during this run_status()
+reverted_channels = set()   # channels whose own override auto-reverted this run
 
 
-def read_override_mode() -> str:
-    if not os.path.exists(OVERRIDE_FILE):
-        return "auto"
-    try:
-        with open(OVERRIDE_FILE, "r") as f:
-            v = f.read().strip().lower()
-        if v in ("force_on", "force_off", "auto"):
-            return v
-    except Exception:
-        pass
+def read_override_mode(override: dict) -> str:
+    v = (override.get("mode") or "auto").strip().lower()
+    if v in ("force_on", "force_off", "auto"):
+        return v
     return "auto"
 
 
-def read_set_at_local(now_local: dt.datetime) -> dt.datetime:
+def read_set_at_local(now_local: dt.datetime, override: dict) -> dt.datetime:
     """
-    Read when the override was set (local time). If missing, fall back to "now"
+    When the override was set (local time). If missing, fall back to "now"
     (so we won't accidentally auto-revert immediately).
     """
     tz = now_local.tzinfo
-    if not os.path.exists(STATE_FILE):
-        return now_local
     try:
-        with open(STATE_FILE, "r") as f:
-            state = json.load(f)
-        iso = state.get("set_at_local")
+        iso = override.get("set_at_local")
         if not iso:
             return now_local
         d = dt.datetime.fromisoformat(iso)
@@ -102,63 +105,124 @@ def read_set_at_local(now_local: dt.datetime) -> dt.datetime:
         return now_local
 
 
-def write_override_mode(mode: str) -> None:
+def write_override_mode(mode: str, out=print) -> None:
     mode = (mode or "auto").strip().lower()
     if mode not in ("force_on", "force_off", "auto"):
         mode = "auto"
-    with open(OVERRIDE_FILE, "w") as f:
-        f.write(mode + "\n")
-    # also keep state file consistent
     try:
-        with open(STATE_FILE, "w") as f:
-            json.dump({"mode": mode, "set_at_local": datetime.now().isoformat()}, f)
-    except Exception:
-        pass
+        state_store.set_override(mode, datetime.now().isoformat())
+    except Exception as e:
+        out("WARN: override state write failed:", e)
 
 
-def get_token() -> str:
-    creds = service_account.Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE,
-        scopes=["https://www.googleapis.com/auth/datastore"],
-    )
-    req = google.auth.transport.requests.Request()
-    creds.refresh(req)
-    return creds.token
+def command_precondition() -> dict:
+    """Firestore precondition: the command doc is still the version the override came from."""
+    try:
+        update_time = (state_store.get(command_apply.POLL_KEY) or {}).get("update_time")
+    except Exception:
+        update_time = None
+    return {"updateTime": update_time} if update_time else None
 
 
-def patch_command_mode(device_id: str, mode: str) -> None:
-    if not os.path.exists(SERVICE_ACCOUNT_FILE):
+def patch_command_mode(device_id: str, mode: str, out=print) -> None:
+    global revert_queued
+    if not firestore_client.has_credentials():
         return
 
-    token = get_token()
-    url = (
-        f"https://firestore.googleapis.com/v1/projects/{PROJECT_ID}/databases/(default)"
-        f"/documents/{COMMANDS_COLLECTION}/{device_id}"
-    )
-
     now_utc = datetime.now(timezone.utc).isoformat()
 
-    payload = {
-        "fields": {
-            "mode": {"stringValue": mode},
-            "updated_at": {"stringValue": now_utc},
-            "updated_by": {"stringValue": "auto_revert"},
-        }
+    fields = {
+        "mode": {"stringValue": mode},
+        "updated_at": {"stringValue": now_utc},
+        "updated_by": {"stringValue": "auto_revert"},
     }
-    params = {"updateMask.fieldPaths": ["mode", "updated_at", "updated_by"]}
 
     try:
-        r = requests.patch(
-            url,
-            headers={"Authorization": f"Bearer {token}"},
-            params=params,
-            json=payload,
-            timeout=15,
+        outbox.enqueue(
+            COMMANDS_COLLECTION,
+            device_id,
+            fields,
+            update_mask=["mode", "updated_at", "updated_by"],
+            priority=outbox.PRIORITY_HIGH,
+            precondition=command_precondition(),
+            version_key=command_apply.POLL_KEY,
         )
-        if not (200 <= r.status_code < 300):
-            print("WARN: auto_revert PATCH failed:", r.status_code, r.text)
+        revert_queued = True
     except Exception as e:
-        print("WARN: auto_revert PATCH exception:", e)
+        out("WARN: auto_revert write exception:", e)
+
+
+def patch_channel_revert(device_id: str, channel: str, out=print) -> None:
+    """Drop channel_modes.<channel> from the command doc (the channel follows mode again)."""
+    global revert_queued
+    if not firestore_client.has_credentials():
+        return
+
+    fields = {
+        "updated_at": {"stringValue": datetime.now(timezone.utc).isoformat()},
+        "updated_by": {"stringValue": "auto_revert"},
+    }
+    try:
+        # A masked field path missing from the body is deleted
+        outbox.enqueue(
+            COMMANDS_COLLECTION,
+            device_id,
+            fields,
+            update_mask=[f"channel_modes.{channel}", "updated_at", "updated_by"],
+            priority=outbox.PRIORITY_HIGH,
+            precondition=command_precondition(),
+            version_key=command_apply.POLL_KEY,
+        )
+        revert_queued = True
+    except Exception as e:
+        out("WARN: channel auto_revert write exception:", e)
+
+
+def _hhmm(iso) -> str:
+    """"HH:MM" of an ISO instant; "-" for None (a rules channel with no window ahead)."""
+    return iso[11:16] if iso else "-"
+
+
+def run_channels(channels, global_mode: str, device_id: str, now_local: dt.datetime, out=print):
+    """
+    Multi-channel pass: per-channel auto-revert, then one schedule_engine evaluation
+    and relay update for every channel. Returns (decisions, output lines).
+    """
+    solar = schedule_engine.SolarCache()
+    lines = []
+    try:
+        channel_overrides = dict(state_store.get("channel_overrides") or {})
+    except Exception:
+        channel_overrides = {}
+
+    modes = {}
+    for ch in channels:
+        ov = channel_overrides.get(ch.name)
+        if not ov:
+            modes[ch.name] = global_mode
+            continue
+        mode = read_override_mode(ov)
+        cutoff = solar.revert_cutoff(ch, mode, read_set_at_local(now_local, ov))
+        if cutoff is not None and now_local >= cutoff:
+            del channel_overrides[ch.name]
+            patch_channel_revert(device_id, ch.name, out)
+            reverted_channels.add(ch.name)
+            lines.append(f"AUTO-REVERT [{ch.name}]: {mode} ended ({cutoff.strftime('%Y-%m-%d %H:%M:%S')})")
+            mode = global_mode
+        modes[ch.name] = mode
+
+    state_store.put("channel_overrides", channel_overrides)
+
+    decisions = schedule_engine.apply(schedule_engine.evaluate(channels, modes, now_local, solar))
+    lines.append("===== CHANNELS =====")
+    for d in decisions:
+        lines.append(
+            f"{d['name']:<10} pin {d['pin']:<2} {d['mode']:<9} "
+            f"on {_hhmm(d['lighton'])} off {_hhmm(d['lightoff'])} -> "
+            f"{'ON' if d['on'] else 'OFF'}{'' if d['relay_write'] else ' (no write)'}"
+        )
+    lines.append("====================")
+    return decisions, lines
 
 
 def first_off_after(set_at_local: dt.datetime) -> dt.datetime:
@@ -180,8 +244,8 @@ def first_lighton_after(set_at_local: dt.datetime) -> dt.datetime:
     tz = pytz.timezone(city.timezone)
 
     def lighton_for_date(d: dt.date) -> dt.datetime:
-        s = sun(city.observer, date=d, tzinfo=tz)
-        return s["sunset"] - dt.timedelta(hours=1)
+        sunset_local, _ = schedule_table.day_times(city, LIGHT_OFF_HOUR, d, tz, safe_localize)
+        return sunset_local - dt.timedelta(hours=1)
 
     cand = lighton_for_date(set_at_local.date())
     if set_at_local < cand:
@@ -189,90 +253,284 @@ def first_lighton_after(set_at_local: dt.datetime) -> dt.datetime:
     return lighton_for_date(set_at_local.date() + dt.timedelta(days=1))
 
 
-# ---------------- Main ----------------
-local_tz = pytz.timezone(city.timezone)
-now_local = dt.datetime.now(local_tz)
+def relay_cause(channel_state: dict, global_reverted: bool) -> str:
+    """relay_history cause for a channel's state this run."""
+    mode = channel_state.get("mode")
+    if mode in ("force_on", "force_off"):
+        return mode
+    if global_reverted or channel_state.get("name") in reverted_channels:
+        return "auto-revert"
+    return "timer"
 
-status = {
-    "hostname": hostname,
-    "last_updated": datetime.now().isoformat(),
-}
 
-mode = read_override_mode()
-set_at_local = read_set_at_local(now_local)
-device_id = get_device_id()
+def revert_outcome(device_id: str, published: dict) -> str:
+    """
+    What became of the queued auto-revert write, from a status upload's result
+    (firestore_upload_status.upload(): "sent", "dropped"):
+      with_status  delivered in that commit
+      rejected     precondition failed: a newer command is in Firestore
+      dropped      Firestore refused it for another reason
+      queued       still in the outbox
+      elsewhere    left the outbox outside that commit (another process's flush, eviction)
+    """
+    name = firestore_client.document_name(COMMANDS_COLLECTION, device_id)
+    if name in published.get("sent", []):
+        return "with_status"
+    error = (published.get("dropped") or {}).get(name)
+    if error == "FAILED_PRECONDITION":
+        return "rejected"
+    if error:
+        return "dropped"
+    if outbox.has_pending(COMMANDS_COLLECTION, device_id):
+        return "queued"
+    return "elsewhere"
+
+
+def report_revert(device_id: str, published: dict, out=print) -> str:
+    """Report the auto-revert outcome after a status upload (out: print-like); returns it."""
+    outcome = revert_outcome(device_id, published)
+    delivered = published.get("delivered")
+    if outcome == "with_status":
+        out("✅ Auto-revert and status landed together (one commit)" if delivered
+            else "✅ Auto-revert landed; status stays queued in the outbox")
+    elif outcome == "rejected":
+        out("WARN: auto-revert not applied in Firestore: the command doc changed since (newer override wins)")
+    elif outcome == "dropped":
+        out("❌ Auto-revert rejected by Firestore:", published["dropped"][firestore_client.document_name(
+            COMMANDS_COLLECTION, device_id)])
+    elif outcome == "queued":
+        out("WARN: auto-revert" + (" and status" if not delivered else ""),
+            "queued in the outbox, retried with backoff")
+    else:
+        out("WARN: auto-revert left the outbox outside this upload (another flush, or evicted)")
+    return outcome
 
-auto_revert_msg = None
 
-if mode == "force_on":
-    cutoff = first_off_after(set_at_local)
-    if now_local >= cutoff:
-        write_override_mode("auto")
-        patch_command_mode(device_id, "auto")
-        mode = "auto"
-        auto_revert_msg = f"AUTO-REVERT: force_on ended at off-time ({cutoff.strftime('%Y-%m-%d %H:%M:%S')})"
+def publish_revert(status: dict, device_id: str, out=print) -> dict:
+    """Send the queued auto-revert and this status in one documents:commit; report the outcome."""
+    import firestore_upload_status
 
-elif mode == "force_off":
-    cutoff = first_lighton_after(set_at_local)
-    if now_local >= cutoff:
-        write_override_mode("auto")
-        patch_command_mode(device_id, "auto")
-        mode = "auto"
-        auto_revert_msg = f"AUTO-REVERT: force_off ended at on-time ({cutoff.strftime('%Y-%m-%d %H:%M:%S')})"
+    r = firestore_upload_status.upload(status=status, out=out)
+    outcome = report_revert(device_id, r, out)
+    return {"at": datetime.now().isoformat(), "published": outcome, "status_delivered": r["delivered"]}
 
-status["override_mode"] = mode
 
-try:
-    extra_line = [auto_revert_msg] if auto_revert_msg else []
+def next_transition(now_local: dt.datetime = None):
+    """
+    (instant, reason) of the next relay change run_status() would make, from the current
+    override state; instant is now when an auto-revert is already due, None if unknown.
+    """
+    local_tz = pytz.timezone(city.timezone)
+    now_local = dt.datetime.now(local_tz) if now_local is None else now_local.astimezone(local_tz)
+    try:
+        override = state_store.get_override()
+    except Exception:
+        override = {}
+    mode = read_override_mode(override)
+    set_at_local = read_set_at_local(now_local, override)
 
+    candidates = []
     if mode == "force_on":
-        result = run_and_capture(LIGHTON_CMD)
+        candidates.append((first_off_after(set_at_local), "auto-revert of force_on"))
     elif mode == "force_off":
-        result = run_and_capture(LIGHTOFF_CMD)
+        candidates.append((first_lighton_after(set_at_local), "auto-revert of force_off"))
+
+    # Channels that follow a forced global mode change at its cutoff (already a candidate)
+    channels, modes, set_ats = [], {}, {}
+    if schedule_engine.configured():
+        try:
+            channel_overrides = dict(state_store.get("channel_overrides") or {})
+        except Exception:
+            channel_overrides = {}
+        for ch in schedule_engine.load_channels():
+            ov = channel_overrides.get(ch.name)
+            if ov:
+                modes[ch.name] = read_override_mode(ov)
+                set_ats[ch.name] = read_set_at_local(now_local, ov)
+            elif mode == "auto":
+                modes[ch.name] = "auto"
+            else:
+                continue
+            channels.append(ch)
+    elif mode == "auto":
+        channels, modes = [schedule_engine.DEFAULT_CHANNEL], {schedule_engine.DEFAULT_CHANNEL.name: "auto"}
+
+    t, name = schedule_engine.next_transition(channels, modes, set_ats, now_local)
+    if t is not None:
+        candidates.append((t, f"{name}: {'schedule' if modes[name] == 'auto' else modes[name] + ' auto-revert'}"))
+    if not candidates:
+        return None, None
+    t, reason = min(candidates, key=lambda c: c[0])
+    return max(t, now_local), reason
+
+
+# ---------------- Main ----------------
+def run_status(now_local: dt.datetime = None, flush_outbox: bool = True, out=print) -> dict:
+    """One status run; its report goes to out (print-like), not to sys.stdout."""
+    global revert_queued
+    revert_queued = False
+    reverted_channels.clear()
+    local_tz = pytz.timezone(city.timezone)
+    if now_local is None:
+        now_local = dt.datetime.now(local_tz)
     else:
-        result = run_and_capture(TIMER_CMD)
-
-    ok = (result.returncode == 0)
-    stdout_lines = extra_line + result.stdout.splitlines()
-    stderr_lines = result.stderr.splitlines()
-
-    status.update({
-        "online": ok,
-        "return_code": result.returncode,
-        "script_output_lines": stdout_lines,
-        "timer_ok": ok,
-        "stdout_lines": stdout_lines,
-        "stderr_lines": stderr_lines,
-        "error": None if ok else "run_failed",
-    })
-
-except subprocess.TimeoutExpired as e:
-    status.update({
-        "online": False,
-        "timer_ok": False,
-        "return_code": 124,
-        "script_output_lines": (e.stdout.splitlines() if e.stdout else []),
-        "stdout_lines": (e.stdout.splitlines() if e.stdout else []),
-        "stderr_lines": (e.stderr.splitlines() if e.stderr else []),
-        "error": "timeout_expired",
-    })
-
-except Exception as e:
-    status.update({
-        "online": False,
-        "timer_ok": False,
-        "return_code": 1,
-        "script_output_lines": [],
-        "stdout_lines": [],
-        "stderr_lines": [],
-        "error": f"status_test_exception: {type(e).__name__}: {e}",
-    })
-
-with open(OUTPUT_PATH, "w") as f:
-    json.dump(status, f, indent=2)
-
-print("Pi is online ✅" if status.get("online") else "Pi had an error ❌")
-print("Hostname:", hostname)
-print("Override mode:", mode)
-print("Return code:", status.get("return_code"))
-print("Status saved to:", OUTPUT_PATH)
+        now_local = now_local.astimezone(local_tz)
+
+    status = {
+        "hostname": hostname,
+        "last_updated": datetime.now().isoformat(),
+    }
+
+    try:
+        override = state_store.get_override()
+    except Exception:
+        override = {}
+    mode = read_override_mode(override)
+    set_at_local = read_set_at_local(now_local, override)
+    device_id = get_device_id()
+
+    auto_revert_msg = None
+
+    if mode == "force_on":
+        cutoff = first_off_after(set_at_local)
+        if now_local >= cutoff:
+            write_override_mode("auto", out)
+            patch_command_mode(device_id, "auto", out)
+            mode = "auto"
+            auto_revert_msg = f"AUTO-REVERT: force_on ended at off-time ({cutoff.strftime('%Y-%m-%d %H:%M:%S')})"
+
+    elif mode == "force_off":
+        cutoff = first_lighton_after(set_at_local)
+        if now_local >= cutoff:
+            write_override_mode("auto", out)
+            patch_command_mode(device_id, "auto", out)
+            mode = "auto"
+            auto_revert_msg = f"AUTO-REVERT: force_off ended at on-time ({cutoff.strftime('%Y-%m-%d %H:%M:%S')})"
+
+    status["override_mode"] = mode
+
+    try:
+        extra_line = [auto_revert_msg] if auto_revert_msg else []
+        timer.last_relay_write = None
+        timer.last_relay_state = None
+        timer.last_schedule = None
+        channels_state = []
+
+        if schedule_engine.configured():
+            result = {}
+
+            def run_all(out):
+                channels = schedule_engine.load_channels()
+                result["decisions"], result["lines"] = run_channels(channels, mode, device_id, now_local, out)
+                out("\n".join(result["lines"]))
+
+            rc, stdout, stderr = run_in_process(run_all)
+            channels_state = result.get("decisions", [])
+            relay_write = any(d["relay_write"] for d in channels_state) if channels_state else None
+        else:
+            if mode == "force_on":
+                rc, stdout, stderr = run_in_process(timer.force_light, True)
+            elif mode == "force_off":
+                rc, stdout, stderr = run_in_process(timer.force_light, False)
+            else:
+                rc, stdout, stderr = run_in_process(timer.main, now_local)
+            relay_write = timer.last_relay_write
+            channels_state = [{
+                "name": schedule_engine.DEFAULT_CHANNEL.name,
+                "pin": timer.GPIO_PIN,
+                "mode": mode,
+                "on": timer.last_relay_state,
+                "relay_write": relay_write,
+            }]
+            if timer.last_schedule:
+                ref, _, lighton, lightoff = timer.last_schedule
+                channels_state[0].update({
+                    "sunset_date": ref.isoformat(),
+                    "lighton": lighton.replace(microsecond=0).isoformat(),
+                    "lightoff": lightoff.replace(microsecond=0).isoformat(),
+                })
+
+        ok = (rc == 0)
+        stdout_lines = extra_line + stdout.splitlines()
+        stderr_lines = stderr.splitlines()
+
+        status.update({
+            "online": ok,
+            "return_code": rc,
+            "script_output_lines": stdout_lines,
+            "timer_ok": ok,
+            "stdout_lines": stdout_lines,
+            "stderr_lines": stderr_lines,
+            "error": None if ok else "run_failed",
+            "relay_write": relay_write,
+            "channels": channels_state,
+        })
+
+    except Exception as e:
+        status.update({
+            "online": False,
+            "timer_ok": False,
+            "return_code": 1,
+            "script_output_lines": [],
+            "stdout_lines": [],
+            "stderr_lines": [],
+            "error": f"status_test_exception: {type(e).__name__}: {e}",
+        })
+
+    try:
+        states = [
+            (ch["name"], ch.get("on"), relay_cause(ch, auto_revert_msg is not None))
+            for ch in status.get("channels", [])
+        ]
+        relay_history.record(states, now_local.timestamp(), local_tz)
+        status["relay_daily"] = relay_history.daily(now=now_local.timestamp(), tz=local_tz)
+    except Exception as e:
+        out("WARN: relay history exception:", e)
+
+    # Relay is set by now: a fresh auto-revert goes up right away in one commit with this
+    # status; otherwise retry queued writes if due (no-op when nothing is queued)
+    status["timings"] = lpi_timing.summary()
+    try:
+        if flush_outbox and firestore_client.has_credentials():
+            if revert_queued:
+                status["auto_revert"] = publish_revert(status, device_id, out)
+            else:
+                r = outbox.flush()
+                if r["attempted"] and r["error"]:
+                    out("WARN: outbox flush failed, writes stay queued (depth", f"{r['depth']}):", r["error"])
+        status["outbox"] = outbox.stats()
+    except Exception as e:
+        out("WARN: outbox flush exception:", e)
+
+    with lpi_timing.stage("status_write"):
+        state_store.put("status", status)
+
+    out("Pi is online ✅" if status.get("online") else "Pi had an error ❌")
+    out("Hostname:", hostname)
+    out("Override mode:", mode)
+    out("Return code:", status.get("return_code"))
+    out("Relay write:", status.get("relay_write"))
+    out("Status saved to:", OUTPUT_PATH)
+    return status
+
+
+def main():
+    if "--next" in sys.argv[1:]:
+        t, reason = next_transition()
+        print("Next relay change:", t.isoformat() if t else "none scheduled", f"({reason})" if reason else "")
+        return None
+    return run_status()
+
+
+if __name__ == "__main__":
+    if "--startup-profile" in sys.argv[1:]:
+        import startup_profile
+        sys.exit(startup_profile.main(__file__))
+    try:
+        if "--next" not in sys.argv[1:]:
+            relay.require_persistent_outputs()
+    except RuntimeError as e:
+        print("❌", e)
+        sys.exit(1)
+    with lpi_log.capture("status"), lpi_timing.run("status"):
+        main()
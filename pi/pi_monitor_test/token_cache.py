@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# LPI Token Cache
+# Version: 1.2.0
+# Last updated: 2026-10-17
+#
+# Shared OAuth access-token cache (/home/pi/lpi_token_cache.json, 0600), refreshed
+# REFRESH_MARGIN_SECONDS before expiry under an flock.
+#
+#   sudo python3 token_cache.py     # cumulative refreshes
+
+import calendar
+import contextlib
+import fcntl
+import json
+import os
+import time
+
+import lpi_paths  # noqa: F401
+import lpi_timing
+
+SERVICE_ACCOUNT_FILE = "/home/pi/lpi_monitor.json"
+TOKEN_CACHE_FILE = "/home/pi/lpi_token_cache.json"
+LOCK_FILE = TOKEN_CACHE_FILE + ".lock"
+SCOPES = ["https://www.googleapis.com/auth/datastore"]
+
+REFRESH_MARGIN_SECONDS = 300
+
+_stats = {"hits": 0, "misses": 0}
+_memo = {}
+
+
+def stats() -> dict:
+    return dict(_stats)
+
+
+def _source_id(service_account_file: str) -> str:
+    # A replaced key file invalidates the cached token
+    st = os.stat(service_account_file)
+    return f"{service_account_file}:{st.st_mtime_ns}:{st.st_size}"
+
+
+def _valid(entry: dict, source: str, now: float) -> bool:
+    return (
+        bool(entry.get("token"))
+        and entry.get("source") == source
+        and float(entry.get("expires_at", 0)) - REFRESH_MARGIN_SECONDS > now
+    )
+
+
+def _read_cache() -> dict:
+    try:
+        with open(TOKEN_CACHE_FILE, "r") as f:
+            return json.load(f) or {}
+    except Exception:
+        return {}
+
+
+def _write_cache(entry: dict) -> None:
+    tmp = TOKEN_CACHE_FILE + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(entry, f)
+    os.chmod(tmp, 0o600)
+    os.replace(tmp, TOKEN_CACHE_FILE)
+
+
+@contextlib.contextmanager
+def _locked():
+    fd = os.open(LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def _refresh(service_account_file: str):
+    from google.oauth2 import service_account
+    import google.auth.transport.requests
+
+    creds = service_account.Credentials.from_service_account_file(service_account_file, scopes=SCOPES)
+    creds.refresh(google.auth.transport.requests.Request())
+    # creds.expiry is a naive UTC datetime
+    return creds.token, calendar.timegm(creds.expiry.utctimetuple())
+
+
+def get_token(service_account_file: str = SERVICE_ACCOUNT_FILE) -> str:
+    now = time.time()
+    source = _source_id(service_account_file)
+
+    if _valid(_memo, source, now):
+        _stats["hits"] += 1
+        return _memo["token"]
+
+    entry = _read_cache()
+    if not _valid(entry, source, now):
+        with _locked():
+            # Another run may have refreshed while we waited for the lock
+            entry = _read_cache()
+            if not _valid(entry, source, now):
+                with lpi_timing.stage("token_refresh"):
+                    token, expires_at = _refresh(service_account_file)
+                entry = {
+                    "token": token,
+                    "expires_at": expires_at,
+                    "source": source,
+                    "refreshed_at": now,
+                    "refreshes": int(entry.get("refreshes", 0)) + 1,
+                }
+                _write_cache(entry)
+                _stats["misses"] += 1
+                _memo.clear()
+                _memo.update(entry)
+                return token
+
+    _stats["hits"] += 1
+    _memo.clear()
+    _memo.update(entry)
+    return entry["token"]
+
+
+if __name__ == "__main__":
+    entry = _read_cache()
+    if not entry:
+        print("No cached token at", TOKEN_CACHE_FILE)
+    else:
+        left = float(entry.get("expires_at", 0)) - time.time()
+        print("Token cache:", TOKEN_CACHE_FILE)
+        print("   refreshes (token endpoint calls):", entry.get("refreshes", 0))
+        print("   last refresh:", time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry.get("refreshed_at", 0))))
+        print("   expires in:   ", f"{int(left)}s")
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# LPI Relay Driver
+# Version: 1.3.0
+# Last updated: 2026-10-17
+#
+# Relay output on a BCM pin through the Linux GPIO character device (/dev/gpiochip0).
+# set() reads the line back first and writes only when it differs.
+# LPI_RELAY_BACKEND=mock keeps the line state in memory (tests, benchmarks).
+
+import errno
+import fcntl
+import os
+import struct
+
+import lpi_timing
+
+GPIO_CHIP = "/dev/gpiochip0"
+CONSUMER = b"lpi"
+
+# pinctrl-bcm2835 (Pi 1-4) / pinctrl-rp1 (Pi 5)
+PERSIST_PARAMS = (
+    "/sys/module/pinctrl_bcm2835/parameters/persist_gpio_outputs",
+    "/sys/module/pinctrl_rp1/parameters/persist_gpio_outputs",
+)
+
+# ---- GPIO v1 uAPI (linux/gpio.h) ----
+GPIOLINE_FLAG_KERNEL = 1 << 0
+GPIOLINE_FLAG_IS_OUT = 1 << 1
+GPIOHANDLE_REQUEST_OUTPUT = 1 << 1
+
+_LINEINFO = struct.Struct("<II32s32s")                 # gpioline_info
+_HANDLE_REQ = struct.Struct("<64II64B32sIi")            # gpiohandle_request
+_HANDLE_DATA = struct.Struct("<64B")                    # gpiohandle_data
+
+
+def _iowr(nr: int, size: int) -> int:
+    return (3 << 30) | (size << 16) | (0xB4 << 8) | nr
+
+
+GPIO_GET_LINEINFO_IOCTL = _iowr(0x02, _LINEINFO.size)
+GPIO_GET_LINEHANDLE_IOCTL = _iowr(0x03, _HANDLE_REQ.size)
+GPIOHANDLE_GET_LINE_VALUES_IOCTL = _iowr(0x08, _HANDLE_DATA.size)
+GPIOHANDLE_SET_LINE_VALUES_IOCTL = _iowr(0x09, _HANDLE_DATA.size)
+
+
+class RelayBusy(OSError):
+    """The line is requested by another process (normally lpi_daemon.py)."""
+
+
+class ChardevRelay:
+    def __init__(self, pin: int, chip: str = GPIO_CHIP, active_high: bool = True):
+        self.pin = pin
+        self.chip = chip
+        self.active_high = active_high
+        self._handle = None   # fd of our output line handle, once claimed
+
+    def _level(self, on: bool) -> int:
+        return int(on) if self.active_high else int(not on)
+
+    def _line_info(self):
+        """(flags, consumer) of the line."""
+        fd = os.open(self.chip, os.O_RDONLY)
+        try:
+            buf = bytearray(_LINEINFO.pack(self.pin, 0, b"", b""))
+            fcntl.ioctl(fd, GPIO_GET_LINEINFO_IOCTL, buf, True)
+            _, flags, _, consumer = _LINEINFO.unpack(buf)
+            return flags, consumer.split(b"\0", 1)[0].decode(errors="replace")
+        finally:
+            os.close(fd)
+
+    def _request(self, flags: int, default: int = 0) -> int:
+        fd = os.open(self.chip, os.O_RDONLY)
+        try:
+            offsets = [self.pin] + [0] * 63
+            defaults = [default] + [0] * 63
+            buf = bytearray(_HANDLE_REQ.pack(*offsets, flags, *defaults, CONSUMER, 1, -1))
+            fcntl.ioctl(fd, GPIO_GET_LINEHANDLE_IOCTL, buf, True)
+            return _HANDLE_REQ.unpack(buf)[-1]
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _get(handle: int) -> int:
+        buf = bytearray(_HANDLE_DATA.size)
+        fcntl.ioctl(handle, GPIOHANDLE_GET_LINE_VALUES_IOCTL, buf, True)
+        return buf[0]
+
+    def read(self):
+        """True/False if the line is an output driven on/off, None if it isn't driven (or is busy)."""
+        if self._handle is not None:
+            return self._get(self._handle) == self._level(True)
+        try:
+            flags, _ = self._line_info()
+            if not flags & GPIOLINE_FLAG_IS_OUT or flags & GPIOLINE_FLAG_KERNEL:
+                return None
+            # Request "as-is" (no direction flags): reads the level without touching it.
+            # Closing it releases the line again, which is safe where set() is (see top).
+            h = self._request(0)
+        except OSError as e:
+            if e.errno == errno.EBUSY:
+                return None
+            raise
+        try:
+            return self._get(h) == self._level(True)
+        finally:
+            os.close(h)
+
+    @lpi_timing.timed("gpio")
+    def set(self, on: bool) -> bool:
+        """Drive the relay; returns True only if a GPIO write actually happened."""
+        if self.read() == on:
+            return False
+        if self._handle is not None:
+            buf = bytearray(_HANDLE_DATA.pack(self._level(on), *([0] * 63)))
+            fcntl.ioctl(self._handle, GPIOHANDLE_SET_LINE_VALUES_IOCTL, buf, True)
+        else:
+            try:
+                self._handle = self._request(GPIOHANDLE_REQUEST_OUTPUT, self._level(on))
+            except OSError as e:
+                if e.errno != errno.EBUSY:
+                    raise
+                try:
+                    holder = self._line_info()[1] or "another process"
+                except OSError:
+                    holder = "another process"
+                raise RelayBusy(e.errno, f"GPIO {self.pin} is held by {holder}") from None
+        return True
+
+    def close(self) -> None:
+        if self._handle is not None:
+            os.close(self._handle)
+            self._handle = None
+
+
+class MockRelay:
+    """Same interface as ChardevRelay; the line starts undriven (None)."""
+
+    def __init__(self, pin: int, initial=None):
+        self.pin = pin
+        self.state = initial
+        self.writes = 0
+
+    def read(self):
+        return self.state
+
+    @lpi_timing.timed("gpio")
+    def set(self, on: bool) -> bool:
+        if self.state == on:
+            return False
+        self.state = on
+        self.writes += 1
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+_relays = {}
+
+
+def outputs_persist():
+    """persist_gpio_outputs as True/False, or None if this kernel has no such parameter."""
+    for path in PERSIST_PARAMS:
+        try:
+            with open(path) as f:
+                return f.read().strip().upper() in ("Y", "1")
+        except OSError:
+            continue
+    return None
+
+
+def require_persistent_outputs() -> None:
+    """
+    For processes that exit after set(): raise RuntimeError if a released output line
+    would revert to an input (persist_gpio_outputs off), i.e. the relay would drop.
+    """
+    if backend() == "mock":
+        return
+    if outputs_persist() is False:
+        raise RuntimeError(
+            "persist_gpio_outputs is off: a one-shot run would drop the relay on exit. "
+            "Use lpi_daemon.py, or add pinctrl_bcm2835.persist_gpio_outputs=y "
+            "(pinctrl_rp1 on a Pi 5) to /boot/firmware/cmdline.txt"
+        )
+
+
+def backend() -> str:
+    return os.environ.get("LPI_RELAY_BACKEND", "chardev").strip().lower()
+
+
+def get_relay(pin: int):
+    """Process-wide relay for a pin, so a long-running caller keeps holding its line."""
+    if pin not in _relays:
+        _relays[pin] = MockRelay(pin) if backend() == "mock" else ChardevRelay(pin)
+    return _relays[pin]
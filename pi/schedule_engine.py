@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# LPI Schedule Engine
+# Version: 1.6.0
+# Last updated: 2026-10-17
+#
+# N relay channels on one Pi, each with its own pin, location, on-offset and
+# off-hour (optional /home/pi/lpi_channels.json), evaluated in a single pass.
+# Without the file there is one channel, "main", identical to timer.py.
+
+import datetime
+import json
+import os
+import re
+from typing import NamedTuple
+
+import pytz
+
+import relay
+import schedule_rules
+import schedule_table
+import timer
+
+CHANNELS_FILE = "/home/pi/lpi_channels.json"
+VALID_MODES = ("auto", "force_on", "force_off")
+NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")   # usable as a Firestore field path
+
+
+class Channel(NamedTuple):
+    name: str
+    pin: int
+    city: timer.City
+    on_offset_minutes: int = -60
+    off_hour: int = timer.LIGHT_OFF_HOUR
+    rules: tuple = ()
+
+
+DEFAULT_CHANNEL = Channel("main", timer.GPIO_PIN, timer.city, -60, timer.LIGHT_OFF_HOUR)
+
+
+def configured(path: str = None) -> bool:
+    return os.path.exists(path or CHANNELS_FILE)
+
+
+def load_channels(path: str = None) -> list:
+    path = path or CHANNELS_FILE
+    if not configured(path):
+        return [DEFAULT_CHANNEL]
+    with open(path, "r") as f:
+        cfg = json.load(f)
+
+    channels = []
+    for c in cfg.get("channels", []):
+        loc = c.get("location")
+        city = timer.City(
+            loc["name"], loc.get("region", ""), loc["timezone"],
+            float(loc["latitude"]), float(loc["longitude"]),
+        ) if loc else timer.city
+        ch = Channel(
+            name=c["name"],
+            pin=int(c["pin"]),
+            city=city,
+            on_offset_minutes=int(c.get("on_offset_minutes", -60)),
+            off_hour=int(c.get("off_hour", timer.LIGHT_OFF_HOUR)),
+            rules=schedule_rules.validate(c["rules"]) if "rules" in c else (),
+        )
+        if not NAME_RE.match(ch.name):
+            raise ValueError(f"bad channel name {ch.name!r} (letters, digits, _)")
+        if any(x.name == ch.name or x.pin == ch.pin for x in channels):
+            raise ValueError(f"duplicate channel name or pin: {ch.name} / {ch.pin}")
+        channels.append(ch)
+    if not channels:
+        raise ValueError(f"{path}: no channels")
+    return channels
+
+
+def table_path(city, off_hour: int) -> str:
+    """timer.py's own config keeps SCHEDULE_PATH; other locations/off-hours get their own table."""
+    if city == timer.city and off_hour == timer.LIGHT_OFF_HOUR:
+        return schedule_table.SCHEDULE_PATH
+    tag = schedule_table.fingerprint(city, off_hour).hex()[:12]
+    return schedule_table.SCHEDULE_PATH.replace(".bin", f"_{tag}.bin")
+
+
+class SolarCache:
+    """Sunset per (location, date), shared across the channels of one pass."""
+
+    def __init__(self):
+        self._sunsets = {}
+        self._tz = {}
+        self.lookups = 0
+
+    def tz(self, city):
+        if city.timezone not in self._tz:
+            self._tz[city.timezone] = pytz.timezone(city.timezone)
+        return self._tz[city.timezone]
+
+    def sunset(self, ch: Channel, d: datetime.date) -> datetime.datetime:
+        key = (ch.city, d)
+        if key not in self._sunsets:
+            self.lookups += 1
+            self._sunsets[key], _ = schedule_table.day_times(
+                ch.city, ch.off_hour, d, self.tz(ch.city), timer.safe_localize,
+                path=table_path(ch.city, ch.off_hour),
+            )
+        return self._sunsets[key]
+
+    def calendar(self, ch: Channel, now: datetime.datetime, since: bool = False) -> schedule_rules.Calendar:
+        """Compiled on-windows of a rules channel (see schedule_rules.py)."""
+        return schedule_rules.calendar_for(ch.name, ch.rules, ch.city, self.tz(ch.city), now, since)
+
+    def lighton(self, ch: Channel, d: datetime.date) -> datetime.datetime:
+        return self.sunset(ch, d) + datetime.timedelta(minutes=ch.on_offset_minutes)
+
+    def off_at(self, ch: Channel, d: datetime.date) -> datetime.datetime:
+        naive = datetime.datetime.combine(d, datetime.time(ch.off_hour, 0))
+        return timer.safe_localize(self.tz(ch.city), naive)
+
+    def window(self, ch: Channel, now_local: datetime.datetime):
+        """
+        (sunset_reference_date, lighton, lightoff); for off_hour < 12 exactly timer.main()'s rule.
+        A rules channel gives the window now is in, else the next one (None, None past the horizon).
+        """
+        if ch.rules:
+            w = self.calendar(ch, now_local).window_at(now_local)
+            return w if w is not None else (now_local.date(), None, None)
+        if ch.off_hour >= 12:
+            ref = now_local.date()
+            return ref, self.lighton(ch, ref), self.off_at(ch, ref)
+        if now_local.time() < datetime.time(ch.off_hour, 0) or (
+            now_local.hour == ch.off_hour and now_local < self.off_at(ch, now_local.date())
+        ):
+            ref = now_local.date() - datetime.timedelta(days=1)
+        else:
+            ref = now_local.date()
+        return ref, self.lighton(ch, ref), self.off_at(ch, ref + datetime.timedelta(days=1))
+
+    # ---- Auto-revert cutoffs (per channel versions of status_test.first_*_after) ----
+    def first_off_after(self, ch: Channel, set_at: datetime.datetime) -> datetime.datetime:
+        if ch.rules:
+            return self._calendar_after(ch, set_at, "next_off")
+        tz = self.tz(ch.city)
+        set_at = set_at.astimezone(tz)
+        d = set_at.date()
+        off_today = self.off_at(ch, d)
+        if set_at < off_today:
+            return off_today
+        return self.off_at(ch, d + datetime.timedelta(days=1))
+
+    def first_lighton_after(self, ch: Channel, set_at: datetime.datetime) -> datetime.datetime:
+        if ch.rules:
+            return self._calendar_after(ch, set_at, "next_on")
+        set_at = set_at.astimezone(self.tz(ch.city))
+        cand = self.lighton(ch, set_at.date())
+        if set_at < cand:
+            return cand
+        return self.lighton(ch, set_at.date() + datetime.timedelta(days=1))
+
+    def _calendar_after(self, ch: Channel, set_at: datetime.datetime, which: str):
+        return getattr(self.calendar(ch, set_at, since=True), which)(set_at)
+
+    def revert_cutoff(self, ch: Channel, mode: str, set_at: datetime.datetime):
+        if mode == "force_on":
+            return self.first_off_after(ch, set_at)
+        if mode == "force_off":
+            return self.first_lighton_after(ch, set_at)
+        return None
+
+    # ---- Next change ----
+    def auto_on(self, ch: Channel, now_local: datetime.datetime) -> bool:
+        if ch.rules:
+            return self.calendar(ch, now_local).is_on(now_local)
+        _, lighton, lightoff = self.window(ch, now_local)
+        return lighton <= now_local < lightoff
+
+    def next_change(self, ch: Channel, mode: str, set_at: datetime.datetime, now: datetime.datetime):
+        """
+        Next instant after now at which the channel's relay has to be re-evaluated:
+        the auto-revert cutoff while forced, else the next light-on / light-off that
+        flips it. None if nothing changes within the next few days.
+        """
+        if mode in ("force_on", "force_off"):
+            return self.revert_cutoff(ch, mode, set_at)
+        now_local = now.astimezone(self.tz(ch.city))
+        if ch.rules:
+            return self.calendar(ch, now_local).next_change(now_local)
+        candidates = set()
+        for offset in range(-1, 3):
+            ref = now_local.date() + datetime.timedelta(days=offset)
+            candidates.add(self.lighton(ch, ref))
+            candidates.add(self.off_at(ch, ref + datetime.timedelta(days=1) if ch.off_hour < 12 else ref))
+        on = self.auto_on(ch, now_local)
+        for t in sorted(c for c in candidates if c > now_local):
+            if self.auto_on(ch, t) != on:
+                return t
+        return None
+
+
+def next_transition(channels, modes: dict, set_ats: dict, now: datetime.datetime, solar: SolarCache = None):
+    """
+    Earliest next_change() over the channels: (instant, channel name), or (None, None).
+    modes: {name: effective mode}; set_ats: {name: override set_at} for forced channels.
+    """
+    solar = solar or SolarCache()
+    best = (None, None)
+    for ch in channels:
+        t = solar.next_change(ch, modes.get(ch.name, "auto"), set_ats.get(ch.name), now)
+        if t is not None and (best[0] is None or t < best[0]):
+            best = (t, ch.name)
+    return best
+
+
+def evaluate(channels, modes: dict, now: datetime.datetime, solar: SolarCache = None) -> list:
+    """
+    One pass over all channels. modes: {channel name: effective mode}.
+    Returns one decision dict per channel (no GPIO access).
+    """
+    solar = solar or SolarCache()
+    out = []
+    for ch in channels:
+        mode = modes.get(ch.name, "auto")
+        now_local = now.astimezone(solar.tz(ch.city))
+        ref, lighton, lightoff = solar.window(ch, now_local)
+        if mode == "force_on":
+            on = True
+        elif mode == "force_off":
+            on = False
+        else:
+            on = lighton is not None and lighton <= now_local < lightoff
+        out.append({
+            "name": ch.name,
+            "pin": ch.pin,
+            "mode": mode,
+            "on": on,
+            "sunset_date": ref.isoformat(),
+            "lighton": lighton.replace(microsecond=0).isoformat() if lighton else None,
+            "lightoff": lightoff.replace(microsecond=0).isoformat() if lightoff else None,
+        })
+    return out
+
+
+def apply(decisions: list) -> list:
+    """Drive every channel's relay; adds relay_write to each decision."""
+    for d in decisions:
+        d["relay_write"] = relay.get_relay(d["pin"]).set(d["on"])
+    return decisions
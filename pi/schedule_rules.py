@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# LPI Schedule Rules
+# Version: 1.2.0
+# Last updated: 2026-10-17
+#
+# Declarative on-windows per channel ("rules" in lpi_channels.json): weekday /
+# weekend off-times, blackouts, seasonal offsets, morning windows. Compiled into a
+# cached interval index, so a lookup is a bisect.
+#
+#   python3 /home/pi/schedule_rules.py --days 3
+
+import bisect
+import datetime
+import hashlib
+import json
+import os
+import re
+import sys
+from array import array
+
+import lpi_timing
+import schedule_table
+import timer
+
+CALENDAR_PATH = "/home/pi/lpi_calendar.json"
+HORIZON_DAYS = 14
+REFRESH_DAYS = 7
+VERSION = 1
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+RULE_KEYS = {"window", "days", "months", "dates", "from", "to", "on", "off", "skip"}
+TIME_RE = re.compile(r"^\s*(?:(sunset|sunrise)\s*(?:([+-])\s*(\d+))?|(\d{1,2}):(\d{2}))\s*$")
+MONTH_DAY_RE = re.compile(r"^(?:\d{4}-)?\d{2}-\d{2}$")
+
+# channel name -> Calendar
+_calendars = {}
+compiles = {"full": 0, "incremental": 0}
+
+
+# ---------------- Rules ----------------
+def _check_time(spec, where: str) -> None:
+    m = TIME_RE.match(str(spec))
+    if not m or (m.group(4) and not (int(m.group(4)) < 24 and int(m.group(5)) < 60)):
+        raise ValueError(f"{where}: bad time {spec!r} (HH:MM, sunset, sunrise, sunset-60, sunrise+30)")
+
+
+def validate(rules) -> tuple:
+    """Check a channel's "rules" list; returns it as a tuple. Raises ValueError."""
+    if not isinstance(rules, list) or not rules:
+        raise ValueError("rules: expected a non-empty list")
+    for i, r in enumerate(rules):
+        where = f"rules[{i}]"
+        if not isinstance(r, dict):
+            raise ValueError(f"{where}: expected an object")
+        unknown = set(r) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"{where}: unknown keys {sorted(unknown)}")
+        if not r.get("skip"):
+            if "on" not in r or "off" not in r:
+                raise ValueError(f"{where}: needs on and off (or skip)")
+            _check_time(r["on"], where)
+            _check_time(r["off"], where)
+        for d in r.get("days", []):
+            if d not in DAYS:
+                raise ValueError(f"{where}: bad day {d!r} ({', '.join(DAYS)})")
+        for m in r.get("months", []):
+            if not (isinstance(m, int) and 1 <= m <= 12):
+                raise ValueError(f"{where}: bad month {m!r} (1-12)")
+        for key in ("from", "to"):
+            if key in r and not re.match(r"^\d{2}-\d{2}$", str(r[key])):
+                raise ValueError(f"{where}: bad {key} {r[key]!r} (MM-DD)")
+        if ("from" in r) != ("to" in r):
+            raise ValueError(f"{where}: from and to go together")
+        for d in r.get("dates", []):
+            if not MONTH_DAY_RE.match(str(d)):
+                raise ValueError(f"{where}: bad date {d!r} (MM-DD or YYYY-MM-DD)")
+    return tuple(rules)
+
+
+def fingerprint(rules, city) -> str:
+    key = json.dumps({"rules": list(rules), "city": list(city), "version": VERSION}, sort_keys=True)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _matches(rule: dict, d: datetime.date) -> bool:
+    if "days" in rule and DAYS[d.weekday()] not in rule["days"]:
+        return False
+    if "months" in rule and d.month not in rule["months"]:
+        return False
+    md = d.strftime("%m-%d")
+    if "dates" in rule and md not in rule["dates"] and d.isoformat() not in rule["dates"]:
+        return False
+    if "from" in rule:
+        lo, hi = rule["from"], rule["to"]
+        if not (lo <= md <= hi if lo <= hi else md >= lo or md <= hi):
+            return False
+    return True
+
+
+# ---------------- Compile ----------------
+def _instant(spec: str, d: datetime.date, city, tz):
+    """Aware datetime for a time spec on date d; None when the sun doesn't rise / set."""
+    m = TIME_RE.match(spec)
+    if m.group(4):
+        return timer.safe_localize(tz, datetime.datetime.combine(d, datetime.time(int(m.group(4)), int(m.group(5)))))
+    from astral import sun
+
+    try:
+        t = getattr(sun, m.group(1))(city.observer, date=d, tzinfo=tz)
+    except ValueError:
+        return None
+    minutes = int(m.group(3) or 0) * (-1 if m.group(2) == "-" else 1)
+    return t + datetime.timedelta(minutes=minutes)
+
+
+def _to_us(t: datetime.datetime) -> int:
+    delta = t - schedule_table.EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+@lpi_timing.timed("rules_compile")
+def compile_days(rules, city, tz, first: datetime.date, last: datetime.date) -> list:
+    """[(start_us, end_us, date ordinal)] of every window starting on first..last."""
+    out = []
+    d = first
+    while d <= last:
+        decided = set()
+        for rule in rules:
+            name = rule.get("window", "evening")
+            if name in decided or not _matches(rule, d):
+                continue
+            decided.add(name)
+            if rule.get("skip"):
+                continue
+            on = _instant(rule["on"], d, city, tz)
+            off = _instant(rule["off"], d, city, tz)
+            if off is not None and on is not None and off <= on:
+                off = _instant(rule["off"], d + datetime.timedelta(days=1), city, tz)
+            if on is not None and off is not None and off > on:
+                out.append((_to_us(on), _to_us(off), d.toordinal()))
+        d += datetime.timedelta(days=1)
+    return out
+
+
+class Calendar:
+    """Merged on-windows of one channel over [first, last] (window start dates)."""
+
+    def __init__(self, fp: str, first: datetime.date, last: datetime.date, windows, tz):
+        self.fingerprint = fp
+        self.first = first
+        self.last = last
+        self.windows = sorted(windows)
+        self.tz = tz
+        self.starts, self.ends, self.refs = array("q"), array("q"), []
+        for start, end, ref in self.windows:
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)     # overlapping / touching windows
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+                self.refs.append(ref)
+
+    def covers(self, first: datetime.date, last: datetime.date) -> bool:
+        return self.first <= first and last <= self.last
+
+    def _at(self, us: int) -> datetime.datetime:
+        return (schedule_table.EPOCH + datetime.timedelta(microseconds=us)).astimezone(self.tz)
+
+    def is_on(self, t: datetime.datetime) -> bool:
+        us = _to_us(t)
+        i = bisect.bisect_right(self.starts, us) - 1
+        return i >= 0 and us < self.ends[i]
+
+    def window_at(self, t: datetime.datetime):
+        """(start date, on, off) of the window t is in, else of the next one; None past the horizon."""
+        us = _to_us(t)
+        i = bisect.bisect_right(self.starts, us) - 1
+        if i < 0 or us >= self.ends[i]:
+            i += 1
+        if i >= len(self.starts):
+            return None
+        return datetime.date.fromordinal(self.refs[i]), self._at(self.starts[i]), self._at(self.ends[i])
+
+    def next_on(self, t: datetime.datetime):
+        """First window start after t (None past the horizon)."""
+        i = bisect.bisect_right(self.starts, _to_us(t))
+        return self._at(self.starts[i]) if i < len(self.starts) else None
+
+    def next_off(self, t: datetime.datetime):
+        """First window end after t (None past the horizon)."""
+        i = bisect.bisect_right(self.ends, _to_us(t))
+        return self._at(self.ends[i]) if i < len(self.ends) else None
+
+    def next_change(self, t: datetime.datetime):
+        """Next instant after t at which is_on() flips."""
+        us = _to_us(t)
+        i = bisect.bisect_right(self.starts, us) - 1
+        if i >= 0 and us < self.ends[i]:
+            return self._at(self.ends[i])
+        return self._at(self.starts[i + 1]) if i + 1 < len(self.starts) else None
+
+
+# ---------------- Cache ----------------
+def _load_file() -> dict:
+    try:
+        with open(CALENDAR_PATH, "r") as f:
+            return json.load(f) or {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(name: str, cal: Calendar) -> None:
+    data = _load_file()
+    data[name] = {
+        "fingerprint": cal.fingerprint,
+        "first": cal.first.isoformat(),
+        "last": cal.last.isoformat(),
+        "windows": [list(w) for w in cal.windows],
+    }
+    tmp = CALENDAR_PATH + ".tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, CALENDAR_PATH)
+    except OSError as e:
+        print("WARN: schedule calendar not saved:", e)
+
+
+def _cached(name: str, fp: str, tz):
+    cal = _calendars.get(name)
+    if cal is not None and cal.fingerprint == fp:
+        return cal
+    entry = _load_file().get(name)
+    if not entry or entry.get("fingerprint") != fp:
+        return None
+    return Calendar(fp, datetime.date.fromisoformat(entry["first"]), datetime.date.fromisoformat(entry["last"]),
+                    [tuple(w) for w in entry["windows"]], tz)
+
+
+def calendar_for(name: str, rules, city, tz, now: datetime.datetime, since: bool = False) -> Calendar:
+    """
+    The channel's compiled calendar covering now; (re)compiled only when needed.
+    since: now is a past instant to search forward from (an override's set_at); a
+    calendar that starts after it is kept, lookups then start at its first window.
+    """
+    fp = fingerprint(rules, city)
+    today = now.astimezone(tz).date()
+    first, last = today - datetime.timedelta(days=1), today + datetime.timedelta(days=HORIZON_DAYS)
+
+    cal = _cached(name, fp, tz)
+    if cal is not None and (cal.covers(first, today + datetime.timedelta(days=REFRESH_DAYS))
+                            or since and today < cal.first):
+        _calendars[name] = cal
+        return cal
+
+    if cal is not None and cal.first <= last and first <= cal.last:
+        # Horizon slid: keep the dates already compiled, compile only the missing ones
+        windows = [w for w in cal.windows if first.toordinal() <= w[2] <= last.toordinal()]
+        if first < cal.first:
+            windows += compile_days(rules, city, tz, first, cal.first - datetime.timedelta(days=1))
+        if cal.last < last:
+            windows += compile_days(rules, city, tz, cal.last + datetime.timedelta(days=1), last)
+        compiles["incremental"] += 1
+    else:
+        windows = compile_days(rules, city, tz, first, last)
+        compiles["full"] += 1
+    cal = Calendar(fp, first, last, windows, tz)
+    _calendars[name] = cal
+    _save(name, cal)
+    return cal
+
+
+def main():
+    import schedule_engine
+
+    days = int(sys.argv[sys.argv.index("--days") + 1]) if "--days" in sys.argv[1:] else REFRESH_DAYS
+    channels = [ch for ch in schedule_engine.load_channels() if ch.rules]
+    if not channels:
+        print("No channel in", schedule_engine.CHANNELS_FILE, "has rules")
+        return 0
+    solar = schedule_engine.SolarCache()
+    for ch in channels:
+        tz = solar.tz(ch.city)
+        now = datetime.datetime.now(tz)
+        cal = solar.calendar(ch, now)
+        print(f"===== {ch.name} (pin {ch.pin}, {ch.city.name}) =====")
+        print(f"compiled {cal.first} .. {cal.last}: {len(cal.starts)} windows")
+        horizon = now + datetime.timedelta(days=days)
+        t = now - datetime.timedelta(days=1)
+        while True:
+            w = cal.window_at(t)
+            if w is None or w[1] > horizon:
+                break
+            ref, on, off = w
+            print(f"  {ref}  {on.strftime('%a %Y-%m-%d %H:%M')} -> {off.strftime('%a %Y-%m-%d %H:%M')}")
+            t = off
+        change = cal.next_change(now)
+        print(f"now {'ON' if cal.is_on(now) else 'OFF'}; next change:",
+              change.replace(microsecond=0).isoformat() if change else "none in horizon")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# LPI Schedule Table
+# Version: 1.6.0
+# Last updated: 2026-10-17
+#
+# Precomputed (sunset, light-off) instants per date, memory-mapped from
+# /home/pi/lpi_schedule.bin, so timer.py doesn't call astral on every run.
+#
+# Build at install time:  python3 /home/pi/schedule_table.py
+
+import datetime
+import hashlib
+import mmap
+import os
+import struct
+import time
+
+import lpi_timing
+
+SCHEDULE_PATH = "/home/pi/lpi_schedule.bin"
+TABLE_DAYS = 731          # two years
+BUILD_BACKFILL_DAYS = 7   # keep yesterday's reference date covered after midnight
+REBUILD_RETRY_SECONDS = 600
+
+MAGIC = b"LPIS"
+VERSION = 1
+HEADER = struct.Struct("<4sHH20sii")
+ROW = struct.Struct("<qq")
+MISSING = -(2 ** 63)      # polar day/night: astral has no sunset, fall back on lookup
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# path -> (fingerprint, start_ordinal, days, mmap)
+_tables = {}
+# path -> monotonic time before which a failed rebuild isn't tried again
+_rebuild_failed = {}
+# (timezone, latitude, longitude, light_off_hour) -> fingerprint
+_fingerprints = {}
+
+
+def fingerprint(city, light_off_hour: int) -> bytes:
+    memo = (city.timezone, city.latitude, city.longitude, light_off_hour)
+    if memo in _fingerprints:
+        return _fingerprints[memo]
+    key = "|".join([
+        city.timezone, f"{city.latitude:.6f}", f"{city.longitude:.6f}",
+        str(light_off_hour), str(VERSION),
+    ])
+    _fingerprints[memo] = hashlib.sha1(key.encode("utf-8")).digest()
+    return _fingerprints[memo]
+
+
+def _to_us(d: datetime.datetime) -> int:
+    delta = d - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _from_us(us: int, tz) -> datetime.datetime:
+    return (EPOCH + datetime.timedelta(microseconds=us)).astimezone(tz)
+
+
+def compute_day(city, light_off_hour: int, d: datetime.date, tz, localize):
+    """The astral path: (sunset_local, lightoff_local) for sunset-reference date d."""
+    # sunset() alone: sun() also computes dawn/sunrise/noon/dusk and raises if any of them fails
+    from astral.sun import sunset
+
+    off_naive = datetime.datetime.combine(d + datetime.timedelta(days=1), datetime.time(light_off_hour, 0))
+    return sunset(city.observer, date=d, tzinfo=tz), localize(tz, off_naive)
+
+
+@lpi_timing.timed("schedule_build")
+def build(path: str, city, light_off_hour: int, tz, localize, start: datetime.date, days: int = TABLE_DAYS) -> None:
+    rows = bytearray(ROW.size * days)
+    for i in range(days):
+        d = start + datetime.timedelta(days=i)
+        try:
+            sunset_local, lightoff_local = compute_day(city, light_off_hour, d, tz, localize)
+            ROW.pack_into(rows, i * ROW.size, _to_us(sunset_local), _to_us(lightoff_local))
+        except ValueError:
+            ROW.pack_into(rows, i * ROW.size, MISSING, MISSING)
+    write(path, city, light_off_hour, start, days, bytes(rows))
+
+
+def write(path: str, city, light_off_hour: int, start: datetime.date, days: int, rows: bytes) -> None:
+    """Write a table from already-packed rows (days x ROW), e.g. from fleet/solar_batch.py."""
+    if len(rows) != days * ROW.size:
+        raise ValueError(f"expected {days * ROW.size} bytes of rows, got {len(rows)}")
+    header = HEADER.pack(MAGIC, VERSION, 0, fingerprint(city, light_off_hour), start.toordinal(), days)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(rows)
+    os.replace(tmp, path)
+
+    _close(path)
+
+
+def _close(path: str) -> None:
+    t = _tables.pop(path, None)
+    if t:
+        t[3].close()
+
+
+def _open(path: str):
+    if path in _tables:
+        return _tables[path]
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            return None
+    if len(mm) < HEADER.size:
+        mm.close()
+        return None
+    magic, version, _, fp, start_ordinal, days = HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or version != VERSION or len(mm) < HEADER.size + days * ROW.size:
+        mm.close()
+        return None
+    _tables[path] = (fp, start_ordinal, days, mm)
+    return _tables[path]
+
+
+def _row(path: str, city, light_off_hour: int, d: datetime.date):
+    """Raw (sunset_us, lightoff_us) for d, or None if the table doesn't cover it."""
+    t = _open(path)
+    if t is None:
+        return None
+    fp, start_ordinal, days, mm = t
+    if fp != fingerprint(city, light_off_hour):
+        return None
+    i = d.toordinal() - start_ordinal
+    if not 0 <= i < days:
+        return None
+    return ROW.unpack_from(mm, HEADER.size + i * ROW.size)
+
+
+@lpi_timing.timed("sunset")
+def day_times(city, light_off_hour: int, d: datetime.date, tz, localize, path: str = None):
+    """
+    (sunset_local, lightoff_local) for sunset-reference date d.
+
+    Reads the table; if it doesn't cover d (no table, stale fingerprint, date out
+    of range) it is rebuilt once and re-read. Anything still missing falls back to astral.
+    path defaults to SCHEDULE_PATH as it is at call time (so a harness can redirect it).
+    """
+    path = path or SCHEDULE_PATH
+    row = _row(path, city, light_off_hour, d)
+    if row is None and time.monotonic() >= _rebuild_failed.get(path, 0.0):
+        try:
+            build(path, city, light_off_hour, tz, localize, d - datetime.timedelta(days=BUILD_BACKFILL_DAYS))
+            row = _row(path, city, light_off_hour, d)
+            _rebuild_failed.pop(path, None)
+        except OSError as e:
+            _rebuild_failed[path] = time.monotonic() + REBUILD_RETRY_SECONDS
+            print("WARN: schedule table rebuild failed:", e, f"(not retried for {REBUILD_RETRY_SECONDS} s)")
+
+    if row is None or row[0] == MISSING:
+        with lpi_timing.stage("astral"):
+            return compute_day(city, light_off_hour, d, tz, localize)
+    return _from_us(row[0], tz), _from_us(row[1], tz)
+
+
+if __name__ == "__main__":
+    import pytz
+    import timer
+
+    tz = pytz.timezone(timer.city.timezone)
+    start = datetime.datetime.now(tz).date() - datetime.timedelta(days=BUILD_BACKFILL_DAYS)
+    build(SCHEDULE_PATH, timer.city, timer.LIGHT_OFF_HOUR, tz, timer.safe_localize, start)
+    print("✅ Schedule table built:", SCHEDULE_PATH, f"({TABLE_DAYS} days from {start})")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# LPI Startup Profile
+# Version: 1.2.0
+# Last updated: 2026-10-17
+#
+# Per-import cost of an LPI entry point's startup, checked against a budget.
+#
+#   python3 /home/pi/timer.py --startup-profile
+#   python3 /home/pi/pi_monitor_test/status_test.py --startup-profile
+#   python3 /home/pi/startup_profile.py /home/pi/pi_monitor_test/command_apply.py
+#
+# The entry point is loaded in a fresh interpreter under `python -X importtime`
+# with a run name other than "__main__", so only its module-level imports run
+# (no GPIO, no network). Exit status is 1 when the import total exceeds the budget.
+# Budgets are in ms of import time (interpreter start-up itself is reported
+# separately); LPI_STARTUP_BUDGET_MS overrides the table below.
+
+import os
+import subprocess
+import sys
+import time
+
+# Sized for a Pi Zero W. Keep these tight: a new top-level import of requests,
+# google-auth, astral or gpiozero should trip them.
+BUDGET_MS = {
+    "timer.py": 250,
+    "status_test.py": 600,
+    "command_apply.py": 400,
+    "firestore_upload_status.py": 400,
+    "lpi_daemon.py": 900,
+    "lpi_pipeline.py": 900,
+    "lan_control.py": 900,
+}
+DEFAULT_BUDGET_MS = 600
+TOP_N = 15
+
+MARK = "--lpi-startup-mark--"
+
+
+def _run(code: str, cwd: str):
+    t0 = time.perf_counter()
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=cwd,
+    )
+    return (time.perf_counter() - t0) * 1000, p
+
+
+def parse_importtime(stderr: str):
+    """[(name, self_us, cumulative_us, depth)] for imports after MARK, in load order."""
+    rows = []
+    seen_mark = False
+    for line in stderr.splitlines():
+        if line.strip() == MARK:
+            seen_mark = True
+            continue
+        if not seen_mark or not line.startswith("import time:"):
+            continue
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[0].split(":")[1].strip().isdigit():
+            continue  # header line
+        raw = parts[2][1:]
+        depth = (len(raw) - len(raw.lstrip(" "))) // 2
+        rows.append((raw.strip(), int(parts[0].split(":")[1]), int(parts[1]), depth))
+    return rows
+
+
+def profile(entry_path: str) -> dict:
+    entry_path = os.path.abspath(entry_path)
+    cwd = os.path.dirname(entry_path)
+    baseline_ms, _ = _run("pass", cwd)
+    code = (
+        "import pkgutil, runpy, sys\n"
+        f"sys.path.insert(0, {cwd!r})\n"
+        f"sys.stderr.write({MARK!r} + '\\n'); sys.stderr.flush()\n"
+        f"runpy.run_path({entry_path!r}, run_name='__lpi_startup__')\n"
+    )
+    wall_ms, p = _run(code, cwd)
+    if p.returncode != 0:
+        raise RuntimeError(f"loading {entry_path} failed:\n{p.stderr[-2000:]}")
+    rows = parse_importtime(p.stderr)
+    top = [r for r in rows if r[3] == 0]
+    return {
+        "entry": os.path.basename(entry_path),
+        "interpreter_ms": baseline_ms,
+        "wall_ms": wall_ms,
+        "imports_ms": sum(r[2] for r in top) / 1000,
+        "top_level": sorted(top, key=lambda r: -r[2]),
+        "modules": len(rows),
+    }
+
+
+def main(entry_path: str) -> int:
+    result = profile(entry_path)
+    budget = float(os.environ.get("LPI_STARTUP_BUDGET_MS") or BUDGET_MS.get(result["entry"], DEFAULT_BUDGET_MS))
+
+    print(f"===== STARTUP PROFILE: {result['entry']} =====")
+    print(f"Interpreter start-up:    {result['interpreter_ms']:8.1f} ms")
+    print(f"Entry point load (wall): {result['wall_ms']:8.1f} ms")
+    print(f"Imports (cumulative):    {result['imports_ms']:8.1f} ms  ({result['modules']} modules)")
+    print()
+    print(f"{'cumulative ms':>14} {'self ms':>9}  top-level import")
+    for name, self_us, cum_us, _ in result["top_level"][:TOP_N]:
+        print(f"{cum_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+    print()
+
+    if result["imports_ms"] > budget:
+        print(f"❌ Over budget: {result['imports_ms']:.1f} ms > {budget:.0f} ms")
+        return 1
+    print(f"✅ Within budget: {result['imports_ms']:.1f} ms <= {budget:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: startup_profile.py <entry_point.py>")
+        sys.exit(2)
+    sys.exit(main(sys.argv[1]))
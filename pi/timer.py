@@ -1,21 +1,43 @@
 #!/usr/bin/env python3
 # LPI Timer Control
-# Version: 1.2.0
-# Last updated: 2026-01-29
+# Version: 1.15.0
+# Last updated: 2026-10-17
+#
+# Relay on from sunset - 1 h until LIGHT_OFF_HOUR, through relay.py.
+# schedule_for() / decide() are the pure decision for callers with their own clock.
 
 import datetime
+import sys
+from typing import NamedTuple
+
 import pytz
-from astral.sun import sun
-from astral import LocationInfo
-from gpiozero import LED
+
+import lpi_log
+import lpi_timing
+import relay
+import schedule_table
 
 # -------- Configuration --------
 GPIO_PIN = 18          # BCM pin
 LIGHT_OFF_HOUR = 1     # Light OFF time (1:00 AM)
 USE_TEST_TIME = False  # Set True to simulate time
 
+class City(NamedTuple):
+    """Same fields as astral.LocationInfo, without importing astral up front."""
+    name: str
+    region: str
+    timezone: str
+    latitude: float
+    longitude: float
+
+    @property
+    def observer(self):
+        from astral import Observer
+        return Observer(self.latitude, self.longitude, 0.0)
+
+
 # Location (Rochester, NY)
-city = LocationInfo(
+city = City(
     "Rochester",
     "USA",
     "America/New_York",
@@ -25,29 +47,47 @@ city = LocationInfo(
 
 # -------- GPIO Setup --------
 # IMPORTANT:
-# Do NOT create the LED at import time.
-# Creating it can briefly set the pin to a default state, which can click relays on every cron run.
+# Do NOT touch the pin at import time.
+# Driving it to a default state can click relays on every cron run.
 light = None
+last_relay_write = None
+last_relay_state = None
+last_schedule = None    # (sunset_reference_date, sunset, lighton, lightoff) of the last main()
+
 
 def init_light(should_be_on: bool):
     global light
-    # Initialize the GPIO pin directly to the desired state (prevents relay clicking each cron run)
-    light = LED(GPIO_PIN, active_high=True, initial_value=should_be_on)
+    # relay.get_relay() returns the same object for the life of the process, so a
+    # long-running caller (lpi_daemon.py) keeps holding the line between ticks.
+    light = relay.get_relay(GPIO_PIN)
+
+
+def _drive(on: bool) -> bool:
+    global last_relay_write, last_relay_state
+    last_relay_write = light.set(on)
+    last_relay_state = on
+    return last_relay_write
 
-    # Keep the GPIO line driven after the script exits so the relay stays latched.
-    # Some relay boards revert when the GPIO is released (process exit/cleanup).
-    # This uses a private gpiozero API; may break on future gpiozero updates.
-    light._pin.close = lambda: None
+
+def LightOn(out=print):
+    if _drive(True):
+        out("Light ON (GPIO HIGH)")
+    else:
+        out("Light ON (GPIO HIGH, unchanged - no write)")
 
 
-def LightOn():
-    light.on()
-    print("Light ON (GPIO HIGH)")
+def LightOff(out=print):
+    if _drive(False):
+        out("Light OFF (GPIO LOW)")
+    else:
+        out("Light OFF (GPIO LOW, unchanged - no write)")
 
 
-def LightOff():
-    light.off()
-    print("Light OFF (GPIO LOW)")
+def force_light(on: bool, out=print):
+    """In-process equivalent of lighton.py / lightoff.py (shares the held line)."""
+    init_light(on)
+    wrote = _drive(on)
+    out(("Override ON" if on else "Override OFF") + ("" if wrote else " (unchanged - no write)"))
 
 
 def safe_localize(tz, naive_dt):
@@ -69,58 +109,95 @@ def safe_localize(tz, naive_dt):
 
 
 # -------- Main Logic --------
-def main():
+def schedule_for(now_local):
+    """(sunset_reference_date, sunset_local, lighton_local, lightoff_local) for now_local."""
     local_tz = pytz.timezone(city.timezone)
-
-    # ---- Time Setup ----
-    if USE_TEST_TIME:
-        test_time_naive = datetime.datetime(2025, 7, 24, 2, 45)
-        now_local = safe_localize(local_tz, test_time_naive)
-        print("!!! TEST MODE ENABLED !!!")
-    else:
-        now_local = datetime.datetime.now(local_tz)
+    now_local = now_local.astimezone(local_tz)
 
     # ---- Sunset Reference Date ----
-    if now_local.time() < datetime.time(LIGHT_OFF_HOUR, 0):
+    # Before today's OFF instant we're still on yesterday's schedule. On the fall-back
+    # night the OFF hour happens twice and safe_localize picks the later one, so the
+    # first pass through it still counts as "before".
+    off_time = datetime.time(LIGHT_OFF_HOUR, 0)
+    if now_local.time() < off_time or (
+        now_local.hour == LIGHT_OFF_HOUR
+        and now_local < safe_localize(local_tz, datetime.datetime.combine(now_local.date(), off_time))
+    ):
         sunset_reference_date = now_local.date() - datetime.timedelta(days=1)
     else:
         sunset_reference_date = now_local.date()
 
     # ---- Sunset + ON/OFF Times ----
-    s = sun(city.observer, date=sunset_reference_date, tzinfo=local_tz)
-
-    sunset_local = s["sunset"]
+    # OFF time is "tomorrow at LIGHT_OFF_HOUR:00" relative to sunset_reference_date.
+    # Both come from the precomputed table (schedule_table.py); astral only on a miss.
+    sunset_local, lightoff_local = schedule_table.day_times(
+        city, LIGHT_OFF_HOUR, sunset_reference_date, local_tz, safe_localize
+    )
     lighton_local = sunset_local - datetime.timedelta(hours=1)
+    return sunset_reference_date, sunset_local, lighton_local, lightoff_local
+
+
+def decide(now_local) -> bool:
+    """timer.main()'s ON/OFF decision for now_local, without printing or GPIO."""
+    _, _, lighton_local, lightoff_local = schedule_for(now_local)
+    return lighton_local <= now_local < lightoff_local
 
-    # OFF time is "tomorrow at LIGHT_OFF_HOUR:00" relative to sunset_reference_date
-    off_date = sunset_reference_date + datetime.timedelta(days=1)
-    lightoff_naive = datetime.datetime.combine(off_date, datetime.time(LIGHT_OFF_HOUR, 0))
-    lightoff_local = safe_localize(local_tz, lightoff_naive)
 
-    # ---- Debug Output ----
+def main(now_local=None, out=print):
+    local_tz = pytz.timezone(city.timezone)
+
+    # ---- Time Setup ----
+    if now_local is not None:
+        now_local = now_local.astimezone(local_tz)
+    elif USE_TEST_TIME:
+        test_time_naive = datetime.datetime(2025, 7, 24, 2, 45)
+        now_local = safe_localize(local_tz, test_time_naive)
+        out("!!! TEST MODE ENABLED !!!")
+    else:
+        now_local = datetime.datetime.now(local_tz)
+
+    global last_schedule
+    sunset_reference_date, sunset_local, lighton_local, lightoff_local = schedule_for(now_local)
+    last_schedule = (sunset_reference_date, sunset_local, lighton_local, lightoff_local)
+
+    # ---- Debug Output (LPI_LOG_LEVEL=debug) ----
     def clean(dt):
         return dt.replace(microsecond=0).strftime("%Y-%m-%d %H:%M:%S")
 
-    print("===== DEBUG TIMING =====")
-    print("Current local time:     ", clean(now_local))
-    print("Sunset date used:       ", sunset_reference_date)
-    print("Sunset time (local):    ", clean(sunset_local))
-    print("Light ON time:          ", clean(lighton_local))
-    print("Light OFF time:         ", clean(lightoff_local))
-    print("========================")
+    if lpi_log.enabled(lpi_log.DEBUG):
+        lpi_log.emit(lpi_log.DEBUG, "\n".join([
+            "===== DEBUG TIMING =====",
+            f"Current local time:      {clean(now_local)}",
+            f"Sunset date used:        {sunset_reference_date}",
+            f"Sunset time (local):     {clean(sunset_local)}",
+            f"Light ON time:           {clean(lighton_local)}",
+            f"Light OFF time:          {clean(lightoff_local)}",
+            "========================",
+        ]), out)
 
     # ---- ON / OFF Decision ----
     should_be_on = (lighton_local <= now_local < lightoff_local)
 
-    # Initialize GPIO to the desired state (prevents relay click each cron run)
+    # Read back the line; only written if it doesn't already match (no relay click)
     init_light(should_be_on)
 
     if should_be_on:
-        LightOn()
+        LightOn(out)
     else:
-        LightOff()
+        LightOff(out)
+
+    return should_be_on
 
 
 # -------- Entry Point --------
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--startup-profile" in sys.argv[1:]:
+        import startup_profile
+        sys.exit(startup_profile.main(__file__))
+    try:
+        relay.require_persistent_outputs()
+    except RuntimeError as e:
+        print("❌", e)
+        sys.exit(1)
+    with lpi_log.capture("timer"), lpi_timing.run("timer"):
+        main()
\ No newline at end of file
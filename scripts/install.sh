@@ -1,19 +1,42 @@
 #!/usr/bin/env bash
 # LPI Installer
-# Version: 1.2.5
-# Last updated: 2026-02-03
+# Version: 1.12.0
+# Last updated: 2026-10-17
 #
-# CHANGE (permissions only):
+# CHANGE:
+# - Installs lpi_daemon.py + lpi-daemon.service: one resident process runs the
+#   command poll, timer, auto-revert and status upload on the same 15s/1m cadence.
+# - The 9 cron lines are removed. Set LPI_USE_CRON=1 to keep the old cron layout.
+# - Installs schedule_table.py and prebuilds /home/pi/lpi_schedule.bin.
+# - Installs token_cache.py (OAuth token cached in root-only /home/pi/lpi_token_cache.json).
+# - Installs lpi_paths.py (puts /home/pi on sys.path for the monitor scripts).
+# - Installs firestore_client.py (pooled keep-alive Firestore REST session).
+# - Override/status state lives in /home/pi/lpi_state.db (state_store.py, SQLite WAL);
+#   override_mode.txt / override_state.json / pi_status.json are exported from it.
+# - GPIO via relay.py (GPIO character device); python3-gpiozero no longer needed.
+# - schedule_engine.py: optional /home/pi/lpi_channels.json for several relays/zones.
+# - lpi_log.py: job output goes to fixed-size log rings (/home/pi/lpi_log_<job>.ring).
+#   The *_cron.log files now only catch crashes before logging starts.
+#   Read with: python3 /home/pi/lpi_log.py --since 1h
+# - lpi_timing.py: per-stage latency (rolling p50/p95/max in the status + Firestore).
+# - outbox.py: Firestore writes are queued in lpi_state.db and survive Wi-Fi drops.
+# - lpi_pipeline.py: optional asyncio tick (LPI_PIPELINE=1 in lpi-daemon.service).
+# - relay_history.py: relay transitions + daily on-hours (python3 .../relay_history.py).
+# - lan_control.py: optional LAN override endpoint (LPI_LAN_CONTROL=1 in lpi-daemon.service);
+#   its shared secret is generated once into /home/pi/lpi_lan_secret (root-only).
+# - schedule_rules.py: optional per-channel "rules" in lpi_channels.json, compiled
+#   into /home/pi/lpi_calendar.json (check with: python3 /home/pi/schedule_rules.py).
+#
+# 1.2.5:
 # - Ensure /home/pi/pi_status.json exists and is writable by user 'pi'
 #   (status_test.py writes it, firestore_upload_status.py reads it)
-# - No service changes
-# - Cron timing remains as currently installed (15s command/status, 1m upload)
 
 set -euo pipefail
 
 REPO_ROOT="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
 
-echo "=== LPI Installer v1.2.5 ==="
+VERSION="$(sed -n 's/^# Version: //p' "${BASH_SOURCE[0]}" | head -n 1)"
+echo "=== LPI Installer v${VERSION} ==="
 echo "Repo: $REPO_ROOT"
 echo
 
@@ -29,7 +52,6 @@ apt install -y \
   git \
   cron \
   util-linux \
-  python3-gpiozero \
   python3-pytz \
   python3-astral \
   python3-requests \
@@ -45,13 +67,34 @@ echo "[4/7] Copying scripts into /home/pi..."
 install -m 0755 "$REPO_ROOT/pi/timer.py" /home/pi/timer.py
 install -m 0755 "$REPO_ROOT/pi/lighton.py" /home/pi/lighton.py
 install -m 0755 "$REPO_ROOT/pi/lightoff.py" /home/pi/lightoff.py
+install -m 0644 "$REPO_ROOT/pi/schedule_table.py" /home/pi/schedule_table.py
+install -m 0755 "$REPO_ROOT/pi/startup_profile.py" /home/pi/startup_profile.py
+install -m 0644 "$REPO_ROOT/pi/relay.py" /home/pi/relay.py
+install -m 0644 "$REPO_ROOT/pi/schedule_engine.py" /home/pi/schedule_engine.py
+install -m 0755 "$REPO_ROOT/pi/schedule_rules.py" /home/pi/schedule_rules.py
+install -m 0755 "$REPO_ROOT/pi/lpi_log.py" /home/pi/lpi_log.py
+install -m 0755 "$REPO_ROOT/pi/lpi_timing.py" /home/pi/lpi_timing.py
 
 install -m 0755 "$REPO_ROOT/pi/pi_monitor_test/status_test.py" /home/pi/pi_monitor_test/status_test.py
 install -m 0755 "$REPO_ROOT/pi/pi_monitor_test/command_apply.py" /home/pi/pi_monitor_test/command_apply.py
 install -m 0755 "$REPO_ROOT/pi/pi_monitor_test/firestore_upload_status.py" /home/pi/pi_monitor_test/firestore_upload_status.py
+install -m 0755 "$REPO_ROOT/pi/pi_monitor_test/lpi_daemon.py" /home/pi/pi_monitor_test/lpi_daemon.py
+install -m 0644 "$REPO_ROOT/pi/pi_monitor_test/lpi_paths.py" /home/pi/pi_monitor_test/lpi_paths.py
+install -m 0644 "$REPO_ROOT/pi/pi_monitor_test/token_cache.py" /home/pi/pi_monitor_test/token_cache.py
+install -m 0644 "$REPO_ROOT/pi/pi_monitor_test/firestore_client.py" /home/pi/pi_monitor_test/firestore_client.py
+install -m 0644 "$REPO_ROOT/pi/pi_monitor_test/state_store.py" /home/pi/pi_monitor_test/state_store.py
+install -m 0755 "$REPO_ROOT/pi/pi_monitor_test/outbox.py" /home/pi/pi_monitor_test/outbox.py
+install -m 0755 "$REPO_ROOT/pi/pi_monitor_test/lpi_pipeline.py" /home/pi/pi_monitor_test/lpi_pipeline.py
+install -m 0755 "$REPO_ROOT/pi/pi_monitor_test/relay_history.py" /home/pi/pi_monitor_test/relay_history.py
+install -m 0755 "$REPO_ROOT/pi/pi_monitor_test/lan_control.py" /home/pi/pi_monitor_test/lan_control.py
 
 chown -R pi:pi /home/pi/pi_monitor_test || true
-chown pi:pi /home/pi/timer.py /home/pi/lighton.py /home/pi/lightoff.py || true
+chown pi:pi /home/pi/timer.py /home/pi/lighton.py /home/pi/lightoff.py /home/pi/schedule_table.py /home/pi/startup_profile.py /home/pi/relay.py /home/pi/schedule_engine.py /home/pi/schedule_rules.py /home/pi/lpi_log.py /home/pi/lpi_timing.py || true
+
+# Precompute sunset / light-on / light-off for the next two years (timer.py rebuilds
+# it by itself if the city or LIGHT_OFF_HOUR changes, or the table runs out)
+echo "Building schedule table..."
+(cd /home/pi && python3 /home/pi/schedule_table.py) || echo "WARN: schedule table build failed (timer.py will build it on first run)"
 
 # --- FIX: ensure pi can write status JSON (manual runs + avoids permission drift) ---
 # status_test.py writes /home/pi/pi_status.json :contentReference[oaicite:2]{index=2}
@@ -61,7 +104,7 @@ touch /home/pi/pi_status.json
 chown pi:pi /home/pi/pi_status.json || true
 chmod 664 /home/pi/pi_status.json || true
 
-# Optional but harmless: ensure logs can be read easily
+# Crash-only fallback logs (normal output goes to the lpi_log.py rings)
 touch /home/pi/command_cron.log /home/pi/status_cron.log /home/pi/upload_cron.log
 chown pi:pi /home/pi/command_cron.log /home/pi/status_cron.log /home/pi/upload_cron.log || true
 chmod 664 /home/pi/command_cron.log /home/pi/status_cron.log /home/pi/upload_cron.log || true
@@ -70,13 +113,14 @@ echo "[5/7] Initializing override state..."
 echo "auto" > /home/pi/override_mode.txt
 chown pi:pi /home/pi/override_mode.txt || true
 
-python3 - <<'PY'
-import json, datetime
-state = {"mode":"auto","set_at_local": datetime.datetime.now().isoformat()}
-with open("/home/pi/override_state.json","w") as f:
-    json.dump(state, f)
+(cd /home/pi/pi_monitor_test && python3 - <<'PY'
+import datetime
+import state_store
+state_store.set_override("auto", datetime.datetime.now().isoformat())
+state_store.export_legacy()
 PY
-chown pi:pi /home/pi/override_state.json || true
+)
+chown pi:pi /home/pi/override_state.json /home/pi/lpi_state.db || true
 
 echo "[6/7] Setting device ID (dashboard name)..."
 read -r -p "Enter device ID (example BGWebster): " DEVICE_ID
@@ -89,6 +133,13 @@ echo "$DEVICE_ID" > /home/pi/device_id.txt
 chown pi:pi /home/pi/device_id.txt || true
 chmod 0644 /home/pi/device_id.txt
 
+# LAN control secret (lan_control.py); kept across reinstalls
+if [[ ! -s /home/pi/lpi_lan_secret ]]; then
+  (umask 077 && head -c 24 /dev/urandom | base64 > /home/pi/lpi_lan_secret)
+fi
+chown root:root /home/pi/lpi_lan_secret || true
+chmod 600 /home/pi/lpi_lan_secret
+
 echo
 echo "NOTE: You must place service account key at:"
 echo "  /home/pi/lpi_monitor.json"
@@ -97,7 +148,7 @@ echo "  sudo chown root:root /home/pi/lpi_monitor.json"
 echo "  sudo chmod 600 /home/pi/lpi_monitor.json"
 echo
 
-echo "[7/7] Installing cron jobs (root)..."
+echo "[7/7] Installing scheduler (root)..."
 
 TMP_CRON="$(mktemp)"
 crontab -l 2>/dev/null > "$TMP_CRON" || true
@@ -109,8 +160,11 @@ sed -i \
   -e '\#/home/pi/pi_monitor_test/firestore_upload_status.py#d' \
   "$TMP_CRON"
 
-# Append our lines (matches what you currently see in sudo crontab -l)
-cat >> "$TMP_CRON" <<'CRON'
+if [[ "${LPI_USE_CRON:-0}" == "1" ]]; then
+  systemctl disable --now lpi-daemon.service >/dev/null 2>&1 || true
+
+  # Append our lines (matches what you currently see in sudo crontab -l)
+  cat >> "$TMP_CRON" <<'CRON'
 * * * * * flock -n /tmp/cmd.lock /usr/bin/python3 /home/pi/pi_monitor_test/command_apply.py >> /home/pi/command_cron.log 2>&1
 * * * * * sleep 15; flock -n /tmp/cmd.lock /usr/bin/python3 /home/pi/pi_monitor_test/command_apply.py >> /home/pi/command_cron.log 2>&1
 * * * * * sleep 30; flock -n /tmp/cmd.lock /usr/bin/python3 /home/pi/pi_monitor_test/command_apply.py >> /home/pi/command_cron.log 2>&1
@@ -124,15 +178,33 @@ cat >> "$TMP_CRON" <<'CRON'
 * * * * * sleep 20; flock -n /tmp/upload.lock /usr/bin/python3 /home/pi/pi_monitor_test/firestore_upload_status.py >> /home/pi/upload_cron.log 2>&1
 CRON
 
-crontab "$TMP_CRON"
-rm -f "$TMP_CRON"
+  crontab "$TMP_CRON"
+  rm -f "$TMP_CRON"
+  echo "✅ Root crontab installed (LPI_USE_CRON=1)."
+  echo
+  echo "Verify:"
+  echo "  sudo crontab -l"
+else
+  crontab "$TMP_CRON"
+  rm -f "$TMP_CRON"
+
+  install -m 0644 "$REPO_ROOT/scripts/lpi-daemon.service" /etc/systemd/system/lpi-daemon.service
+  systemctl daemon-reload
+  systemctl enable lpi-daemon.service >/dev/null 2>&1 || true
+  systemctl restart lpi-daemon.service
+  echo "✅ lpi-daemon.service installed (old LPI cron lines removed)."
+  echo
+  echo "Verify:"
+  echo "  systemctl status lpi-daemon.service"
+  echo "  journalctl -u lpi-daemon.service -n 40"
+fi
 
-echo "✅ Root crontab installed."
-echo
-echo "Verify:"
-echo "  sudo crontab -l"
 echo
 echo "Log checks:"
-echo "  tail -n 40 /home/pi/command_cron.log"
-echo "  tail -n 40 /home/pi/status_cron.log"
-echo "  tail -n 40 /home/pi/upload_cron.log"
+echo "  python3 /home/pi/lpi_log.py --since 1h"
+echo "  python3 /home/pi/lpi_log.py status --level warning"
+echo "  python3 /home/pi/lpi_log.py --stats"
+echo "  python3 /home/pi/lpi_timing.py                # per-stage p50/p95/max"
+echo "  sudo python3 /home/pi/pi_monitor_test/outbox.py   # queued Firestore writes (--flush to send now)"
+echo "  sudo LPI_PROFILE=1 python3 /home/pi/pi_monitor_test/status_test.py   # cProfile one run"
+echo "  LPI_LOG_LEVEL=debug python3 /home/pi/timer.py     # with the DEBUG TIMING block"
@@ -0,0 +1,35 @@
+# LPI tests: the device modules import each other as top-level modules, as they do
+# on the Pi (/home/pi and /home/pi/pi_monitor_test on sys.path).
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for sub in ("pi", os.path.join("pi", "pi_monitor_test")):
+    path = os.path.join(REPO_ROOT, sub)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+os.environ.setdefault("LPI_RELAY_BACKEND", "mock")
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    """state_store pointed at a fresh database (and legacy export files) under tmp_path."""
+    import state_store
+
+    monkeypatch.setattr(state_store, "STATE_DB", str(tmp_path / "lpi_state.db"))
+    monkeypatch.setattr(state_store, "OVERRIDE_FILE", str(tmp_path / "override_mode.txt"))
+    monkeypatch.setattr(state_store, "STATE_FILE", str(tmp_path / "override_state.json"))
+    monkeypatch.setattr(state_store, "STATUS_FILE", str(tmp_path / "pi_status.json"))
+    return state_store
+
+
+@pytest.fixture
+def box(state, tmp_path, monkeypatch):
+    """outbox.py on the state fixture's database, with its own flush lock."""
+    import outbox
+
+    monkeypatch.setattr(outbox, "LOCK_FILE", str(tmp_path / "outbox.lock"))
+    return outbox
@@ -0,0 +1,54 @@
+import command_apply
+import firestore_client
+import state_store
+from command_apply import POLL_MAX_SECONDS, POLL_MIN_SECONDS
+
+T0 = 1_800_000_000
+DOC_T1 = {"updateTime": "2027-01-15T08:00:00.000000Z", "fields": {"mode": {"stringValue": "force_on"}}}
+
+
+def interval(prev, changed=False, changed_at=0.0, transitions=()):
+    return command_apply.next_interval(prev, changed, changed_at, T0, transitions)
+
+
+def test_poll_interval_tight_after_a_change_or_near_a_transition():
+    assert interval(POLL_MAX_SECONDS, changed=True) == POLL_MIN_SECONDS
+    assert interval(POLL_MAX_SECONDS, changed_at=T0 - 60) == POLL_MIN_SECONDS
+    assert interval(POLL_MAX_SECONDS, transitions=[T0 + 300]) == POLL_MIN_SECONDS
+
+
+def test_poll_interval_backs_off_up_to_the_cap():
+    assert interval(POLL_MIN_SECONDS) == POLL_MIN_SECONDS * 2
+    assert interval(POLL_MAX_SECONDS) == POLL_MAX_SECONDS
+    # ... but wakes up in time for the next transition window
+    upcoming = T0 + command_apply.NEAR_TRANSITION_SECONDS + 60
+    assert interval(POLL_MAX_SECONDS, transitions=[upcoming]) == 60
+
+
+def test_settle_applies_a_changed_doc(box):
+    assert command_apply.settle("d1", {}, DOC_T1, T0)
+    assert state_store.get_override()["mode"] == "force_on"
+    assert state_store.get(command_apply.POLL_KEY)["update_time"] == DOC_T1["updateTime"]
+    # the same version again is not re-applied
+    assert not command_apply.settle("d1", state_store.get(command_apply.POLL_KEY), DOC_T1, T0 + 15)
+
+
+def test_settle_defers_the_version_our_queued_revert_was_written_against(box):
+    box.enqueue(command_apply.COMMANDS_COLLECTION, "d1", {"mode": {"stringValue": "auto"}}, update_mask=["mode"],
+                precondition={"updateTime": DOC_T1["updateTime"]}, version_key=command_apply.POLL_KEY)
+    assert not command_apply.settle("d1", {}, DOC_T1, T0)
+    assert state_store.get_override().get("mode") != "force_on"
+    # a newer override from the dashboard still applies (the revert will be rejected)
+    newer = dict(DOC_T1, updateTime="2027-01-15T08:05:00.000000Z")
+    assert command_apply.settle("d1", {}, newer, T0)
+    assert state_store.get_override()["mode"] == "force_on"
+
+
+def test_settle_applies_a_doc_newer_than_an_unguarded_queued_write(box, monkeypatch):
+    enqueued = firestore_client.timestamp_epoch(DOC_T1["updateTime"]) - 60
+    monkeypatch.setattr(box.time, "time", lambda: enqueued)
+    box.enqueue(command_apply.COMMANDS_COLLECTION, "d1", {"mode": {"stringValue": "force_off"}},
+                update_mask=["mode"], version_key=command_apply.POLL_KEY)
+    assert command_apply.settle("d1", {}, DOC_T1, T0)
+    older = dict(DOC_T1, updateTime="2027-01-15T07:50:00.000000Z")
+    assert not command_apply.settle("d1", {}, older, T0)
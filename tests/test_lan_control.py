@@ -0,0 +1,30 @@
+import socket
+import threading
+
+import pytest
+
+pytest.importorskip("pytz")
+pytest.importorskip("astral")
+
+import lan_control  # noqa: E402
+
+
+@pytest.fixture
+def server(state):
+    srv = lan_control.make_server("d1", "s3cret", ticks=lan_control.Ticks(lambda: None), bind="127.0.0.1", port=0)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def post_mode(srv, content_length: str) -> int:
+    with socket.create_connection(srv.server_address, timeout=5) as s:
+        s.sendall(("POST /mode HTTP/1.1\r\nHost: pi\r\nAuthorization: Bearer s3cret\r\n"
+                   f"Content-Length: {content_length}\r\n\r\n").encode())
+        return int(s.recv(1024).split()[1])
+
+
+@pytest.mark.parametrize("length, status", [("abc", 400), ("-1", 400), ("1.5", 400), ("4096", 413)])
+def test_bad_content_length_is_refused(server, length, status):
+    assert post_mode(server, length) == status
@@ -0,0 +1,117 @@
+import pytest
+
+import firestore_client
+import outbox
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body or {}
+
+    def json(self):
+        return self._body
+
+
+def s(v):
+    return {"stringValue": v}
+
+
+def test_masked_writes_coalesce_into_one_row(box):
+    box.enqueue("devices", "d1", {"a": s("1"), "b": s("1")})
+    box.enqueue("devices", "d1", {"b": s("2")}, update_mask=["b", "gone"])
+    rows = box.pending()
+    assert len(rows) == 1
+    write = rows[0][2]
+    assert write["mask"] is None                      # still a full write
+    assert write["fields"] == {"a": s("1"), "b": s("2")}
+
+
+def test_masks_union_and_absent_fields_delete(box):
+    box.enqueue("devices", "d1", {"a": s("1"), "b": s("1")}, update_mask=["a", "b"])
+    box.enqueue("devices", "d1", {"c": s("3")}, update_mask=["b", "c"])
+    write = box.pending()[0][2]
+    assert write["mask"] == ["a", "b", "c"]
+    assert write["fields"] == {"a": s("1"), "c": s("3")}
+
+
+def test_coalesced_write_keeps_first_precondition(box):
+    box.enqueue("device_commands", "d1", {"mode": s("auto")}, update_mask=["mode"],
+                precondition={"updateTime": "t1"}, version_key="k1")
+    box.enqueue("device_commands", "d1", {"mode": s("force_on")}, update_mask=["mode"],
+                precondition={"updateTime": "t2"}, version_key="k2")
+    write = box.pending()[0][2]
+    assert write["precondition"] == {"updateTime": "t1"}
+    assert write["version_key"] == "k2"
+    assert write["fields"] == {"mode": s("force_on")}
+
+
+def test_guarded_write_keeps_its_guard_over_an_unguarded_one(box):
+    box.enqueue("device_commands", "d1", {"mode": s("force_on")}, update_mask=["mode"])
+    box.enqueue("device_commands", "d1", {"mode": s("auto")}, update_mask=["mode"],
+                precondition={"updateTime": "t1"})
+    write = box.pending()[0][2]
+    assert write["precondition"] == {"updateTime": "t1"}
+    assert write["fields"] == {"mode": s("auto")}
+
+
+def test_stats_do_not_change_between_runs(box, monkeypatch):
+    box.enqueue("devices", "d1", {"a": s("1")})
+    before = box.stats()
+    monkeypatch.setattr(outbox.time, "time", lambda: before["oldest_enqueued_at"] + 3600)
+    assert box.stats() == before
+
+
+def test_eviction_drops_oldest_low_priority_first(box, monkeypatch):
+    monkeypatch.setattr(box, "MAX_ENTRIES", 2)
+    box.enqueue("device_commands", "d1", {"mode": s("auto")}, priority=box.PRIORITY_HIGH)
+    box.enqueue("devices", "d1", {"a": s("1")})
+    box.enqueue("devices", "d2", {"a": s("1")})
+    names = [name.rsplit("/documents/", 1)[-1] for _, name, *_ in box.pending()]
+    assert names == ["device_commands/d1", "devices/d2"]
+    assert box.stats()["dropped"] == 1
+
+
+def test_failed_flush_backs_off_until_forced(box, monkeypatch):
+    calls = []
+    monkeypatch.setattr(firestore_client, "commit", lambda writes, timeout: calls.append(writes) or FakeResponse(503))
+    box.enqueue("devices", "d1", {"a": s("1")})
+    first = box.flush()
+    assert first["attempted"] and first["error"] and first["dropped"] == {}
+    second = box.flush()
+    assert not second["attempted"] and second["depth"] == 1
+    assert len(calls) == 1
+    box.flush(force=True)
+    assert len(calls) == 2
+
+
+def test_rejected_write_is_dropped_rest_delivered(box, monkeypatch):
+    def commit(writes, timeout):
+        if any("currentDocument" in w for w in writes):
+            return FakeResponse(400, {"error": {"code": 400, "message": "stale", "status": "FAILED_PRECONDITION"}})
+        return FakeResponse(200, {"writeResults": [{"updateTime": "t9"}] * len(writes)})
+
+    monkeypatch.setattr(firestore_client, "commit", commit)
+    box.enqueue("device_commands", "d1", {"mode": s("auto")}, update_mask=["mode"],
+                precondition={"updateTime": "t1"})
+    box.enqueue("devices", "d1", {"a": s("1")})
+    r = box.flush()
+    assert r["delivered"] == [firestore_client.document_name("devices", "d1")]
+    assert r["error"] is None and r["depth"] == 0
+    assert r["dropped"] == {firestore_client.document_name("device_commands", "d1"): "FAILED_PRECONDITION"}
+    assert box.stats()["dropped"] == 1
+
+
+def test_revert_outcome_uses_the_upload_result(box):
+    pytest.importorskip("pytz")
+    pytest.importorskip("astral")
+    import status_test
+
+    name = firestore_client.document_name(status_test.COMMANDS_COLLECTION, "d1")
+    assert status_test.revert_outcome("d1", {"sent": [name]}) == "with_status"
+    assert status_test.revert_outcome("d1", {"sent": [], "dropped": {name: "FAILED_PRECONDITION"}}) == "rejected"
+    assert status_test.revert_outcome("d1", {"sent": [], "dropped": {name: "HTTP 403"}}) == "dropped"
+    # gone from the outbox without this upload seeing it: not reported as rejected
+    assert status_test.revert_outcome("d1", {"sent": [], "dropped": {}}) == "elsewhere"
+    box.enqueue(status_test.COMMANDS_COLLECTION, "d1", {"mode": s("auto")}, update_mask=["mode"])
+    assert status_test.revert_outcome("d1", {"sent": [], "dropped": {}}) == "queued"
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("pytz")
+pytest.importorskip("astral")
+
+import command_apply  # noqa: E402
+import firestore_client  # noqa: E402
+import firestore_upload_status  # noqa: E402
+import lpi_pipeline  # noqa: E402
+import status_test  # noqa: E402
+
+
+@pytest.fixture
+def pipeline(box, tmp_path, monkeypatch):
+    monkeypatch.setattr(lpi_pipeline, "NETWORK_LOCK_FILES", (str(tmp_path / "cmd.lock"), str(tmp_path / "upload.lock")))
+    monkeypatch.setattr(lpi_pipeline, "revert_pending", False)
+    monkeypatch.setattr(firestore_client, "has_credentials", lambda: True)
+    monkeypatch.setattr(status_test, "run_status", lambda *a, **k: {"relay": "set"})
+    return lpi_pipeline
+
+
+def test_tick_sets_the_relay_without_waiting_for_the_network(pipeline, monkeypatch):
+    release = threading.Event()
+    uploading = threading.Event()
+
+    def hung_upload(*args, **kwargs):
+        uploading.set()
+        release.wait(5)
+        return {"delivered": True, "sent": [], "dropped": {}}
+
+    monkeypatch.setattr(firestore_upload_status, "upload", hung_upload)
+    monkeypatch.setattr(command_apply, "fetch", lambda *a, **k: None)
+
+    async def go():
+        publish, wake = asyncio.Event(), asyncio.Event()
+        network = asyncio.create_task(pipeline.network("d1", publish, wake))
+        try:
+            assert await asyncio.wait_for(pipeline.tick("d1", publish), 1) == {"relay": "set"}
+            await asyncio.to_thread(uploading.wait, 1)
+            # the next tick runs while the upload still hangs
+            assert await asyncio.wait_for(pipeline.tick("d1", publish), 1) == {"relay": "set"}
+        finally:
+            release.set()
+            network.cancel()
+
+    asyncio.run(go())
+
+
+def test_applied_command_doc_wakes_the_tick(pipeline, monkeypatch):
+    monkeypatch.setattr(firestore_upload_status, "upload",
+                        lambda *a, **k: {"delivered": True, "sent": [], "dropped": {}})
+    monkeypatch.setattr(command_apply, "fetch", lambda *a, **k: ({}, {"updateTime": "t1"}, 0.0))
+    monkeypatch.setattr(command_apply, "settle", lambda *a, **k: True)
+
+    async def go():
+        wake = asyncio.Event()
+        await pipeline.publish_once("d1", wake)
+        assert wake.is_set()
+
+    asyncio.run(go())
@@ -0,0 +1,23 @@
+import relay_history
+
+T0 = 1_800_000_000
+
+
+def on_seconds():
+    return relay_history._db().execute("SELECT SUM(on_seconds) FROM relay_daily").fetchone()[0]
+
+
+def test_gap_is_capped_without_a_hold(state):
+    relay_history.record([("main", True, "timer")], T0)
+    relay_history.record([("main", True, "timer")], T0 + 900)
+    assert on_seconds() == relay_history.MAX_GAP_SECONDS
+
+
+def test_hold_until_credits_the_whole_sleep(state):
+    relay_history.record([("main", True, "timer")], T0)
+    relay_history.hold_until(T0 + 3600)
+    relay_history.record([("main", True, "timer")], T0 + 900)
+    assert on_seconds() == 900
+    # the hold is used up by that run
+    relay_history.record([("main", True, "timer")], T0 + 1800)
+    assert on_seconds() == 900 + relay_history.MAX_GAP_SECONDS
@@ -0,0 +1,63 @@
+import datetime
+import types
+
+import schedule_table
+
+UTC = datetime.timezone.utc
+DAY = datetime.date(2026, 10, 17)
+
+
+def city(**kw):
+    fields = dict(name="Raleigh", region="USA", timezone="America/New_York", latitude=35.7796, longitude=-78.6382)
+    fields.update(kw)
+    return types.SimpleNamespace(**fields)
+
+
+def localize(tz, naive):
+    return naive.replace(tzinfo=tz)
+
+
+def fixed_day(city, light_off_hour, d, tz, localize):
+    sunset = datetime.datetime.combine(d, datetime.time(22, 30), tz)
+    return sunset, datetime.datetime.combine(d + datetime.timedelta(days=1), datetime.time(light_off_hour), tz)
+
+
+def test_fingerprint_changes_with_location_and_off_hour_only():
+    base = schedule_table.fingerprint(city(), 1)
+    assert schedule_table.fingerprint(city(name="Home", region="Lab"), 1) == base
+    assert schedule_table.fingerprint(city(timezone="America/Chicago"), 1) != base
+    assert schedule_table.fingerprint(city(latitude=36.0), 1) != base
+    assert schedule_table.fingerprint(city(longitude=-79.0), 1) != base
+    assert schedule_table.fingerprint(city(), 2) != base
+
+
+def test_fingerprint_is_memoized(monkeypatch):
+    monkeypatch.setattr(schedule_table, "_fingerprints", {})
+    schedule_table.fingerprint(city(), 1)
+    monkeypatch.setattr(schedule_table.hashlib, "sha1", None)
+    schedule_table.fingerprint(city(), 1)
+
+
+def test_table_round_trip_and_stale_fingerprint_rebuilds(tmp_path, monkeypatch):
+    path = str(tmp_path / "lpi_schedule.bin")
+    monkeypatch.setattr(schedule_table, "compute_day", fixed_day)
+    schedule_table.build(path, city(), 1, UTC, localize, DAY, days=3)
+    assert schedule_table.day_times(city(), 1, DAY + datetime.timedelta(days=1), UTC, localize, path) == \
+        fixed_day(None, 1, DAY + datetime.timedelta(days=1), UTC, None)
+    # a moved device doesn't read the old table: it is rebuilt for the new location
+    moved = city(latitude=40.0)
+    assert schedule_table.day_times(moved, 1, DAY, UTC, localize, path) == fixed_day(None, 1, DAY, UTC, None)
+    assert schedule_table._open(path)[0] == schedule_table.fingerprint(moved, 1)
+    schedule_table._close(path)
+
+
+def test_failed_rebuild_is_not_retried_every_lookup(tmp_path, monkeypatch):
+    path = str(tmp_path / "missing" / "lpi_schedule.bin")
+    monkeypatch.setattr(schedule_table, "compute_day", fixed_day)
+    monkeypatch.setattr(schedule_table, "_rebuild_failed", {})
+    builds = []
+    real_build = schedule_table.build
+    monkeypatch.setattr(schedule_table, "build", lambda *a, **k: builds.append(a) or real_build(*a, **k))
+    for _ in range(3):
+        assert schedule_table.day_times(city(), 1, DAY, UTC, localize, path) == fixed_day(None, 1, DAY, UTC, None)
+    assert len(builds) == 1
@@ -0,0 +1,36 @@
+import json
+import os
+
+
+def updated_at(state, key):
+    return state.connection().execute("SELECT updated_at FROM kv WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_timings_alone_do_not_rewrite_the_status(state):
+    status = {"last_updated": "2026-10-17T20:00:00", "relay_state": "ON", "timings": {"n": 1}}
+    assert state.put("status", status)
+    before = updated_at(state, "status")
+    assert not state.put("status", dict(status, timings={"n": 2}))
+    assert updated_at(state, "status") == before
+    assert state.get("status")["timings"] == {"n": 1}
+
+
+def test_last_updated_is_persisted_and_exported(state):
+    status = {"last_updated": "2026-10-17T20:00:00", "relay_state": "ON"}
+    state.put("status", status)
+    assert state.put("status", dict(status, last_updated="2026-10-17T20:00:15"))
+    assert state.get("status")["last_updated"] == "2026-10-17T20:00:15"
+    with open(state.STATUS_FILE) as f:
+        assert json.load(f)["last_updated"] == "2026-10-17T20:00:15"
+
+
+def test_export_replaces_the_file_only_on_change(state, tmp_path):
+    state.set_override("force_on", "2026-10-17T20:00:00")
+    inode = os.stat(state.OVERRIDE_FILE).st_ino
+    state.export_legacy(["override"])
+    assert os.stat(state.OVERRIDE_FILE).st_ino == inode
+    state.set_override("auto", "2026-10-17T21:00:00")
+    assert os.stat(state.OVERRIDE_FILE).st_ino != inode
+    with open(state.OVERRIDE_FILE) as f:
+        assert f.read() == "auto\n"
+    assert not [p for p in os.listdir(tmp_path) if ".tmp" in p]
@@ -0,0 +1,37 @@
+import datetime as dt
+
+import pytest
+
+pytz = pytest.importorskip("pytz")
+pytest.importorskip("astral")
+
+import relay  # noqa: E402
+import schedule_engine  # noqa: E402
+import schedule_rules  # noqa: E402
+import status_test  # noqa: E402
+import timer  # noqa: E402
+
+
+@pytest.fixture
+def rules_env(state, tmp_path, monkeypatch):
+    monkeypatch.setattr(schedule_rules, "CALENDAR_PATH", str(tmp_path / "lpi_calendar.json"))
+    monkeypatch.setattr(schedule_rules, "_calendars", {})
+    monkeypatch.setattr(relay, "_relays", {})
+
+
+def test_rules_channel_without_upcoming_window(rules_env):
+    channels = [
+        schedule_engine.Channel("lot", 23, timer.city, rules=schedule_rules.validate([{"skip": True}])),
+        schedule_engine.Channel("sign", 24, timer.city,
+                                rules=schedule_rules.validate([{"on": "18:00", "off": "23:00"}])),
+    ]
+    now = pytz.timezone(timer.city.timezone).localize(dt.datetime(2026, 10, 17, 19, 0))
+
+    decisions, lines = status_test.run_channels(channels, "auto", "dev", now)
+
+    by_name = {d["name"]: d for d in decisions}
+    assert by_name["lot"]["lighton"] is None and by_name["lot"]["lightoff"] is None
+    assert by_name["lot"]["on"] is False
+    assert by_name["sign"]["on"] is True
+    assert any(line.startswith("lot") and "on - off -" in line for line in lines)
+    assert any(line.startswith("sign") and "on 18:00 off 23:00" in line for line in lines)
@@ -0,0 +1,41 @@
+import datetime
+
+import pytest
+
+pytz = pytest.importorskip("pytz")
+pytest.importorskip("astral")
+
+import schedule_engine  # noqa: E402
+import schedule_table  # noqa: E402
+import timer  # noqa: E402
+
+TZ = pytz.timezone(timer.city.timezone)
+# 2026-11-01: America/New_York falls back at 2:00 EDT, so 1:00-2:00 happens twice
+FIRST_PASS = TZ.localize(datetime.datetime(2026, 11, 1, 1, 30), is_dst=True)
+SECOND_PASS = TZ.localize(datetime.datetime(2026, 11, 1, 1, 30), is_dst=False)
+
+
+@pytest.fixture(autouse=True)
+def table(tmp_path, monkeypatch):
+    monkeypatch.setattr(schedule_table, "SCHEDULE_PATH", str(tmp_path / "lpi_schedule.bin"))
+
+
+def test_fall_back_first_pass_is_still_the_previous_night():
+    ref, _, _, lightoff = timer.schedule_for(FIRST_PASS)
+    assert ref == datetime.date(2026, 10, 31)
+    # safe_localize puts the OFF instant at the later 1:00 (EST)
+    assert lightoff == TZ.localize(datetime.datetime(2026, 11, 1, 1, 0), is_dst=False)
+    assert timer.decide(FIRST_PASS)
+
+
+def test_fall_back_second_pass_is_off():
+    assert timer.schedule_for(SECOND_PASS)[0] == datetime.date(2026, 11, 1)
+    assert not timer.decide(SECOND_PASS)
+
+
+def test_engine_agrees_on_the_ambiguous_hour():
+    solar = schedule_engine.SolarCache()
+    ch = schedule_engine.DEFAULT_CHANNEL
+    for now in (FIRST_PASS, SECOND_PASS):
+        _, lighton, lightoff = solar.window(ch, now)
+        assert (lighton <= now < lightoff) == timer.decide(now)
@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+# LPI Firestore Stand-in
+# Version: 1.2.0
+# Last updated: 2026-10-17
+#
+# Local HTTP server speaking the slice of the Firestore REST API the device scripts
+# use, plus the OAuth token endpoint, with injectable latency and errors. For load
+# tests (tools/lpi_fleet_load.py) and for running a Pi's scripts against a laptop.
+#
+#   python3 tools/firestore_standin.py --port 8787
+#   python3 tools/firestore_standin.py --port 8787 --latency-ms 80 --jitter-ms 40 \
+#       --error-rate 0.01 --qps-limit 500
+#
+# Point the device scripts at it (firestore_client.py):
+#   FIRESTORE_EMULATOR_HOST=127.0.0.1:8787            no OAuth
+#   LPI_FIRESTORE_URL=http://127.0.0.1:8787/v1         OAuth against POST /token (set
+#                                                      "token_uri" in the key file to
+#                                                      http://127.0.0.1:8787/token)
+#
+# Endpoints:
+#   GET    /v1/{document}?mask.fieldPaths=...          404 if missing
+#   GET    /v1/{database}/documents/{collection}       list (pageSize / pageToken, mask)
+#   POST   /v1/{database}/documents:batchGet           found / missing, streamed array
+#   POST   /v1/{database}/documents:runQuery           fieldFilter / AND compositeFilter
+#                                                      (comparisons, IN), orderBy, limit,
+#                                                      startAt; streamed array
+#   PATCH  /v1/{document}?updateMask.fieldPaths=...    masked or full write
+#   POST   /v1/{database}/documents:commit             atomic writes (update + updateMask
+#                                                      + currentDocument)
+#   POST   /token                                      JWT-bearer grant -> access token
+#   GET    /_stats                                     request counts, see stats()
+#   POST   /_reset                                     clear counters (documents stay)
+#   POST   /_reset?docs=1                              ... and documents
+#
+# Preconditions (currentDocument.updateTime / .exists, on PATCH as query parameters)
+# are checked like Firestore: a mismatch fails the request (the whole commit) with
+# 400 FAILED_PRECONDITION and nothing is written.
+#
+# Injection (applied to every Firestore / token call, not to /_stats / /_reset):
+#   --latency-ms / --jitter-ms   sleep latency + uniform(0, jitter) before answering
+#   --error-rate / --error-status  answer that fraction with error-status (default 503)
+#   --qps-limit                  token bucket over all calls; over it -> 429 with
+#                                Retry-After, like Firestore's per-database throttling
+#   --require-auth               401 unless the bearer token came from /token
+#                                (or is "owner", what emulator mode sends)
+
+import argparse
+import collections
+import datetime
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = "/v1/"
+TOKEN_SECONDS = 3600
+HISTORY_SECONDS = 3600      # per-second request counts kept for stats()
+
+
+class Config:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, error_status=503,
+                 qps_limit=0.0, require_auth=False, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.qps_limit = qps_limit
+        self.require_auth = require_auth
+        self.random = random.Random(seed)
+
+
+# ---- Field paths on Firestore-encoded fields ----
+def _get_path(fields: dict, path: str):
+    parts = path.split(".")
+    cur = fields
+    for part in parts[:-1]:
+        v = cur.get(part)
+        if not v or "mapValue" not in v:
+            return None
+        cur = v["mapValue"].get("fields", {})
+    return cur.get(parts[-1])
+
+
+def _set_path(fields: dict, path: str, value) -> None:
+    parts = path.split(".")
+    cur = fields
+    for part in parts[:-1]:
+        v = cur.get(part)
+        if not v or "mapValue" not in v:
+            if value is None:
+                return
+            v = cur[part] = {"mapValue": {"fields": {}}}
+        cur = v["mapValue"].setdefault("fields", {})
+    if value is None:
+        cur.pop(parts[-1], None)
+    else:
+        cur[parts[-1]] = value
+
+
+def _timestamp() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _value(v):
+    """Plain Python value of one Firestore-encoded value (for query comparisons)."""
+    if not v:
+        return None
+    kind, raw = next(iter(v.items()))
+    if kind == "integerValue":
+        return int(raw)
+    if kind == "arrayValue":
+        return [_value(x) for x in raw.get("values", [])]
+    if kind in ("nullValue", "mapValue"):
+        return None
+    return raw
+
+
+def _sort_key(value):
+    # Firestore orders across types; here null < bool < number < string < other is enough
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    return (4, json.dumps(value, sort_keys=True))
+
+
+QUERY_OPS = {
+    "EQUAL": lambda a, b: a == b,
+    "NOT_EQUAL": lambda a, b: a is not None and a != b,
+    "LESS_THAN": lambda a, b: a is not None and _sort_key(a) < _sort_key(b),
+    "LESS_THAN_OR_EQUAL": lambda a, b: a is not None and _sort_key(a) <= _sort_key(b),
+    "GREATER_THAN": lambda a, b: a is not None and _sort_key(a) > _sort_key(b),
+    "GREATER_THAN_OR_EQUAL": lambda a, b: a is not None and _sort_key(a) >= _sort_key(b),
+    "IN": lambda a, b: a in b,
+    "NOT_IN": lambda a, b: a is not None and a not in b,
+    "ARRAY_CONTAINS": lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+def _matches(doc: dict, where) -> bool:
+    if not where:
+        return True
+    if "compositeFilter" in where:
+        return all(_matches(doc, f) for f in where["compositeFilter"].get("filters", []))
+    f = where["fieldFilter"]
+    field = _value(_get_path(doc["fields"], f["field"]["fieldPath"]))
+    return QUERY_OPS[f["op"]](field, _value(f["value"]))
+
+
+def _failed_precondition(message: str) -> dict:
+    return {"error": {"code": 400, "message": message, "status": "FAILED_PRECONDITION"}}
+
+
+def _collection(name: str) -> str:
+    """devices / device_commands / ... from a document name."""
+    tail = name.split("/documents/", 1)[-1]
+    return tail.split("/", 1)[0]
+
+
+class Backend:
+    """Documents, tokens, throttling and counters; shared by all handler threads."""
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.docs = {}
+        self.tokens = set()
+        self._bucket = config.qps_limit
+        self._bucket_at = time.monotonic()
+        self.reset(docs=False)
+
+    def reset(self, docs: bool) -> None:
+        with self.lock:
+            if docs:
+                self.docs.clear()
+            self.counts = collections.Counter()          # "GET devices" -> n
+            self.statuses = collections.Counter()        # "429" -> n
+            self.per_second = collections.Counter()      # int(epoch) -> n
+            self.started = time.time()
+
+    # ---- Injection ----
+    def admit(self):
+        """None to serve the call, else (status, extra headers) to fail it with."""
+        c = self.config
+        with self.lock:
+            if c.qps_limit > 0:
+                now = time.monotonic()
+                self._bucket = min(c.qps_limit, self._bucket + (now - self._bucket_at) * c.qps_limit)
+                self._bucket_at = now
+                if self._bucket < 1:
+                    return 429, {"Retry-After": "1"}
+                self._bucket -= 1
+            fail = c.error_rate > 0 and c.random.random() < c.error_rate
+            delay = (c.latency_ms + c.random.uniform(0, c.jitter_ms)) / 1000.0
+        if delay > 0:
+            time.sleep(delay)
+        return (c.error_status, {}) if fail else None
+
+    def count(self, key: str, status: int) -> None:
+        with self.lock:
+            self.counts[key] += 1
+            self.statuses[str(status)] += 1
+            now = int(time.time())
+            self.per_second[now] += 1
+            if len(self.per_second) > HISTORY_SECONDS:
+                for s in sorted(self.per_second)[:-HISTORY_SECONDS]:
+                    del self.per_second[s]
+
+    # ---- Documents ----
+    def collection(self, parent: str) -> list:
+        """Names of the documents directly in collection path `parent`, sorted."""
+        prefix = parent + "/"
+        return sorted(n for n in self.docs if n.startswith(prefix) and "/" not in n[len(prefix):])
+
+    def get(self, name: str, mask):
+        with self.lock:
+            doc = self.docs.get(name)
+            if doc is None:
+                return None
+            doc = json.loads(json.dumps(doc))
+        if mask:
+            fields = {}
+            for path in mask:
+                v = _get_path(doc["fields"], path)
+                if v is not None:
+                    _set_path(fields, path, v)
+            doc["fields"] = fields
+        return doc
+
+    def check(self, name: str, precondition) -> str:
+        """Why `precondition` (currentDocument) fails for name, or "" (caller holds the lock)."""
+        if not precondition:
+            return ""
+        doc = self.docs.get(name)
+        if "exists" in precondition and bool(precondition["exists"]) != (doc is not None):
+            return f"Document \"{name}\" " + ("not found." if doc is None else "already exists.")
+        if "updateTime" in precondition and (doc is None or doc["updateTime"] != precondition["updateTime"]):
+            return f"Document \"{name}\" was updated since {precondition['updateTime']}."
+        return ""
+
+    def write(self, name: str, fields: dict, mask) -> dict:
+        """Apply one write (caller holds the lock)."""
+        now = _timestamp()
+        doc = self.docs.get(name)
+        if doc is None:
+            doc = self.docs[name] = {"name": name, "fields": {}, "createTime": now}
+        if mask is None:
+            doc["fields"] = json.loads(json.dumps(fields))
+        else:
+            for path in mask:
+                _set_path(doc["fields"], path, json.loads(json.dumps(_get_path(fields, path))))
+        doc["updateTime"] = now
+        return doc
+
+    def stats(self) -> dict:
+        with self.lock:
+            seconds = sorted(self.per_second.items())
+            elapsed = max(1e-9, time.time() - self.started)
+            total = sum(self.counts.values())
+            return {
+                "requests": total,
+                "by_endpoint": dict(self.counts),
+                "by_status": dict(self.statuses),
+                "elapsed_s": round(elapsed, 3),
+                "avg_qps": round(total / elapsed, 2),
+                "peak_qps": max((n for _, n in seconds), default=0),
+                "per_second": {str(s): n for s, n in seconds},
+                "documents": len(self.docs),
+                "tokens_issued": len(self.tokens),
+            }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    backend = None   # set by make_server()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body, headers=None) -> None:
+        blob = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(blob)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(blob)
+
+    def _error(self, status: int, message: str, headers=None) -> None:
+        self._send(status, {"error": {"code": status, "message": message}}, headers)
+
+    def _body(self) -> bytes:
+        n = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(n) if n else b""
+
+    def _serve(self, key: str, fn) -> None:
+        """Count, inject, check auth, then fn() -> (status, body)."""
+        body = self._body()
+        failed = self.backend.admit()
+        if failed is not None:
+            status, headers = failed
+            self.backend.count(key, status)
+            return self._error(status, "injected" if status != 429 else "quota exceeded", headers)
+        if self.backend.config.require_auth and key != "token":
+            token = (self.headers.get("Authorization") or "").split("Bearer ", 1)[-1]
+            if token != "owner" and token not in self.backend.tokens:
+                self.backend.count(key, 401)
+                return self._error(401, "unauthenticated")
+        try:
+            status, out = fn(body)
+        except (ValueError, KeyError) as e:
+            status, out = 400, {"error": {"code": 400, "message": f"bad request: {e}"}}
+        self.backend.count(key, status)
+        self._send(status, out)
+
+    # ---- Control ----
+    def _control(self, path: str, query: dict) -> bool:
+        if path == "/_stats":
+            self._send(200, self.backend.stats())
+            return True
+        if path == "/_reset":
+            self.backend.reset(docs=query.get("docs") == ["1"])
+            self._send(200, {})
+            return True
+        return False
+
+    def do_GET(self):
+        u = urlparse(self.path)
+        q = parse_qs(u.query)
+        if self._control(u.path, q):
+            return
+        if not u.path.startswith(API_PREFIX):
+            return self._error(404, "not found")
+        name = u.path[len(API_PREFIX):]
+        if name.split("/documents/", 1)[-1].count("/") % 2 == 0:
+            return self._serve(f"LIST {_collection(name)}", lambda _: self._list(name, q))
+
+        def get(_):
+            doc = self.backend.get(name, q.get("mask.fieldPaths"))
+            if doc is None:
+                return 404, {"error": {"code": 404, "message": f"Document \"{name}\" not found."}}
+            return 200, doc
+
+        self._serve(f"GET {_collection(name)}", get)
+
+    def do_PATCH(self):
+        u = urlparse(self.path)
+        q = parse_qs(u.query)
+        if not u.path.startswith(API_PREFIX):
+            return self._error(404, "not found")
+        name = u.path[len(API_PREFIX):]
+
+        precondition = {}
+        if "currentDocument.updateTime" in q:
+            precondition["updateTime"] = q["currentDocument.updateTime"][0]
+        if "currentDocument.exists" in q:
+            precondition["exists"] = q["currentDocument.exists"][0] == "true"
+
+        def patch(body):
+            fields = json.loads(body or b"{}").get("fields", {})
+            with self.backend.lock:
+                failed = self.backend.check(name, precondition)
+                if failed:
+                    return 400, _failed_precondition(failed)
+                doc = json.loads(json.dumps(self.backend.write(name, fields, q.get("updateMask.fieldPaths"))))
+            return 200, doc
+
+        self._serve(f"PATCH {_collection(name)}", patch)
+
+    def do_POST(self):
+        u = urlparse(self.path)
+        q = parse_qs(u.query)
+        if self._control(u.path, q):
+            return
+        if u.path == "/token":
+            return self._serve("token", self._token)
+        if u.path.startswith(API_PREFIX) and u.path.endswith("/documents:commit"):
+            return self._serve("commit", self._commit)
+        if u.path.startswith(API_PREFIX) and u.path.endswith("/documents:batchGet"):
+            return self._serve("batchGet", self._batch_get)
+        if u.path.startswith(API_PREFIX) and u.path.endswith("/documents:runQuery"):
+            database = u.path[len(API_PREFIX):-len(":runQuery")]
+            return self._serve("runQuery", lambda body: self._run_query(database, body))
+        self._error(404, "not found")
+
+    def _list(self, parent: str, q: dict):
+        size = int(q.get("pageSize", ["300"])[0])
+        start = int(q.get("pageToken", ["0"])[0])
+        with self.backend.lock:
+            names = self.backend.collection(parent)
+        page = [self.backend.get(n, q.get("mask.fieldPaths")) for n in names[start:start + size]]
+        out = {"documents": [d for d in page if d is not None]}
+        if start + size < len(names):
+            out["nextPageToken"] = str(start + size)
+        return 200, out
+
+    def _batch_get(self, body):
+        req = json.loads(body or b"{}")
+        mask = (req.get("mask") or {}).get("fieldPaths")
+        out = []
+        for name in req.get("documents", []):
+            doc = self.backend.get(name, mask)
+            out.append({"found": doc} if doc is not None else {"missing": name})
+        return 200, out
+
+    def _run_query(self, database: str, body):
+        query = json.loads(body or b"{}")["structuredQuery"]
+        parent = f"{database}/{query['from'][0]['collectionId']}"
+        order = [o["field"]["fieldPath"] for o in query.get("orderBy", [])] or ["__name__"]
+
+        def key(doc):
+            return [_sort_key(doc["name"] if p == "__name__" else _value(_get_path(doc["fields"], p)))
+                    for p in order]
+
+        with self.backend.lock:
+            names = self.backend.collection(parent)
+        docs = [d for d in (self.backend.get(n, None) for n in names) if d is not None]
+        docs = sorted((d for d in docs if _matches(d, query.get("where"))), key=key)
+        start_at = query.get("startAt")
+        if start_at:
+            cursor = [_sort_key(v.get("referenceValue") if "referenceValue" in v else _value(v))
+                      for v in start_at["values"]]
+            before = start_at.get("before", False)
+            docs = [d for d in docs if (key(d)[:len(cursor)] >= cursor if before else key(d)[:len(cursor)] > cursor)]
+        docs = docs[:query["limit"]] if "limit" in query else docs
+        return 200, [{"document": d, "readTime": _timestamp()} for d in docs] or [{"readTime": _timestamp()}]
+
+    def _token(self, body):
+        form = parse_qs(body.decode("utf-8"))
+        if not form.get("assertion"):
+            return 400, {"error": "invalid_request", "error_description": "missing assertion"}
+        token = f"standin-{random.getrandbits(64):016x}"
+        with self.backend.lock:
+            self.backend.tokens.add(token)
+        return 200, {"access_token": token, "expires_in": TOKEN_SECONDS, "token_type": "Bearer"}
+
+    def _commit(self, body):
+        writes = json.loads(body or b"{}").get("writes", [])
+        with self.backend.lock:
+            for w in writes:
+                failed = self.backend.check(w["update"]["name"], w.get("currentDocument"))
+                if failed:
+                    return 400, _failed_precondition(failed)
+            results = []
+            for w in writes:
+                doc = self.backend.write(w["update"]["name"], w["update"].get("fields", {}),
+                                         w.get("updateMask", {}).get("fieldPaths"))
+                results.append({"updateTime": doc["updateTime"]})
+        return 200, {"writeResults": results, "commitTime": _timestamp()}
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024      # a fleet connecting in the same second
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8787, config: Config = None) -> Server:
+    """A server bound to (host, port) -- port 0 picks a free one (server.server_address)."""
+    handler = type("BoundHandler", (Handler,), {"backend": Backend(config or Config())})
+    return Server((host, port), handler)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local Firestore REST stand-in for LPI load tests")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8787)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls failed on purpose")
+    ap.add_argument("--error-status", type=int, default=503)
+    ap.add_argument("--qps-limit", type=float, default=0.0, help="429 above this rate (0 = off)")
+    ap.add_argument("--require-auth", action="store_true")
+    ap.add_argument("--seed", type=int)
+    args = ap.parse_args()
+
+    config = Config(args.latency_ms, args.jitter_ms, args.error_rate, args.error_status,
+                    args.qps_limit, args.require_auth, args.seed)
+    server = make_server(args.host, args.port, config)
+    host, port = server.server_address[:2]
+    print(f"Firestore stand-in on http://{host}:{port}/v1 (token endpoint http://{host}:{port}/token)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
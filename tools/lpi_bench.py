@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+# LPI Bench
+# Version: 1.1.0
+# Last updated: 2026-10-17
+#
+# Simulated-clock benchmark + regression run for the timer and auto-revert logic.
+# Runs on a workstation (or a Pi), never touches real GPIO or Firestore:
+#   - relay.py in mock mode (LPI_RELAY_BACKEND=mock)
+#   - an in-process fake of firestore_client's document calls (incl. the outbox's commit)
+#   - schedule table, state DB and device id in a scratch directory
+#
+#   python3 tools/lpi_bench.py                            # 2 years, minute by minute
+#   python3 tools/lpi_bench.py --step 5                   # quicker pass
+#   python3 tools/lpi_bench.py --years 4 --json out.json
+#   python3 tools/lpi_bench.py --step 5 --baseline out.json   # compare against an earlier run
+#   python3 tools/lpi_bench.py --location "London,Europe/London,51.5074,-0.1278"
+#
+# Phases:
+#   decisions     timer.decide() every minute vs an astral oracle; relay writes per day
+#   localize      safe_localize() every minute, plus every minute inside each DST
+#                 gap/overlap in range (nonexistent -> +1h, ambiguous -> later occurrence)
+#   revert        status_test.first_off_after() / first_lighton_after() every minute vs
+#                 the brute-force "first candidate after set_at"
+#   auto_revert   status_test.run_status() end to end on simulated time: a force_on /
+#                 force_off set every --scenario-hours must survive the minute before its
+#                 cutoff and revert (state, relay, Firestore PATCH) at the cutoff
+#
+# Output: per-stage call latency (mean/p50/p95/p99/max), decisions/sec and check
+# results, as JSON (--json) for comparing versions. --baseline flags stages whose
+# p50 got slower than --tolerance. Exit status is 1 on any failed check or regression.
+
+import argparse
+import collections
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PI_DIR = os.path.join(REPO_ROOT, "pi")
+MONITOR_DIR = os.path.join(PI_DIR, "pi_monitor_test")
+sys.path.insert(0, MONITOR_DIR)
+sys.path.insert(0, PI_DIR)
+
+# Before relay.py hands out any line
+os.environ["LPI_RELAY_BACKEND"] = "mock"
+
+import pytz  # noqa: E402
+
+import firestore_client  # noqa: E402
+import relay  # noqa: E402
+import schedule_engine  # noqa: E402
+import schedule_table  # noqa: E402
+import state_store  # noqa: E402
+import status_test  # noqa: E402
+import timer  # noqa: E402
+
+FORMAT = 1
+DEVICE_ID = "bench-device"
+MAX_EXAMPLES = 5
+VERSIONED_FILES = (
+    "pi/timer.py",
+    "pi/schedule_table.py",
+    "pi/relay.py",
+    "pi/pi_monitor_test/status_test.py",
+    "pi/pi_monitor_test/state_store.py",
+)
+
+
+# ---------------- Measurement ----------------
+class Stages:
+    """Per-call latency samples (ns) per named stage."""
+
+    def __init__(self):
+        self.ns = collections.defaultdict(list)
+
+    def time(self, stage: str, fn, *args):
+        t0 = time.perf_counter_ns()
+        r = fn(*args)
+        self.ns[stage].append(time.perf_counter_ns() - t0)
+        return r
+
+    def summary(self) -> dict:
+        out = {}
+        for stage, samples in sorted(self.ns.items()):
+            s = sorted(samples)
+            n = len(s)
+            total = sum(s)
+            out[stage] = {
+                "calls": n,
+                "total_ms": total / 1e6,
+                "mean_us": total / n / 1e3,
+                "p50_us": s[n // 2] / 1e3,
+                "p95_us": s[min(n - 1, int(n * 0.95))] / 1e3,
+                "p99_us": s[min(n - 1, int(n * 0.99))] / 1e3,
+                "max_us": s[-1] / 1e3,
+                "calls_per_sec": n / (total / 1e9) if total else None,
+            }
+        return out
+
+
+class Checks:
+    """Pass/fail counters per named check, with the first few failures kept."""
+
+    def __init__(self):
+        self.results = collections.OrderedDict()
+
+    def check(self, name: str, ok: bool, detail=None) -> bool:
+        r = self.results.setdefault(name, {"checked": 0, "failures": 0, "examples": []})
+        r["checked"] += 1
+        if not ok:
+            r["failures"] += 1
+            if len(r["examples"]) < MAX_EXAMPLES:
+                r["examples"].append(detail() if callable(detail) else detail)
+        return ok
+
+    def ok(self) -> bool:
+        return all(r["failures"] == 0 for r in self.results.values())
+
+
+# ---------------- Fakes ----------------
+class FakeResponse:
+    def __init__(self, status_code: int = 200, body=None):
+        self.status_code = status_code
+        self._body = body or {}
+        self.text = json.dumps(self._body)
+
+    def json(self):
+        return self._body
+
+
+class FakeFirestore:
+    """Stands in for firestore_client's document calls; records every PATCH."""
+
+    def __init__(self):
+        self.docs = {}
+        self.patches = []
+
+    def has_credentials(self) -> bool:
+        return True
+
+    def get_document(self, collection, doc_id, mask=None, timeout=None):
+        doc = self.docs.get((collection, doc_id))
+        if doc is None:
+            return {}
+        fields = doc["fields"]
+        if mask is not None:
+            fields = {k: v for k, v in fields.items() if k in mask}
+        return {"name": firestore_client.document_name(collection, doc_id), "fields": fields}
+
+    def patch_document(self, collection, doc_id, fields, update_mask=None, timeout=None):
+        self.patches.append({"collection": collection, "doc_id": doc_id,
+                             "fields": fields, "update_mask": update_mask})
+        doc = self.docs.setdefault((collection, doc_id), {"fields": {}})
+        if update_mask:
+            for path in update_mask:
+                top = path.split(".")[0]
+                if top in fields:
+                    doc["fields"][top] = fields[top]
+                else:
+                    doc["fields"].pop(top, None)
+        else:
+            doc["fields"] = dict(fields)
+        return FakeResponse(200, {"fields": doc["fields"]})
+
+    def commit(self, writes, timeout=None):
+        """documents:commit as one patch_document per write (outbox.py flushes through this)."""
+        for w in writes:
+            collection, doc_id = w["update"]["name"].split("/documents/", 1)[1].split("/", 1)
+            mask = w.get("updateMask", {}).get("fieldPaths")
+            self.patch_document(collection, doc_id, w["update"]["fields"], update_mask=mask)
+        return FakeResponse(200, {"writeResults": [{} for _ in writes]})
+
+    def install(self) -> None:
+        firestore_client.has_credentials = self.has_credentials
+        firestore_client.get_document = self.get_document
+        firestore_client.patch_document = self.patch_document
+        firestore_client.commit = self.commit
+
+
+def sandbox(workdir: str) -> None:
+    """Point every on-device path the replay touches into workdir."""
+    schedule_table.SCHEDULE_PATH = os.path.join(workdir, "lpi_schedule.bin")
+    state_store.STATE_DB = os.path.join(workdir, "lpi_state.db")
+    state_store.OVERRIDE_FILE = os.path.join(workdir, "override_mode.txt")
+    state_store.STATE_FILE = os.path.join(workdir, "override_state.json")
+    state_store.STATUS_FILE = os.path.join(workdir, "pi_status.json")
+    status_test.OUTPUT_PATH = state_store.STATUS_FILE
+    status_test.ID_FILE = os.path.join(workdir, "device_id.txt")
+    schedule_engine.CHANNELS_FILE = os.path.join(workdir, "lpi_channels.json")   # never created
+    with open(status_test.ID_FILE, "w") as f:
+        f.write(DEVICE_ID + "\n")
+
+
+def set_location(spec: str) -> None:
+    """--location "Name,Area/Zone,lat,lon": replay for another city / DST rule set."""
+    name, tz_name, lat, lon = [p.strip() for p in spec.split(",")]
+    pytz.timezone(tz_name)
+    timer.city = timer.City(name, "", tz_name, float(lat), float(lon))
+    status_test.city = timer.city
+
+
+# ---------------- Oracles (independent of the code under test) ----------------
+class Oracle:
+    """Brute-force expectations, from astral directly (no schedule table)."""
+
+    def __init__(self, tz):
+        self.tz = tz
+        self._sunsets = {}
+        self._offs = {}
+
+    def sunset(self, d: datetime.date) -> datetime.datetime:
+        if d not in self._sunsets:
+            self._sunsets[d], _ = schedule_table.compute_day(
+                timer.city, timer.LIGHT_OFF_HOUR, d, self.tz, timer.safe_localize)
+        return self._sunsets[d]
+
+    def lighton(self, d: datetime.date) -> datetime.datetime:
+        return self.sunset(d) - datetime.timedelta(hours=1)
+
+    def off(self, d: datetime.date) -> datetime.datetime:
+        if d not in self._offs:
+            naive = datetime.datetime.combine(d, datetime.time(timer.LIGHT_OFF_HOUR, 0))
+            self._offs[d] = timer.safe_localize(self.tz, naive)
+        return self._offs[d]
+
+    def decision(self, now_local: datetime.datetime) -> bool:
+        d = now_local.date()
+        # Light is on from lighton(d) until the off-time that follows it
+        for ref in (d - datetime.timedelta(days=1), d):
+            if self.lighton(ref) <= now_local < self.off(ref + datetime.timedelta(days=1)):
+                return True
+        return False
+
+    def _first_after(self, fn, set_at: datetime.datetime) -> datetime.datetime:
+        d = set_at.date()
+        return min(c for c in (fn(d + datetime.timedelta(days=k)) for k in (-1, 0, 1, 2)) if c > set_at)
+
+    def first_off_after(self, set_at):
+        return self._first_after(self.off, set_at)
+
+    def first_lighton_after(self, set_at):
+        return self._first_after(self.lighton, set_at)
+
+
+def minutes(start_utc: datetime.datetime, end_utc: datetime.datetime, step: int, tz):
+    t = start_utc
+    delta = datetime.timedelta(minutes=step)
+    while t < end_utc:
+        yield t.astimezone(tz)
+        t += delta
+
+
+def dst_transitions(tz, start_utc, end_utc):
+    """[(utc instant, offset before, offset after)] for tz's transitions in range."""
+    out = []
+    for naive in getattr(tz, "_utc_transition_times", []):
+        t = naive.replace(tzinfo=pytz.utc)
+        if start_utc <= t < end_utc:
+            before = (t - datetime.timedelta(seconds=1)).astimezone(tz).utcoffset()
+            after = t.astimezone(tz).utcoffset()
+            if before != after:
+                out.append((t, before, after))
+    return out
+
+
+def _iso(d) -> str:
+    return d.isoformat() if d is not None else None
+
+
+# ---------------- Phases ----------------
+def phase_decisions(stream, oracle, st, ck) -> dict:
+    r = relay.get_relay(timer.GPIO_PIN)
+    writes_by_day = collections.Counter()
+    n = 0
+    t0 = time.perf_counter()
+    for now in stream:
+        on = st.time("timer.decide", timer.decide, now)
+        ck.check("decision_matches_astral", on == oracle.decision(now),
+                 lambda: {"now": _iso(now), "decide": on})
+        initial = r.state is None
+        if st.time("relay.set", r.set, on) and not initial:
+            writes_by_day[now.date()] += 1
+        n += 1
+    wall = time.perf_counter() - t0
+    for d, w in sorted(writes_by_day.items()):
+        # One on, one off per calendar day at most (the off is after midnight);
+        # the first write, from an undriven line, isn't a transition
+        ck.check("relay_writes_per_day_le_2", w <= 2, {"date": d.isoformat(), "writes": w})
+    return {"items": n, "wall_s": wall, "per_sec": n / wall if wall else None,
+            "relay_writes": sum(writes_by_day.values())}
+
+
+def phase_localize(stream, tz, transitions, st, ck) -> dict:
+    n = 0
+    t0 = time.perf_counter()
+    for now in stream:
+        naive = now.replace(tzinfo=None)
+        got = st.time("timer.safe_localize", timer.safe_localize, tz, naive)
+        # An instant whose wall time occurs twice must map to the later occurrence
+        later = tz.localize(naive, is_dst=False)
+        ambiguous = later.utcoffset() != tz.localize(naive, is_dst=True).utcoffset()
+        if ambiguous:
+            ck.check("localize_ambiguous_picks_later", got == later and got.replace(tzinfo=None) == naive,
+                     lambda: {"wall": naive.isoformat(), "got": _iso(got)})
+        else:
+            ck.check("localize_roundtrip", got == now, lambda: {"now": _iso(now), "got": _iso(got)})
+        n += 1
+
+    minute = datetime.timedelta(minutes=1)
+    for t, before, after in transitions:
+        if after > before:
+            # Spring forward: wall times [t+before, t+after) do not exist
+            wall = (t + before).replace(tzinfo=None)
+            while wall < (t + after).replace(tzinfo=None):
+                got = st.time("timer.safe_localize.gap", timer.safe_localize, tz, wall)
+                want = wall + datetime.timedelta(hours=1)
+                ck.check("localize_nonexistent_plus_1h",
+                         got.replace(tzinfo=None) == want and tz.normalize(got) == got and got >= t,
+                         lambda: {"wall": wall.isoformat(), "got": _iso(got)})
+                wall += minute
+        else:
+            # Fall back: wall times [t+after, t+before) happen twice
+            wall = (t + after).replace(tzinfo=None)
+            while wall < (t + before).replace(tzinfo=None):
+                got = st.time("timer.safe_localize.overlap", timer.safe_localize, tz, wall)
+                ck.check("localize_overlap_picks_later",
+                         got.replace(tzinfo=None) == wall and got.utcoffset() == after,
+                         lambda: {"wall": wall.isoformat(), "got": _iso(got)})
+                wall += minute
+    wall_s = time.perf_counter() - t0
+    return {"items": n, "wall_s": wall_s, "per_sec": n / wall_s if wall_s else None,
+            "dst_transitions": len(transitions)}
+
+
+def phase_revert(stream, oracle, st, ck) -> dict:
+    n = 0
+    t0 = time.perf_counter()
+    for set_at in stream:
+        off = st.time("status_test.first_off_after", status_test.first_off_after, set_at)
+        ck.check("first_off_after", off == oracle.first_off_after(set_at),
+                 lambda: {"set_at": _iso(set_at), "got": _iso(off), "want": _iso(oracle.first_off_after(set_at))})
+        on = st.time("status_test.first_lighton_after", status_test.first_lighton_after, set_at)
+        ck.check("first_lighton_after", on == oracle.first_lighton_after(set_at),
+                 lambda: {"set_at": _iso(set_at), "got": _iso(on), "want": _iso(oracle.first_lighton_after(set_at))})
+        n += 1
+    wall = time.perf_counter() - t0
+    return {"items": n, "wall_s": wall, "per_sec": n / wall if wall else None}
+
+
+def _run_status(now):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return status_test.run_status(now)
+
+
+def phase_auto_revert(set_times, oracle, fake, st, ck) -> dict:
+    r = relay.get_relay(timer.GPIO_PIN)
+    n = 0
+    t0 = time.perf_counter()
+    for set_at in set_times:
+        for mode, cutoff in (("force_on", oracle.first_off_after(set_at)),
+                             ("force_off", oracle.first_lighton_after(set_at))):
+            state_store.set_override(mode, set_at.isoformat())
+            fake.patches.clear()
+            ctx = {"mode": mode, "set_at": _iso(set_at), "cutoff": _iso(cutoff)}
+
+            before = cutoff - datetime.timedelta(minutes=1)
+            if before >= set_at:
+                status = st.time("status_test.run_status", _run_status, before)
+                ck.check("override_held_before_cutoff",
+                         status.get("override_mode") == mode and r.state == (mode == "force_on") and not fake.patches,
+                         lambda: dict(ctx, override_mode=status.get("override_mode"), relay=r.state))
+
+            status = st.time("status_test.run_status", _run_status, cutoff)
+            reverted = [p for p in fake.patches
+                        if p["doc_id"] == DEVICE_ID and p["fields"].get("mode") == {"stringValue": "auto"}]
+            ck.check("override_reverted_at_cutoff",
+                     status.get("override_mode") == "auto"
+                     and state_store.get_override().get("mode") == "auto"
+                     and len(reverted) == 1
+                     and r.state == oracle.decision(cutoff)
+                     and status.get("timer_ok") is True,
+                     lambda: dict(ctx, override_mode=status.get("override_mode"), relay=r.state,
+                                  patches=len(reverted), error=status.get("error")))
+            n += 1
+    wall = time.perf_counter() - t0
+    return {"items": n, "wall_s": wall, "per_sec": n / wall if wall else None}
+
+
+# ---------------- Report ----------------
+def file_versions() -> dict:
+    out = {}
+    for rel in VERSIONED_FILES:
+        try:
+            with open(os.path.join(REPO_ROOT, rel), "r") as f:
+                m = re.search(r"^# Version:\s*(\S+)", f.read(), re.M)
+            out[rel] = m.group(1) if m else None
+        except OSError:
+            out[rel] = None
+    return out
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """[(stage, old p50 us, new p50 us, ratio, regressed)] for stages in both runs."""
+    rows = []
+    for stage, new in result["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old or not old.get("p50_us"):
+            continue
+        ratio = new["p50_us"] / old["p50_us"]
+        rows.append((stage, old["p50_us"], new["p50_us"], ratio, ratio > 1 + tolerance))
+    return rows
+
+
+def print_report(result: dict, regressions) -> None:
+    cfg = result["config"]
+    print(f"===== LPI BENCH: {cfg['location']} {cfg['start']} .. {cfg['end']} step {cfg['step_minutes']} min =====")
+    for name, p in result["phases"].items():
+        extra = ", ".join(f"{k}={v}" for k, v in p.items() if k not in ("items", "wall_s", "per_sec"))
+        print(f"{name:<12} {p['items']:>9} items  {p['wall_s']:8.2f} s  {p['per_sec'] or 0:10.0f}/s"
+              + (f"  ({extra})" if extra else ""))
+    print(f"Decisions/sec (timer.decide + oracle + relay): {result['decisions_per_sec']:.0f}")
+    print()
+    print(f"{'stage':<34} {'calls':>9} {'mean us':>9} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9} {'max us':>10}")
+    for stage, s in result["stages"].items():
+        print(f"{stage:<34} {s['calls']:>9} {s['mean_us']:9.1f} {s['p50_us']:9.1f} "
+              f"{s['p95_us']:9.1f} {s['p99_us']:9.1f} {s['max_us']:10.1f}")
+    print()
+    for name, c in result["checks"].items():
+        mark = "✅" if c["failures"] == 0 else "❌"
+        print(f"{mark} {name:<34} {c['checked']:>9} checked  {c['failures']} failed")
+        for ex in c["examples"]:
+            print("     ", json.dumps(ex))
+    if regressions:
+        print()
+        print(f"{'vs baseline':<34} {'old p50':>9} {'new p50':>9} {'ratio':>7}")
+        for stage, old, new, ratio, bad in regressions:
+            print(f"{stage:<34} {old:9.1f} {new:9.1f} {ratio:7.2f}" + ("  ❌ slower" if bad else ""))
+
+
+def main():
+    this_year = datetime.date.today().year
+    ap = argparse.ArgumentParser(description="LPI simulated-clock benchmark and regression run")
+    ap.add_argument("--start", default=f"{this_year}-01-01", help="first local date (YYYY-MM-DD)")
+    ap.add_argument("--years", type=float, default=2.0, help="length of the replay")
+    ap.add_argument("--step", type=int, default=1, help="minutes between simulated ticks")
+    ap.add_argument("--scenario-hours", type=float, default=11.0,
+                    help="hours between end-to-end auto-revert scenarios")
+    ap.add_argument("--location", help='"Name,Area/Zone,lat,lon" instead of timer.py\'s city')
+    ap.add_argument("--json", help="write the result JSON here ('-' for stdout)")
+    ap.add_argument("--baseline", help="earlier --json result to compare p50 latencies against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown vs baseline")
+    ap.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = ap.parse_args()
+
+    if args.location:
+        set_location(args.location)
+    tz = pytz.timezone(timer.city.timezone)
+    start_local = timer.safe_localize(tz, datetime.datetime.fromisoformat(args.start))
+    start_utc = start_local.astimezone(pytz.utc)
+    end_utc = start_utc + datetime.timedelta(days=365.25 * args.years)
+
+    workdir = tempfile.mkdtemp(prefix="lpi_bench_")
+    sandbox(workdir)
+    fake = FakeFirestore()
+    fake.install()
+
+    st, ck = Stages(), Checks()
+    oracle = Oracle(tz)
+    phases = {}
+    t0 = time.perf_counter()
+    try:
+        # Build the table up front so the first decide() isn't timing a build
+        schedule_table.build(schedule_table.SCHEDULE_PATH, timer.city, timer.LIGHT_OFF_HOUR, tz,
+                             timer.safe_localize, start_local.date() - datetime.timedelta(days=1))
+
+        phases["decisions"] = phase_decisions(minutes(start_utc, end_utc, args.step, tz), oracle, st, ck)
+        phases["localize"] = phase_localize(minutes(start_utc, end_utc, args.step, tz), tz,
+                                            dst_transitions(tz, start_utc, end_utc), st, ck)
+        phases["revert"] = phase_revert(minutes(start_utc, end_utc, args.step, tz), oracle, st, ck)
+        scenario_step = max(1, int(args.scenario_hours * 60))
+        phases["auto_revert"] = phase_auto_revert(
+            minutes(start_utc, end_utc - datetime.timedelta(days=2), scenario_step, tz), oracle, fake, st, ck)
+    finally:
+        if args.keep:
+            print("Scratch directory kept:", workdir)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    dec = phases["decisions"]
+    result = {
+        "tool": "lpi_bench",
+        "format": FORMAT,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "versions": file_versions(),
+        "config": {
+            "location": f"{timer.city.name} ({timer.city.timezone})",
+            "start": start_local.isoformat(),
+            "end": end_utc.astimezone(tz).isoformat(),
+            "step_minutes": args.step,
+            "scenario_hours": args.scenario_hours,
+            "light_off_hour": timer.LIGHT_OFF_HOUR,
+        },
+        "total_wall_s": time.perf_counter() - t0,
+        "decisions_per_sec": dec["per_sec"],
+        "phases": phases,
+        "stages": st.summary(),
+        "checks": ck.results,
+        "ok": ck.ok(),
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        result["baseline"] = {
+            "file": args.baseline,
+            "tolerance": args.tolerance,
+            "regressed": [r[0] for r in regressions if r[4]],
+        }
+
+    if args.json == "-":
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result, regressions)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(result, f, indent=2)
+            print("\nResult written to:", args.json)
+
+    if not result["ok"] or any(r[4] for r in regressions):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# LPI Fleet Load Test
+# Version: 1.0.0
+# Last updated: 2026-10-17
+#
+# Runs the real device code for thousands of simulated Pis against the local
+# Firestore stand-in (tools/firestore_standin.py) and reports throughput, tail
+# latency and what the backend saw.
+#
+#   python3 tools/lpi_fleet_load.py --devices 1000 --processes 32 --ticks 8
+#   python3 tools/lpi_fleet_load.py --devices 1000 --spread            # cron jitter
+#   python3 tools/lpi_fleet_load.py --devices 2000 --qps-limit 500 --latency-ms 80
+#   python3 tools/lpi_fleet_load.py --oauth --json out.json
+#
+# Every device runs one lpi_pipeline.py-style cycle per tick (15 s, on the wall
+# clock's :00/:15/:30/:45 like cron and lpi_daemon.py):
+#   command   command_apply.poll()            adaptive read of device_commands
+#   status    status_test.run_status()        relay (mock), auto-revert, outbox flush
+#   upload    firestore_upload_status.upload(only_if_changed=True)
+# By default all devices start their cycle on the tick, the way an unjittered fleet
+# does; --spread gives each device a fixed random offset inside the tick instead.
+# --commands-per-tick has the "dashboard" flip that many devices' mode each tick.
+#
+# Devices are split over --processes worker processes; each worker runs its devices
+# one after another, each with its own scratch directory (state DB, device id, token
+# cache, outbox lock, mock relay), so the backend sees up to --processes concurrent
+# clients. A worker shares one keep-alive session between its devices (a real Pi has
+# its own), so TCP/TLS set-up per device isn't part of the numbers.
+#
+# The stand-in is started on a free port unless --url points at a running one.
+# Latency/error/throttling options are passed through to it.
+#
+# Output: cycles/s, p50/p95/p99/max per phase (client side), late cycles, and the
+# backend's request counts per endpoint and status, average and peak QPS.
+
+import argparse
+import collections
+import contextlib
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PI_DIR = os.path.join(REPO_ROOT, "pi")
+MONITOR_DIR = os.path.join(PI_DIR, "pi_monitor_test")
+STANDIN = os.path.join(REPO_ROOT, "tools", "firestore_standin.py")
+
+TICK_SECONDS = 15
+PHASES = ("command", "status", "upload", "cycle")
+MODES = ("force_on", "auto", "force_off", "auto")
+
+
+# ---------------- Stand-in ----------------
+def control(url: str, path: str, method: str = "GET") -> dict:
+    req = urllib.request.Request(url.rsplit("/v1", 1)[0] + path, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(req, timeout=10) as r:
+        return json.load(r)
+
+
+def start_standin(args):
+    """(process, REST base url) of a stand-in on a free port."""
+    cmd = [sys.executable, "-u", STANDIN, "--port", "0",
+           "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+           "--error-rate", str(args.error_rate), "--error-status", str(args.error_status),
+           "--qps-limit", str(args.qps_limit)]
+    if args.oauth:
+        cmd.append("--require-auth")
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    if "http://" not in line:
+        proc.kill()
+        raise RuntimeError(f"stand-in failed to start: {line!r}")
+    return proc, "http://" + line.split("http://", 1)[1].split()[0]
+
+
+def write_service_account(path: str, token_uri: str) -> None:
+    """A throwaway key file whose token_uri is the stand-in (the stand-in doesn't verify the JWT)."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption()).decode("ascii")
+    with open(path, "w") as f:
+        json.dump({
+            "type": "service_account", "project_id": "lpi-monitor", "private_key_id": "standin",
+            "private_key": pem, "client_email": "load-test@lpi-monitor.iam.gserviceaccount.com",
+            "client_id": "0", "token_uri": token_uri,
+        }, f)
+
+
+# ---------------- Worker ----------------
+class Device:
+    """One simulated Pi: its scratch directory and the per-device process state."""
+
+    def __init__(self, index: int, workdir: str, tick_offset: float):
+        self.device_id = f"load-{index:05d}"
+        self.dir = os.path.join(workdir, self.device_id)
+        self.offset = tick_offset
+        self.relays = {}
+        self.last_delivered_at = 0.0
+        os.makedirs(self.dir, exist_ok=True)
+        with open(os.path.join(self.dir, "device_id.txt"), "w") as f:
+            f.write(self.device_id + "\n")
+
+    def activate(self, m) -> None:
+        """Point the device modules' on-device paths and globals at this device."""
+        path = lambda name: os.path.join(self.dir, name)  # noqa: E731
+        m.state_store.STATE_DB = path("lpi_state.db")
+        m.state_store.OVERRIDE_FILE = path("override_mode.txt")
+        m.state_store.STATE_FILE = path("override_state.json")
+        m.state_store.STATUS_FILE = path("pi_status.json")
+        m.status_test.OUTPUT_PATH = m.state_store.STATUS_FILE
+        m.firestore_upload_status.LOCAL_STATUS_PATH = m.state_store.STATUS_FILE
+        for mod in (m.command_apply, m.status_test, m.firestore_upload_status):
+            mod.ID_FILE = path("device_id.txt")
+        m.token_cache.TOKEN_CACHE_FILE = path("lpi_token_cache.json")
+        m.token_cache.LOCK_FILE = path("lpi_token_cache.json.lock")
+        m.token_cache._memo.clear()
+        m.outbox.LOCK_FILE = path("lpi_outbox.lock")
+        m.relay._relays = self.relays
+        m.firestore_upload_status._last_delivered_at = self.last_delivered_at
+
+    def deactivate(self, m) -> None:
+        self.last_delivered_at = m.firestore_upload_status._last_delivered_at
+
+
+def _import_device_modules(shared_dir: str):
+    sys.path.insert(0, MONITOR_DIR)
+    sys.path.insert(0, PI_DIR)
+    import types
+    import command_apply
+    import firestore_client
+    import firestore_upload_status
+    import outbox
+    import relay
+    import schedule_engine
+    import schedule_table
+    import state_store
+    import status_test
+    import token_cache
+
+    schedule_table.SCHEDULE_PATH = os.path.join(shared_dir, "lpi_schedule.bin")
+    schedule_engine.CHANNELS_FILE = os.path.join(shared_dir, "lpi_channels.json")   # never created
+    return types.SimpleNamespace(
+        command_apply=command_apply, firestore_client=firestore_client,
+        firestore_upload_status=firestore_upload_status, outbox=outbox, relay=relay,
+        schedule_table=schedule_table, state_store=state_store, status_test=status_test, token_cache=token_cache,
+    )
+
+
+def run_cycle(m, device: Device, samples: dict, errors: collections.Counter) -> None:
+    t_cycle = time.perf_counter()
+    device.activate(m)
+    try:
+        for phase, fn in (
+            ("command", lambda: m.command_apply.poll(device.device_id)),
+            ("status", lambda: m.status_test.run_status()),
+            ("upload", lambda: m.firestore_upload_status.upload(True, out=lambda *a: None)),
+        ):
+            t0 = time.perf_counter()
+            try:
+                r = fn()
+                if phase == "upload" and r["kind"] not in ("skipped",) and not r["delivered"]:
+                    errors["upload_not_delivered"] += 1
+            except Exception as e:
+                errors[f"{phase}: {type(e).__name__}"] += 1
+            samples[phase].append((time.perf_counter() - t0) * 1000)
+    finally:
+        device.deactivate(m)
+    samples["cycle"].append((time.perf_counter() - t_cycle) * 1000)
+
+
+def worker(index: int, device_indexes, config: dict, barrier, start_at, results) -> None:
+    """One process: set up its devices, then run config["ticks"] ticks from start_at."""
+    for k, v in config["env"].items():
+        os.environ[k] = v
+    m = _import_device_modules(config["workdir"])
+    if config.get("service_account"):
+        m.firestore_client.SERVICE_ACCOUNT_FILE = config["service_account"]
+    rng = random.Random(config["seed"] * 7919 + index)
+    devices = [
+        Device(i, config["workdir"], rng.uniform(0, TICK_SECONDS) if config["spread"] else 0.0)
+        for i in device_indexes
+    ]
+    devices.sort(key=lambda d: d.offset)
+    samples = collections.defaultdict(list)
+    errors = collections.Counter()
+    lag = []
+
+    barrier.wait()
+    t0 = start_at.value
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for tick in range(config["ticks"]):
+            base = t0 + tick * TICK_SECONDS
+            for device in devices:
+                due = base + device.offset
+                delay = due - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                lag.append(max(0.0, time.time() - due) * 1000)
+                run_cycle(m, device, samples, errors)
+    results.put({"worker": index, "samples": dict(samples), "errors": dict(errors), "lag": lag})
+
+
+# ---------------- Report ----------------
+def percentiles(values) -> dict:
+    s = sorted(values)
+    n = len(s)
+    if not n:
+        return {"n": 0}
+    pick = lambda q: round(s[min(n - 1, int(n * q))], 2)  # noqa: E731
+    return {"n": n, "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(s[-1], 2)}
+
+
+def print_report(result: dict) -> None:
+    cfg = result["config"]
+    print(f"Fleet load: {cfg['devices']} devices x {cfg['ticks']} ticks, {cfg['processes']} processes, "
+          f"{'spread' if cfg['spread'] else 'aligned'} starts, "
+          f"backend latency {cfg['latency_ms']}+{cfg['jitter_ms']} ms, errors {cfg['error_rate']:.1%}, "
+          f"qps limit {cfg['qps_limit'] or 'off'}{', oauth' if cfg['oauth'] else ''}")
+    print()
+    print(f"{'phase (ms)':<14} {'n':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for phase in PHASES + ("start_lag",):
+        p = result["latency_ms"][phase]
+        if p["n"]:
+            print(f"{phase:<14} {p['n']:>7} {p['p50']:>9.1f} {p['p95']:>9.1f} {p['p99']:>9.1f} {p['max']:>9.1f}")
+    print()
+    print(f"Throughput: {result['cycles_per_sec']:.1f} device cycles/s over {result['wall_s']:.1f} s")
+    print(f"Late cycles (> 1 s after their slot): {result['late_cycles']}")
+    b = result["backend"]
+    print(f"Backend: {b['requests']} requests, avg {b['avg_qps']} qps, peak {b['peak_qps']} qps (1 s buckets)")
+    for key, n in sorted(b["by_endpoint"].items()):
+        print(f"   {key:<24} {n:>8}")
+    print("   status:", ", ".join(f"{k} x{v}" for k, v in sorted(b["by_status"].items())))
+    if result["errors"]:
+        print("❌ Client errors:")
+        for key, n in sorted(result["errors"].items()):
+            print(f"   {key:<40} {n:>6}")
+    else:
+        print("✅ No client errors")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="LPI fleet load test against the local Firestore stand-in")
+    ap.add_argument("--devices", type=int, default=200)
+    ap.add_argument("--processes", type=int, default=min(32, (os.cpu_count() or 2) * 4))
+    ap.add_argument("--ticks", type=int, default=4, help="15 s ticks to run")
+    ap.add_argument("--spread", action="store_true", help="random per-device offset inside the tick")
+    ap.add_argument("--commands-per-tick", type=int, default=0, help="devices whose mode the dashboard flips per tick")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--error-status", type=int, default=503)
+    ap.add_argument("--qps-limit", type=float, default=0.0)
+    ap.add_argument("--oauth", action="store_true", help="service-account flow via the stand-in's /token")
+    ap.add_argument("--url", help="use a running stand-in (http://host:port/v1) instead of starting one")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", help="write the result JSON here")
+    ap.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="lpi_fleet_")
+    proc = None
+    try:
+        if args.url:
+            url = args.url.rstrip("/")
+        else:
+            proc, url = start_standin(args)
+        env = {"LPI_RELAY_BACKEND": "mock"}
+        config = {"workdir": workdir, "ticks": args.ticks, "spread": args.spread, "seed": args.seed, "env": env}
+        if args.oauth:
+            config["service_account"] = os.path.join(workdir, "lpi_monitor.json")
+            write_service_account(config["service_account"], url.rsplit("/v1", 1)[0] + "/token")
+            env["LPI_FIRESTORE_URL"] = url
+        else:
+            env["FIRESTORE_EMULATOR_HOST"] = url.split("://", 1)[1].split("/", 1)[0]
+
+        # One schedule table for everyone (a Pi builds its own at install time)
+        sys.path[:0] = [PI_DIR, MONITOR_DIR]
+        import schedule_table
+        import timer
+        tz = __import__("pytz").timezone(timer.city.timezone)
+        schedule_table.build(os.path.join(workdir, "lpi_schedule.bin"), timer.city, timer.LIGHT_OFF_HOUR, tz,
+                             timer.safe_localize, datetime.date.today() - datetime.timedelta(days=2))
+
+        processes = max(1, min(args.processes, args.devices))
+        start_at = multiprocessing.Value("d", 0.0)
+
+        def set_start():
+            # First cron-style slot at least 2 s out, same for every worker
+            now = time.time() + 2
+            start_at.value = math.ceil(now / TICK_SECONDS) * TICK_SECONDS
+
+        barrier = multiprocessing.Barrier(processes + 1, action=set_start)
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=worker, args=(
+                w, list(range(w, args.devices, processes)), config, barrier, start_at, results))
+            for w in range(processes)
+        ]
+        for w in workers:
+            w.start()
+        print(f"Setting up {args.devices} devices in {processes} processes ...", flush=True)
+        barrier.wait()
+        control(url, "/_reset", "POST")
+        print("First tick at", time.strftime("%H:%M:%S", time.localtime(start_at.value)), flush=True)
+
+        rng = random.Random(args.seed)
+        if args.commands_per_tick:
+            os.environ.update(env)
+            sys.path.insert(0, MONITOR_DIR)
+            import firestore_client
+            if args.oauth:
+                firestore_client.SERVICE_ACCOUNT_FILE = config["service_account"]
+            for tick in range(args.ticks):
+                time.sleep(max(0.0, start_at.value + tick * TICK_SECONDS + TICK_SECONDS / 2 - time.time()))
+                for i in rng.sample(range(args.devices), min(args.commands_per_tick, args.devices)):
+                    mode = MODES[(tick + i) % len(MODES)]
+                    firestore_client.patch_document("device_commands", f"load-{i:05d}", {
+                        "mode": {"stringValue": mode}, "updated_by": {"stringValue": "load_test"},
+                    }, update_mask=["mode", "updated_by"])
+
+        collected = [results.get() for _ in workers]
+        for w in workers:
+            w.join()
+        wall = time.time() - start_at.value
+        backend = control(url, "/_stats")
+    finally:
+        if proc is not None:
+            proc.kill()
+        if args.keep:
+            print("Scratch directory kept:", workdir)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    samples = collections.defaultdict(list)
+    errors = collections.Counter()
+    lag = []
+    for r in collected:
+        for phase, values in r["samples"].items():
+            samples[phase].extend(values)
+        errors.update(r["errors"])
+        lag.extend(r["lag"])
+    backend.pop("per_second", None)
+    result = {
+        "tool": "lpi_fleet_load",
+        "config": {
+            "devices": args.devices, "processes": processes, "ticks": args.ticks, "spread": args.spread,
+            "commands_per_tick": args.commands_per_tick, "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms, "error_rate": args.error_rate, "qps_limit": args.qps_limit,
+            "oauth": args.oauth,
+        },
+        "wall_s": round(wall, 2),
+        "cycles_per_sec": round(len(samples["cycle"]) / max(wall, 1e-9), 2),
+        "latency_ms": {phase: percentiles(samples[phase]) for phase in PHASES},
+        "late_cycles": sum(1 for v in lag if v > 1000),
+        "errors": dict(errors),
+        "backend": backend,
+    }
+    result["latency_ms"]["start_lag"] = percentiles(lag)
+
+    print()
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print("\nResult written to:", args.json)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())